@@ -1,257 +1,158 @@
-from flask import Flask, request, send_file, render_template_string
-import pyperclip
-from icalendar import Calendar, Event, vText
+from flask import Flask, Response, g, jsonify, request, render_template_string, url_for
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.wsgi import wrap_file
 import datetime
 import re
 import os
-from dateutil import parser
-import io
+import tempfile
+import time
+import unicodedata
+from itertools import chain
+from urllib.parse import quote
+
+from autocalendar import iter_parse_events, parse_events_from_text
+from autocalendar.bulk_parse import iter_event_chunks
+from autocalendar.event_cache import EventCache, make_key, normalize_event_text
+from autocalendar.event_index import DEFAULT_INDEX_PATH, NEW, UNCHANGED, SeenEventIndex, current_dtstamp, event_uid
+from autocalendar.event_store import DEFAULT_STORE_PATH, EventStore, feed_etag, is_valid_feed_id
+from autocalendar.file_import import ImportStats, detect_format, iter_import_calendar
+from autocalendar.ics import calendar_to_ical, iter_calendar_ical
+from autocalendar.clock import default_clock, parse_reference_time, reference_time
+from autocalendar import metrics
 
 app = Flask(__name__)
 
-def parse_event_from_text(text_content):
-    title = "新しいカレンダーイベント"
-    location = ""
-    duration = None # 新しくdurationを追加
-
-    now = datetime.datetime.now()
-    # デフォルトの開始日時を、現在の日付の午前9時に設定
-    # もし現在時刻が午前9時を過ぎていたら、翌日の午前9時にする
-    default_start_dt = now.replace(hour=9, minute=0, second=0, microsecond=0)
-    if now.hour >= 9:
-        default_start_dt += datetime.timedelta(days=1)
-    
-    start_dt = default_start_dt # 初期値を設定
-
-    # --- 1. 日付の解析 ---
-    # まずはYYYY/MM/DD, MM/DD, YYYY年MM月DD日 などの日付パターンを抽出
-    date_patterns = [
-        r'(\d{4}[/\-年]\d{1,2}[/\-月]\d{1,2}日?)', # YYYY/MM/DD or YYYY-MM-DD
-        r'(\d{1,2}[/\-月]\d{1,2}日?)',          # MM/DD or MM-DD
-        r'(\d{1,2}月\d{1,2}日)',                # MM月DD日
-    ]
-    
-    found_date_in_text = False
-    for pattern in date_patterns:
-        date_match = re.search(pattern, text_content)
-        if date_match:
-            date_str = date_match.group(1)
-            try:
-                # MM/DD 形式の場合は dayfirst=False を優先
-                if re.match(r'\d{1,2}[/\-月]\d{1,2}日?', date_str):
-                    parsed_dt = parser.parse(date_str, dayfirst=False, fuzzy=True)
-                else:
-                    parsed_dt = parser.parse(date_str, fuzzy=True) # その他の形式はデフォルトで
-                
-                # 解析された日付でstart_dtの日付部分を更新
-                start_dt = start_dt.replace(year=parsed_dt.year, 
-                                            month=parsed_dt.month, 
-                                            day=parsed_dt.day)
-                found_date_in_text = True
-                break # 最初に見つかった日付を採用
-            except parser.ParserError:
-                continue # 解析失敗したら次のパターンを試す
-    
-    # 相対日付の処理 (もし上記で日付が見つからなければ)
-    if not found_date_in_text:
-        if "明日" in text_content:
-            start_dt = now + datetime.timedelta(days=1)
-            start_dt = start_dt.replace(hour=default_start_dt.hour, minute=default_start_dt.minute, second=0, microsecond=0)
-            found_date_in_text = True
-        elif "明後日" in text_content:
-            start_dt = now + datetime.timedelta(days=2)
-            start_dt = start_dt.replace(hour=default_start_dt.hour, minute=default_start_dt.minute, second=0, microsecond=0)
-            found_date_in_text = True
-        elif "今日" in text_content:
-            start_dt = now.replace(hour=default_start_dt.hour, minute=default_start_dt.minute, second=0, microsecond=0)
-            found_date_in_text = True
-        # "昨日" や "一昨日" はカレンダー作成では通常使わないため、ここでは含めません。
-
-    # --- 2. 時刻の解析 ---
-    time_match = re.search(r'(\d{1,2}:\d{2}(?:[APap][Mm])?|\d{1,2}時\d{2}分?|\d{1,2}時)', text_content)
-    if time_match:
-        try:
-            time_str = time_match.group(1).replace('時', ':').replace('分', '')
-            if 'am' in time_str.lower() or 'pm' in time_str.lower():
-                parsed_time = datetime.datetime.strptime(time_str, '%I:%M%p').time()
-            elif ':' in time_str:
-                parsed_time = datetime.datetime.strptime(time_str, '%H:%M').time()
-            else: # 例: "10時" の場合
-                parsed_time = datetime.datetime.strptime(time_str + ':00', '%H:%M').time()
-
-            # 時刻が見つかった場合は、解析された時刻でstart_dtの時刻部分を更新
-            start_dt = start_dt.replace(hour=parsed_time.hour, minute=parsed_time.minute, second=0, microsecond=0)
-
-            # もし解析された日時が現在時刻より過去で、かつ日付が今日の場合、翌日にする
-            # (これは元のロジックを維持。テキストに例えば「9時」とだけあり、現在が10時の場合、翌日の9時にする)
-            if start_dt < datetime.datetime.now() and start_dt.date() == datetime.datetime.now().date():
-                start_dt += datetime.timedelta(days=1)
-
-        except ValueError:
-            pass # 解析失敗時は設定済みのstart_dt (デフォルトまたは日付解析結果) を使用
-
-    # --- 3. 期間の解析 (duration) ---
-    end_dt = None
-    # 例: "7/1~7/2 10:00~12:00" のような形式を解析
-    # 日付範囲と時刻範囲の抽出
-    # 複数のパターンを試す
-    datetime_range_patterns = [
-        r'(\d{1,2}[/\-月]\d{1,2}日?)~?(\d{1,2}[/\-月]\d{1,2}日?)?\s*(\d{1,2}:\d{2})~?(\d{1,2}:\d{2})?', # 7/1~7/2 10:00~12:00
-        r'(\d{1,2}:\d{2})~?(\d{1,2}:\d{2})?', # 10:00~12:00 (同日内)
-        r'(\d{1,2}[/\-月]\d{1,2}日?)~?(\d{1,2}[/\-月]\d{1,2}日?)', # 7/1~7/2 (終日イベント)
-    ]
+# event_text の最大文字数。これを超える貼り付けは解析を始める前に 413 で拒否する
+app.config['MAX_EVENT_TEXT_LENGTH'] = int(os.environ.get('AUTOCAL_MAX_EVENT_TEXT_LENGTH', 200_000))
+# フォームはパーセントエンコードされるので、1文字あたり最大12バイト + その他のフィールド分を見込む
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_EVENT_TEXT_LENGTH'] * 12 + 64 * 1024
+app.config['MAX_FORM_MEMORY_SIZE'] = app.config['MAX_CONTENT_LENGTH']
+# /import でアップロードできるファイルの合計バイト数 (ファイルはディスクに一時保存され、ストリームで読む)
+app.config['MAX_IMPORT_BYTES'] = int(os.environ.get('AUTOCAL_MAX_IMPORT_BYTES', 64 * 1024 * 1024))
+# 1リクエストの処理時間の上限 (秒)。gunicorn の gthread ワーカーの timeout は処理中のリクエストを止めないので、
+# バッチと /import はこの時間を超えたら解析を打ち切る (gunicorn.conf.py は timeout より少し短くする)
+app.config['REQUEST_DEADLINE'] = float(os.environ.get('AUTOCAL_REQUEST_DEADLINE', 25))
+# 解析の基準時刻を取得する時計 (テストやベンチマークでは FixedClock に差し替えられる)
+app.config['CLOCK'] = default_clock
+
+# 同じテキストの再解析・再生成を避けるためのキャッシュ (AUTOCAL_CACHE_* で調整)
+event_cache = EventCache()
+# 出力済みのイベントの索引。再送信で重複させず、変更だけを更新にする (AUTOCAL_INDEX_PATH でファイルに保存)
+event_index = SeenEventIndex(DEFAULT_INDEX_PATH)
+# 生成したイベントを保存して購読フィードにする (AUTOCAL_STORE_PATH を指定したときだけ)
+event_store = EventStore(DEFAULT_STORE_PATH) if DEFAULT_STORE_PATH else None
+
+_FILENAME_UNSAFE_RE = re.compile(r'[\s/\\]')
+
+
+def _request_reference_time():
+    """
+    リクエストの tz (タイムゾーン) と now (ISO 8601 の基準時刻) から解析の基準時刻を決めます。
+    now がなければ app.config['CLOCK'] の現在時刻を使います。不正な値の場合は ValueError。
+    """
+    now = request.values.get('now')
+    reference = parse_reference_time(now) if now else None
+    return reference_time(reference, request.values.get('tz') or None, app.config['CLOCK'])
+
+
+def _step(step, started):
+    """前の区切りからの経過時間を /generate_ical のステップの所要時間として記録し、現在の時刻を返します。"""
+    now = time.perf_counter()
+    metrics.observe_step(now - started, request.endpoint, step)
+    return now
+
+
+def _too_large(event_text):
+    return len(event_text) > app.config['MAX_EVENT_TEXT_LENGTH']
+
+
+def _ical_response(body, file_name):
+    """
+    bytes またはbytes を返すイテレーターを .ics の添付ファイルとして返します。
+    イテレーターの場合は Content-Length を付けず、チャンク転送でストリーミングします。
+    """
+    response = Response(body, mimetype='text/calendar')
+    try:
+        file_name.encode('ascii')
+        names = {'filename': file_name}
+    except UnicodeEncodeError: # 日本語のファイル名は RFC 5987 形式でも送る
+        simple = unicodedata.normalize('NFKD', file_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(file_name, safe='!#$&+-.^_`|~')}"}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+    return response
+
+
+def _deadline():
+    """このリクエストの処理を打ち切る時刻 (time.monotonic() の値)。"""
+    return time.monotonic() + app.config['REQUEST_DEADLINE']
+
+
+def _until_deadline(items, deadline, endpoint):
+    """deadline を過ぎたら TimeoutError にするジェネレーター。ストリーミング中に打ち切った場合はログに残します。"""
+    for item in items:
+        if time.monotonic() > deadline:
+            app.logger.warning("%s: 処理時間の上限 (%.0f 秒) を超えたので打ち切りました", endpoint, app.config['REQUEST_DEADLINE'])
+            metrics.count_error(endpoint, TimeoutError())
+            raise TimeoutError("処理時間の上限を超えました")
+        yield item
+
+
+def _user_key(feed_id=None):
+    """UID のユーザーキー。フォームの user_key、なければフィード ID、どちらもなければ None (AUTOCAL_UID_KEY)。"""
+    return request.values.get('user_key') or feed_id or None
+
+
+def _changes_only(user_key):
+    """
+    changes_only=1 が指定されたか。前回の内容はクライアントごとに比べるので user_key (またはフィード) が必要で、
+    ない場合は ValueError にします (他のクライアントが送った内容で 204 にならないように)。
+    """
+    if request.values.get('changes_only') not in ('1', 'true', 'on'):
+        return False
+    if user_key is None:
+        raise ValueError("changes_only には user_key が必要です")
+    return True
+
+
+def _iter_observe(parsed_events, user_key):
+    """
+    event_index で UID・SEQUENCE・DTSTAMP を付け、(状態, ParsedEvent) を返します。
+    user_key もフィードもない匿名のリクエストは索引を共有しないように、索引を使わずすべて NEW にします。
+    """
+    if user_key is None:
+        dtstamp = current_dtstamp()
+        return (
+            (NEW, parsed_event._replace(uid=parsed_event.uid or event_uid(parsed_event), dtstamp=parsed_event.dtstamp or dtstamp))
+            for parsed_event in parsed_events
+        )
+    return event_index.iter_observe(parsed_events, user_key)
+
+
+def _ical_file_name(title):
+    return f"{_FILENAME_UNSAFE_RE.sub('_', title)}.ics" # 改行などはヘッダーに含められない
+
+
+def _feed_urls(feed_id):
+    url = url_for('feed', feed_id=feed_id, _external=True)
+    return {'feed': feed_id, 'url': url, 'webcal': 'webcal://' + url.split('://', 1)[1]}
 
-    for pattern in datetime_range_patterns:
-        datetime_range_match = re.search(pattern, text_content)
-        if datetime_range_match:
-            try:
-                # グループの取得と整形
-                g = datetime_range_match.groups()
-                
-                # 開始日時を再確認 (既にstart_dtで解析済みだが、期間解析でより正確な情報が得られる場合があるため)
-                # グループの数でどのパターンにマッチしたか判断
-                if len(g) >= 4 and g[0] and g[2]: # 7/1~7/2 10:00~12:00 のようなパターン
-                    start_date_str = g[0]
-                    start_time_str = g[2]
-                    parsed_start_dt_from_range = parser.parse(start_date_str + " " + start_time_str, dayfirst=False, fuzzy=True)
-                    start_dt = start_dt.replace(year=parsed_start_dt_from_range.year,
-                                                month=parsed_start_dt_from_range.month,
-                                                day=parsed_start_dt_from_range.day,
-                                                hour=parsed_start_dt_from_range.hour,
-                                                minute=parsed_start_dt_from_range.minute,
-                                                second=0, microsecond=0)
-                elif len(g) >= 2 and g[0] and not g[1]: # 10:00~12:00 のような時刻のみのパターン
-                    start_time_str = g[0]
-                    parsed_start_time = datetime.datetime.strptime(start_time_str, '%H:%M').time()
-                    start_dt = start_dt.replace(hour=parsed_start_time.hour, minute=parsed_start_time.minute, second=0, microsecond=0)
-                    # 時刻が過去なら翌日にするロジックは、上記時刻解析部分で既に考慮済み
-
-                # 終了日時の解析
-                if len(g) >= 4 and g[1] and g[3]: # 7/1~7/2 10:00~12:00 のようなパターン
-                    end_date_str = g[1]
-                    end_time_str = g[3]
-                    parsed_end_dt = parser.parse(end_date_str + " " + end_time_str, dayfirst=False, fuzzy=True)
-                    # もし終了日が開始日より前なら、終了日を翌年に調整など
-                    if parsed_end_dt < start_dt:
-                        parsed_end_dt = parsed_end_dt.replace(year=start_dt.year + 1) # 簡単な調整
-                    end_dt = parsed_end_dt
-                elif len(g) >= 2 and g[1] and not g[0]: # 10:00~12:00 のような時刻のみのパターン
-                    end_time_str = g[1]
-                    parsed_end_time = datetime.datetime.strptime(end_time_str, '%H:%M').time()
-                    end_dt = start_dt.replace(hour=parsed_end_time.hour, minute=parsed_end_time.minute, second=0, microsecond=0)
-                    if end_dt < start_dt: # 例: 10:00~09:00 の場合
-                        end_dt += datetime.timedelta(days=1)
-                elif len(g) >= 2 and g[1] and not g[2]: # 7/1~7/2 のような日付のみのパターン (終日イベント)
-                    end_date_str = g[1]
-                    parsed_end_dt = parser.parse(end_date_str, dayfirst=False, fuzzy=True)
-                    end_dt = parsed_end_dt.replace(hour=23, minute=59, second=59) # 終日の場合、終了日の終わりに設定
-                    if end_dt < start_dt:
-                        end_dt = end_dt.replace(year=start_dt.year + 1)
-
-                if end_dt:
-                    time_delta = end_dt - start_dt
-                    total_seconds = int(time_delta.total_seconds())
-                    
-                    # durationは最低1分を設定
-                    if total_seconds <= 0:
-                        duration = "1m"
-                    else:
-                        days = total_seconds // (24 * 3600)
-                        hours = (total_seconds % (24 * 3600)) // 3600
-                        minutes = (total_seconds % 3600) // 60
-                        seconds = total_seconds % 60
-                        
-                        duration_parts = []
-                        if days > 0: duration_parts.append(f"{days}d")
-                        if hours > 0: duration_parts.append(f"{hours}h")
-                        if minutes > 0: duration_parts.append(f"{minutes}m")
-                        if seconds > 0: duration_parts.append(f"{seconds}s")
-                        
-                        duration = "".join(duration_parts)
-                
-                break # 期間解析に成功したらループを抜ける
-
-            except Exception as e:
-                # print(f"Duration parsing error: {e}") # デバッグ用
-                duration = None # 解析失敗時は期間なし
-                continue # 次のパターンを試す
-
-# 4. タイトルの解析 (最も重要な情報)
-    # 日時や期間情報を削除してからタイトルを抽出
-    cleaned_text_for_title = text_content
-
-    # 最も長い/複雑な日時パターンから順に削除を試みる
-    # datetime_range_patterns を優先的に削除
-    for pattern in datetime_range_patterns:
-        cleaned_text_for_title = re.sub(pattern, '', cleaned_text_for_title).strip()
-    
-    # その後、通常の date_patterns と time_match のパターンを削除
-    for pattern in date_patterns:
-        cleaned_text_for_title = re.sub(pattern, '', cleaned_text_for_title).strip()
-
-    # 時刻パターンも別途削除 (time_match の正規表現)
-    time_only_pattern = r'(\d{1,2}:\d{2}(?:[APap][Mm])?|\d{1,2}時\d{2}分?|\d{1,2}時)'
-    cleaned_text_for_title = re.sub(time_only_pattern, '', cleaned_text_for_title).strip()
-
-    # 句読点や不要な記号を削除（オプション、よりタイトルをきれいにしたい場合）
-    cleaned_text_for_title = re.sub(r'[~、,]', '', cleaned_text_for_title).strip()
-
-
-    title_keywords = ["会議", "打ち合わせ", "ミーティング", "予約", "イベント", "リマインダー", "予定", "休み"] # 「休み」も追加
-    found_title_from_keyword = False
-    for keyword in title_keywords:
-        if keyword in cleaned_text_for_title:
-            # キーワードより前の部分をタイトルにする（ただし、既にクリーンアップされているはずなので、キーワードを含む部分を直接利用）
-            title_candidate = cleaned_text_for_title
-            
-            # キーワードが複数回含まれる場合もあるが、最初のキーワードに注目
-            parts = title_candidate.split(keyword, 1)
-            if parts[0].strip():
-                # キーワードより前のテキストがあれば、それをタイトルにし、キーワードは含まない
-                title = parts[0].strip()
-            else:
-                # キーワードが先頭にあるか、キーワードのみの場合
-                title = keyword # キーワード自体をタイトルにする
-            
-            # もしキーワードが「夏休み」のように複合語の一部なら、その複合語全体を拾うロジックも必要
-            # 一旦、シンプルにキーワードが見つかったら、残りのテキストからキーワードを削除したものをタイトルとする
-            final_title = cleaned_text_for_title.replace(keyword, '').strip()
-            if final_title:
-                title = final_title
-            else:
-                title = keyword # 日時情報以外に何も残らなかったらキーワード自体をタイトルに
-
-            # ただし、「夏休み」のような場合は「夏休み」自体がタイトル
-            # ここはもっとスマートにする必要がある
-            # シンプルに「夏休み」のようなキーワードが見つかったらそれをタイトルにする
-            if keyword in ["夏休み", "冬休み", "春休み", "連休"]: # 例外的にキーワード自体がタイトルになるケース
-                title = keyword
-            elif final_title:
-                title = final_title
-            else:
-                title = text_content.replace('\n', ' ').strip()[:100] # 最悪元のテキストから
-
-            found_title_from_keyword = True
-            break
-    
-    if not found_title_from_keyword:
-        # 日時情報などを取り除いた残りのテキストをタイトルにする
-        # cleaned_text_for_title は既に日時情報をかなり取り除いているはず
-        cleaned_text = cleaned_text_for_title.replace('\n', ' ').strip()
-        if cleaned_text:
-            title = cleaned_text[:100] + '...' if len(cleaned_text) > 100 else cleaned_text
-        else:
-            title = "クリップボードからのイベント" # 何も残らなかった場合
 
-    # 5. 説明 (残りのテキスト全て、または特定の情報)
-    description = text_content # 全体を説明とする
+#リクエスト全体の所要時間の記録と、サンプリングプロファイル (AUTOCAL_PROFILE_RATE)
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.profiler = metrics.start_profile()
 
-    # 6. 場所の解析 (例: "場所：〇〇", "@〇〇" など)
-    location_match = re.search(r'(場所|@|にて)[:：]?\s*(.+?)(?=\n|$)', text_content)
-    if location_match:
-        location = location_match.group(2).strip()
+@app.after_request
+def _finish_request_metrics(response):
+    # 一致するルートがない URL (404) では request.endpoint が None になる
+    endpoint = request.endpoint or 'unknown'
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe_request(time.perf_counter() - started, endpoint, response.status_code)
+    metrics.finish_profile(g.pop('profiler', None), endpoint)
+    return response
 
-    return title, start_dt, duration, description, location
 #webアプリのルートを定義
 
 #メインページ（入力フォーム)
@@ -279,80 +180,294 @@ def index():
             <p>ここにカレンダーに登録したいテキストをペーストしてください。</p>
             <form action="/generate_ical" method="post">
                 <textarea name="event_text" id="event_text" placeholder="例: 来週月曜日10:30からオンラインミーティング、議題は新プロジェクトについて。" autofocus></textarea><br>
+                <input type="hidden" name="tz" id="tz">
+                {% if store_enabled %}
+                <input type="hidden" name="feed" id="feed" disabled>
+                <label><input type="checkbox" id="save_to_feed"> 購読用カレンダーにも保存する</label><br>
+                <p id="feed_link" hidden><small>購読URL: <a id="feed_url" href="#"></a></small></p>
+                {% endif %}
                 <button type="submit">カレンダーイベントを作成</button>
             </form>
+            <script>
+                // ブラウザのタイムゾーンで日時を解釈する
+                try { document.getElementById('tz').value = Intl.DateTimeFormat().resolvedOptions().timeZone || ''; } catch (e) {}
+                {% if store_enabled %}
+                // 購読フィードの ID はこのブラウザに保存し、初めて保存するときにサーバーで作る
+                (function () {
+                    var form = document.querySelector('form'), feed = document.getElementById('feed'), check = document.getElementById('save_to_feed');
+                    function show(info) {
+                        var link = document.getElementById('feed_url');
+                        link.href = info.webcal; link.textContent = info.webcal;
+                        document.getElementById('feed_link').hidden = false;
+                    }
+                    var saved = JSON.parse(localStorage.getItem('autocal_feed') || 'null');
+                    if (saved) { feed.value = saved.feed; check.checked = true; show(saved); }
+                    form.addEventListener('submit', function (event) {
+                        feed.disabled = !check.checked;
+                        if (!check.checked || feed.value) return;
+                        event.preventDefault();
+                        fetch('/feeds', {method: 'POST'}).then(function (r) { return r.json(); }).then(function (info) {
+                            localStorage.setItem('autocal_feed', JSON.stringify(info));
+                            feed.value = info.feed; feed.disabled = false; show(info);
+                            form.submit();
+                        });
+                    });
+                })();
+                {% endif %}
+            </script>
             <p><small>（生成されたファイルをタップしてカレンダーにインポートしてください。）</small></p>
         </body>
         </html>                                                  
-         """)
+         """, store_enabled=event_store is not None)
 
 #iCalファイルを生成してダウンロードさせるエンドポイント
 @app.route('/generate_ical',methods=['POST'])
 def generate_ical():
-    event_text=request.form['event_text']
+    started = time.perf_counter()
+    event_text=normalize_event_text(request.form['event_text'])
+    metrics.observe_input(len(event_text), request.endpoint)
 
     if not event_text:
         return "テキストが入力されてません",400
+    if _too_large(event_text):
+        return "テキストが長すぎます",413
     
+    # タイムゾーン (tz=Asia/Tokyo など。省略時は AUTOCAL_TIMEZONE) と基準時刻 (now=...)
     try:
-        # duration を受け取る変数を追加
-        title, start_dt, duration_str, description, location = parse_event_from_text(event_text)
-
-        cal= Calendar()
-        cal.add('prodid', '-// My Python Calender Helper Web//example.com//')
-        cal.add('version','2.0')
-
-        event=Event()
-        event.add('summary', vText(title))
-        event.add('dtstart', start_dt)
-        event.add('description', vText(description))
-        if location:
-            event.add('location', vText(location))
-        event.add('priority', 5)
-
-        # duration_str があれば dtend を計算して追加
-        if duration_str:
-            total_seconds = 0
-            days_match = re.search(r'(\d+)d', duration_str)
-            if days_match:
-                total_seconds += int(days_match.group(1)) * 24 * 3600
-            hours_match = re.search(r'(\d+)h', duration_str)
-            if hours_match:
-                total_seconds += int(hours_match.group(1)) * 3600
-            minutes_match = re.search(r'(\d+)m', duration_str)
-            if minutes_match:
-                total_seconds += int(minutes_match.group(1)) * 60
-            seconds_match = re.search(r'(\d+)s', duration_str)
-            if seconds_match:
-                total_seconds += int(seconds_match.group(1))
-
-            if total_seconds > 0:
-                event.add('dtend', start_dt + datetime.timedelta(seconds=total_seconds))
-            else: # duration_str があったが解析結果が0秒の場合、デフォルト1時間
-                event.add('dtend', start_dt + datetime.timedelta(hours=1))
-        else: # duration_str がそもそもない場合、デフォルト1時間
-            event.add('dtend', start_dt + datetime.timedelta(hours=1))
-
-
-        cal.add_component(event)
-
-        # iCalデータをメモリ上で生成し、ファイルとして提供
-        ical_data = cal.to_ical()
-        file_name = f"{title.replace(' ', '_').replace('/', '_')}.ics"
-        
-        # io.BytesIO を使ってメモリからファイルを送信
-        return send_file(
-            io.BytesIO(ical_data),
-            mimetype='text/calendar',
-            as_attachment=True,
-            download_name=file_name
-        )
+        reference_now = _request_reference_time()
+    except ValueError as e:
+        metrics.count_error(request.endpoint, e)
+        return str(e),400
+    zone = reference_now.tzinfo
+    started = _step('prepare', started)
+
+    # UID のユーザーキー (省略時はフィード ID、それもなければ AUTOCAL_UID_KEY)
+    feed_id = request.form.get('feed')
+    if feed_id and event_store is not None and not is_valid_feed_id(feed_id):
+        return "フィードIDが不正です",400
+    user_key = _user_key(feed_id)
+    try:
+        changes_only = _changes_only(user_key)
+    except ValueError as e:
+        return str(e),400
+    try:
+        # 正規化したテキスト・基準時刻・タイムゾーンが同じなら解析結果と iCal を再利用する
+        # (「9時」が今日か明日かは現在時刻で決まるので、基準時刻は分単位にそろえて解析にもキーにも使う。
+        #  現在時刻から解析した結果はその分が終わるまで有効)
+        explicit_reference = bool(request.values.get('now'))
+        if not explicit_reference:
+            reference_now = reference_now.replace(second=0, microsecond=0)
+        valid_until = None if explicit_reference else reference_now + datetime.timedelta(minutes=1)
+        cache_now = app.config['CLOCK'].now(zone).timestamp()
+        cache_key = make_key(event_text, reference_now, str(zone), user_key or '')
+        cached = event_cache.get(cache_key, cache_now)
+        started = _step('cache_lookup', started)
+        if cached:
+            parsed_events, ical_data = cached
+        else:
+            # 一つのテキストに複数の予定があれば、それぞれを VEVENT にした一つのカレンダーにする
+            parsed_events = parse_events_from_text(event_text, tz=str(zone), reference=reference_now)
+            ical_data = None
+            started = _step('parse', started)
+
+        # 安定した UID を付け、前回と同じ内容なら同じ SEQUENCE・DTSTAMP、変わっていれば SEQUENCE を上げる
+        observed = list(_iter_observe(parsed_events, user_key))
+        changed_events = [parsed_event for status, parsed_event in observed if status != UNCHANGED]
+        identified_events = [parsed_event for _, parsed_event in observed]
+        started = _step('index', started)
+
+        # 購読フィードが指定されていれば保存する (内容が変わったときだけフィードが更新される)
+        if event_store is not None and feed_id:
+            event_store.add_events(feed_id, identified_events)
+            started = _step('feed_store', started)
+
+        # changes_only=1 なら前回から変わったイベントだけを返す (すべて変わっていなければ 204)
+        if changes_only:
+            if not changed_events:
+                return Response(status=204)
+            return _ical_response(calendar_to_ical(changed_events), _ical_file_name(changed_events[0].title))
+
+        # キャッシュ済みの iCal は SEQUENCE などが索引と同じ場合だけそのまま使う
+        if ical_data is None or identified_events != parsed_events:
+            ical_data = calendar_to_ical(identified_events)
+            started = _step('serialize', started)
+            event_cache.set(cache_key, (identified_events, ical_data), valid_until, cache_now)
+            started = _step('cache_store', started)
+
+        # 生成済みの bytes をコピーせずにそのまま送信
+        return _ical_response(ical_data, _ical_file_name(identified_events[0].title))
     except Exception as e:
+        metrics.count_error(request.endpoint, e)
         return f"エラーが発生しました: {e}", 500
+
+#キャッシュのヒット・ミス件数を返すエンドポイント
+@app.route('/cache_stats',methods=['GET'])
+def cache_stats():
+    return jsonify(event_cache.stats())
+
+#Prometheus 形式のメトリクス (解析ステージ・ステップごとの所要時間、入力サイズ、キャッシュ、索引、エラー件数)
+@app.route('/metrics',methods=['GET'])
+def metrics_endpoint():
+    cache = event_cache.stats()
+    gauges = [
+        ('autocal_cache_hits', "解析キャッシュのヒット件数", cache['hits']),
+        ('autocal_cache_misses', "解析キャッシュのミス件数", cache['misses']),
+        ('autocal_cache_hit_rate', "解析キャッシュのヒット率", cache['hit_rate']),
+        ('autocal_cache_entries', "解析キャッシュの件数", cache['entries']),
+    ]
+    index = event_index.stats()
+    gauges += [
+        ('autocal_index_new', "索引で新規だったイベントの件数", index['new']),
+        ('autocal_index_updated', "索引で内容が変わっていた (SEQUENCE を上げた) イベントの件数", index['updated']),
+        ('autocal_index_unchanged', "索引で前回と同じだったイベントの件数", index['unchanged']),
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
     
+#購読フィードを新しく作るエンドポイント
+@app.route('/feeds',methods=['POST'])
+def create_feed():
+    if event_store is None:
+        return "購読フィードは有効になっていません",404
+    return jsonify(_feed_urls(event_store.create_feed())), 201
+
+#カレンダーアプリが購読 (ポーリング) するフィード
+@app.route('/feeds/<feed_id>.ics',methods=['GET'])
+def feed(feed_id):
+    if event_store is None or not is_valid_feed_id(feed_id):
+        return "フィードが見つかりません",404
+    state = event_store.feed_state(feed_id)
+    if state is None:
+        return "フィードが見つかりません",404
+
+    # 変更がなければ本文を組み立てずに 304 を返す (ポーリングのほとんどはこれで終わる)
+    etag = feed_etag(feed_id, state)
+    last_modified = datetime.datetime.fromtimestamp(state.modified, datetime.timezone.utc)
+    headers = {'ETag': etag, 'Last-Modified': http_date(last_modified), 'Cache-Control': 'no-cache'}
+    if not is_resource_modified(request.environ, etag=etag.strip('"'), last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    snapshot = event_store.snapshot(feed_id, state)
+    return Response(snapshot.body, mimetype='text/calendar', headers=headers)
+
+#複数イベントをまとめて1つの.icsにするバッチエンドポイント
+@app.route('/generate_ical_batch',methods=['POST'])
+def generate_ical_batch():
+    # JSON配列 (["7/1 10:00 会議", ...]) またはフォームの event_text を受け付ける
+    if request.is_json:
+        event_text = request.get_data(as_text=True)
+        split = 'json'
+    else:
+        event_text = request.form.get('event_text', '')
+        split = request.form.get('split', 'auto')
+    try:
+        reference_now = _request_reference_time()
+    except ValueError as e:
+        return str(e),400
+
+    if not event_text or not event_text.strip():
+        return "テキストが入力されてません",400
+    if _too_large(event_text):
+        return "テキストが長すぎます",413
+    metrics.observe_input(len(event_text), request.endpoint)
+
+    # 分割・解析・シリアライズはすべて遅延させ、VEVENT を1件ずつチャンク転送で送る。
+    # カレンダー全体をメモリに持たないので、出力の大きさに関係なくメモリ使用量は一定。
+    # 各イベントには安定した UID を付け、changes_only=1 なら前回から変わったイベントだけを返す
+    # 処理時間の上限を過ぎたら次のイベントを読まずに打ち切る (送信中ならチャンク転送が途中で終わる)
+    user_key = _user_key()
+    try:
+        changes_only = _changes_only(user_key)
+    except ValueError as e:
+        return str(e),400
+    try:
+        # iter_event_chunks は呼んだ時点で split と JSON を検証するので、try の中で作る
+        chunks = _until_deadline(iter_event_chunks(normalize_event_text(event_text), split), _deadline(), request.endpoint)
+        parsed_events = iter_parse_events(chunks, tz=str(reference_now.tzinfo), reference=reference_now)
+        parsed_events = (
+            parsed_event for status, parsed_event in _iter_observe(parsed_events, user_key)
+            if not (changes_only and status == UNCHANGED)
+        )
+        first_event = next(parsed_events, None)
+    except TimeoutError as e:
+        return str(e), 503
+    except ValueError as e:
+        metrics.count_error(request.endpoint, e)
+        return f"入力を分割できませんでした: {e}", 400
+    except Exception as e:
+        metrics.count_error(request.endpoint, e)
+        return f"エラーが発生しました: {e}", 500
+
+    if first_event is None:
+        if changes_only:
+            return Response(status=204)
+        return "イベントが見つかりませんでした",400
+
+    return _ical_response(iter_calendar_ical(chain([first_event], parsed_events)), 'events.ics')
+
+#ファイル (.txt / .csv / .eml / .mbox / .ics) をアップロードして1つの.icsに結合するエンドポイント
+@app.route('/import',methods=['POST'])
+def import_files():
+    # アップロードはフォーム全体の上限ではなく MAX_IMPORT_BYTES まで受け付ける (フォームを読む前に設定する)
+    request.max_content_length = app.config['MAX_IMPORT_BYTES']
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return "ファイルが選択されていません",400
+    user_key = _user_key()
+    try:
+        reference_now = _request_reference_time()
+        changes_only = _changes_only(user_key)
+    except ValueError as e:
+        return str(e),400
+
+    # 読み込み・解析・重複の除去・シリアライズは1件ずつ進め、結合したカレンダーは一時ファイルに少しずつ書き出す。
+    # (アップロードされたファイルはビューを抜けると閉じられるので、レスポンスを返す前に読み終える)
+    stats = ImportStats()
+    sources = [(f.stream, detect_format(f.filename)) for f in files]
+    output = tempfile.TemporaryFile()
+    try:
+        chunks = iter_import_calendar(sources, request.form.get('split', 'auto'), request.form.get('encoding') or 'utf-8',
+                                      tz=str(reference_now.tzinfo), reference=reference_now, stats=stats,
+                                      # 匿名のリクエストは索引を使わない (_iter_observe と同じ)
+                                      index=event_index if user_key is not None else None, user_key=user_key,
+                                      changes_only=changes_only,
+                                      deadline=_deadline())
+        output.writelines(chunks)
+    except TimeoutError as e:
+        output.close()
+        metrics.count_error(request.endpoint, e)
+        app.logger.warning("import: %d records in %.2fs, 処理時間の上限を超えました", stats.records, stats.elapsed)
+        return f"{e}。ファイルを分けて取り込んでください", 503
+    except (ValueError, LookupError) as e:
+        output.close()
+        metrics.count_error(request.endpoint, e)
+        return f"ファイルを読み込めませんでした: {e}", 400
+    except Exception as e:
+        output.close()
+        metrics.count_error(request.endpoint, e)
+        return f"エラーが発生しました: {e}", 500
+
+    app.logger.info("import: %d records -> %d events (%d duplicates) in %.2fs, %.0f records/s",
+                    stats.records, stats.events, stats.duplicates, stats.elapsed, stats.records_per_second)
+    response = _ical_response(wrap_file(request.environ, output), 'import.ics')
+    response.content_length = output.tell()
+    output.seek(0)
+    response.headers['X-Import-Records'] = str(stats.records)
+    response.headers['X-Import-Events'] = str(stats.events)
+    response.headers['X-Import-Duplicates'] = str(stats.duplicates)
+    response.headers['X-Import-Unchanged'] = str(stats.unchanged)
+    response.headers['X-Import-Records-Per-Second'] = f'{stats.records_per_second:.1f}'
+    return response
+
+#リクエストが大きすぎる場合 (MAX_CONTENT_LENGTH 超過)
+@app.errorhandler(413)
+def request_too_large(e):
+    return "テキストが長すぎます",413
+
 if __name__=='__main__':
-    #serverを起動
+    #開発用のserverを起動
+    #本番は gunicorn -c gunicorn.conf.py app:app (ASGI なら uvicorn asgi:application) で起動する
     #iPhoneからアクセスするためにはhost='0.0.0.0'に設定して
     #ファイアウォールやルータの設定でポート（デフォルト5000）を開くことが必要かも
-    app.run(debug=True, host='0.0.0.0',port=5001)
+    #デバッガは外部から任意のコードを実行できてしまうので、AUTOCAL_DEBUG=1 のときだけ有効にする
+    app.run(debug=os.environ.get('AUTOCAL_DEBUG') == '1', host='0.0.0.0',port=5001)
     #ホストをこの番号にするとローカルネットワーク内の他のデバイスからアクセス可能になる
\ No newline at end of file
@@ -0,0 +1,26 @@
+"""
+ASGI サーバーで起動するためのエントリーポイント。
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5001 --workers 4 --timeout-graceful-shutdown 30
+
+Flask アプリ (WSGI) を asgiref でラップします。各リクエストはスレッドプールで処理されるので、
+ストリーミングするバッチ出力や、多数のカレンダーアプリからのフィードのポーリングのように
+同時接続が多い場合も、接続の待ち受けはイベントループが受け持ちます。
+asgiref と uvicorn は requirements には含めていません (pip install asgiref uvicorn)。
+gunicorn.conf.py と同じく、バッチ解析のプロセスプールは既定で使いません (AUTOCAL_PARSE_WORKERS=1)。
+uvicorn にはリクエストの処理時間の上限がないので、バッチと /import は app の AUTOCAL_REQUEST_DEADLINE で打ち切ります。
+"""
+import os
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e: # ASGI で起動するときだけ必要
+    raise ImportError("ASGI で起動するには asgiref が必要です: pip install asgiref uvicorn") from e
+
+os.environ.setdefault('AUTOCAL_PARSE_WORKERS', '1') # app を読み込む前に設定する
+
+from app import app
+from autocalendar.warmup import warm_up
+
+warm_up()
+application = WsgiToAsgi(app)
@@ -0,0 +1,13 @@
+"""
+テキストからカレンダーイベント (.ics) を作るためのライブラリ。
+
+Web アプリ (app.py) とクリップボード監視 CLI (py_clipboard.py) の共通部分です。
+icalendar・pyperclip などの重い依存は、それを使うモジュールや関数の中でだけ読み込みます。
+"""
+from .model import ParsedEvent, Recurrence
+from .parser import extract_tokens, iter_parse_events, parse_event_from_text, parse_events, parse_events_from_text, segment_events
+
+__all__ = [
+    'ParsedEvent', 'Recurrence', 'extract_tokens', 'iter_parse_events', 'parse_event_from_text', 'parse_events',
+    'parse_events_from_text', 'segment_events',
+]
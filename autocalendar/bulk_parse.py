@@ -0,0 +1,165 @@
+"""
+大量のイベントテキストをまとめて解析するためのユーティリティ。
+
+解析処理 (正規表現・dateutil) は純粋な Python で CPU バウンドなため、
+入力が大きい場合は ProcessPoolExecutor で複数コアに分散します。
+小さな入力ではプロセス間通信のコストの方が大きいので、同じプロセス内で解析します。
+
+ワーカープロセスは既定で forkserver (使えない環境では spawn) で起動します。gunicorn の gthread ワーカーのように
+スレッドのあるプロセスから fork すると、他のスレッドが持っていたロック (メトリクスや SQLite など) を
+ロックされたまま引き継いで止まることがあるためです。
+サーバーでは各ワーカーがすでに CPU を使い切るので、gunicorn.conf.py と asgi.py は
+AUTOCAL_PARSE_WORKERS=1 (プールを使わない) を既定にしています。
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+# 環境変数で調整可能なデフォルト値
+DEFAULT_WORKERS = int(os.environ.get('AUTOCAL_PARSE_WORKERS', 0)) or os.cpu_count() or 1
+DEFAULT_CHUNK_SIZE = int(os.environ.get('AUTOCAL_PARSE_CHUNK_SIZE', 0)) or None
+# これより少ないイベント数ならプロセスプールを使わない
+MIN_PARALLEL_EVENTS = int(os.environ.get('AUTOCAL_PARSE_MIN_PARALLEL', 64))
+# ワーカープロセスの起動方法 (forkserver / spawn / fork)
+START_METHOD = os.environ.get('AUTOCAL_PARSE_START_METHOD', 'forkserver')
+
+_BLANK_LINE_RE = re.compile(r'\n\s*\n')
+_LINE_RE = re.compile(r'[^\r\n]+')
+SPLIT_MODES = ('auto', 'line', 'blank', 'json')
+
+_executor = None
+_executor_workers = None
+_executor_pid = None
+
+
+def iter_event_chunks(text_content, split='auto'):
+    """
+    バッチ入力をイベントごとのテキストに分割し、先頭から順に返します。
+    テキスト全体の分割結果をリストとして持たないので、大きな入力でもメモリが増えません。
+    split: 'line' (1行1イベント), 'blank' (空行区切り), 'json' (文字列のJSON配列), 'auto' (自動判定)
+    """
+    if split not in SPLIT_MODES:
+        raise ValueError(f"不明な分割方法です: {split}")
+    if split == 'auto':
+        stripped = text_content.lstrip()
+        if stripped.startswith('['):
+            split = 'json'
+        elif _BLANK_LINE_RE.search(text_content):
+            split = 'blank'
+        else:
+            split = 'line'
+
+    if split == 'json':
+        items = json.loads(text_content)
+        # null・数値・オブジェクトなどを文字列にしてイベントにしないように、要素は文字列だけ受け付ける
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            raise ValueError("JSONはイベントテキストの配列である必要があります")
+        chunks = iter(items)
+    elif split == 'blank':
+        chunks = _iter_blocks(text_content)
+    else:
+        chunks = (match.group() for match in _LINE_RE.finditer(text_content))
+    return (chunk.strip() for chunk in chunks if chunk and chunk.strip())
+
+
+def _iter_blocks(text_content):
+    position = 0
+    for separator in _BLANK_LINE_RE.finditer(text_content):
+        yield text_content[position:separator.start()]
+        position = separator.end()
+    yield text_content[position:]
+
+
+def split_event_chunks(text_content, split='auto'):
+    """iter_event_chunks の結果をリストで返します。"""
+    return list(iter_event_chunks(text_content, split))
+
+
+def _get_executor(workers):
+    """プロセスプールは起動コストが高いので、ワーカー数が同じ間は使い回します。"""
+    global _executor, _executor_workers, _executor_pid
+    if _executor is not None and _executor_pid != os.getpid():
+        # fork した子プロセスでは親のプールは使えない
+        _executor = None
+    if _executor is None or _executor_workers != workers:
+        shutdown_pool()
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+        _executor_workers = workers
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    method = START_METHOD if START_METHOD in methods else 'spawn' # Windows には forkserver がない
+    context = multiprocessing.get_context(method)
+    if method == 'forkserver':
+        # 解析モジュールを読み込んだ forkserver から fork するので、各ワーカーで読み込み直さずに済む
+        context.set_forkserver_preload(['autocalendar.parser'])
+    return context
+
+
+def shutdown_pool():
+    """使い回しているプロセスプールを終了します。"""
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+        _executor_workers = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _parse_group(parse_func, group):
+    """ワーカープロセス側: まとめて受け取ったイベントテキストを解析します。"""
+    return [parse_func(chunk) for chunk in group]
+
+
+def iter_bulk_parse(chunks, parse_func, workers=None, chunk_size=None, min_parallel=None):
+    """
+    イベントテキストを parse_func で解析し、入力と同じ順番で結果を1件ずつ返します。
+
+    chunks はイテレーターでもよく、一度に処理中にするのは workers * 2 グループ分だけなので、
+    件数が多くてもメモリ使用量は一定です。
+    parse_func はワーカープロセスに渡せるよう、モジュールレベルの関数
+    (または functools.partial) である必要があります。
+    workers: ワーカープロセス数 (デフォルト: AUTOCAL_PARSE_WORKERS または CPU数)
+    chunk_size: 1回のプロセス間通信でまとめて送るイベント数 (デフォルト: 自動)
+    min_parallel: これより少ない件数は同一プロセス内で解析する
+    """
+    workers = workers or DEFAULT_WORKERS
+    min_parallel = max(MIN_PARALLEL_EVENTS if min_parallel is None else min_parallel, 2)
+    if not chunk_size and hasattr(chunks, '__len__'):
+        chunk_size = DEFAULT_CHUNK_SIZE or max(1, len(chunks) // (workers * 4))
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE or 32
+
+    chunks = iter(chunks)
+    head = list(islice(chunks, min_parallel))
+    if workers <= 1 or len(head) < min_parallel:
+        yield from map(parse_func, chain(head, chunks))
+        return
+
+    executor = _get_executor(workers)
+    groups = iter(lambda it=chain(head, chunks): list(islice(it, chunk_size)), [])
+    pending = deque()
+    for group in groups:
+        pending.append(executor.submit(_parse_group, parse_func, group))
+        if len(pending) >= workers * 2:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def bulk_parse(chunks, parse_func, workers=None, chunk_size=None, min_parallel=None):
+    """
+    イベントテキストのリストを parse_func で解析し、入力と同じ順番で結果のリストを返します。
+    引数は iter_bulk_parse と同じです。
+    """
+    chunks = list(chunks)
+    return list(iter_bulk_parse(chunks, parse_func, workers, chunk_size, min_parallel))
@@ -0,0 +1,304 @@
+"""
+クリップボードの変更を検知するためのバックエンドとウォッチャー。
+
+- 変更通知を受け取れる環境 (Wayland の wl-paste --watch, X11 の clipnotify) では、
+  変更があるまでブロックして待つため、アイドル時に CPU を使いません。
+- Windows / macOS ではクリップボードのシーケンス番号 (changeCount) を安く確認し、
+  変わったときだけ中身を読み出します。
+- それ以外は pyperclip を使ったポーリングですが、間隔は直近の変更後は短く、
+  アイドルが続くと徐々に長くなります (アダプティブ・バックオフ)。
+- 通知用のコマンドが起動できない・途中で終了した (X のディスプレイが切れた等) 場合はログに残し、
+  max_interval ごとのポーリングに切り替えます。
+- FakeClipboard はテストやベンチマーク用に、実際のクリップボード無しで動作します。
+
+重複判定は直前のテキスト全体ではなく、内容のハッシュで行います。
+"""
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text):
+    """重複判定用の内容ハッシュ。"""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class ClipboardBackend:
+    """
+    クリップボードのバックエンドの基底クラス。
+
+    notifies が True のバックエンドは wait_for_change() で変更までブロックします。
+    False のバックエンドはウォッチャーがポーリングし、change_token() が None 以外を
+    返す場合は、その値が変わったときだけ read() します。
+    """
+    name = 'base'
+    notifies = False
+
+    def read(self):
+        raise NotImplementedError
+
+    def change_token(self):
+        return None
+
+    def wait_for_change(self, timeout):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyperclipBackend(ClipboardBackend):
+    """pyperclip.paste() によるポーリング。Linux では毎回 xclip/xsel が起動します。"""
+    name = 'pyperclip'
+
+    def __init__(self):
+        import pyperclip
+        self._paste = pyperclip.paste
+
+    def read(self):
+        return self._paste()
+
+
+class WindowsSequenceBackend(PyperclipBackend):
+    """GetClipboardSequenceNumber が変わったときだけ中身を読む (Windows)。"""
+    name = 'win32-sequence'
+
+    def __init__(self):
+        super().__init__()
+        import ctypes
+        self._sequence = ctypes.windll.user32.GetClipboardSequenceNumber
+
+    def change_token(self):
+        return self._sequence()
+
+
+class MacChangeCountBackend(PyperclipBackend):
+    """NSPasteboard.changeCount が変わったときだけ中身を読む (macOS, pyobjc が必要)。"""
+    name = 'macos-changecount'
+
+    def __init__(self):
+        super().__init__()
+        from AppKit import NSPasteboard
+        self._pasteboard = NSPasteboard.generalPasteboard()
+
+    def change_token(self):
+        return self._pasteboard.changeCount()
+
+
+class _SubprocessNotifyBackend(ClipboardBackend):
+    """
+    外部コマンドからの変更通知をバックグラウンドスレッドで受け取るバックエンド。
+    コマンドが終了・失敗して通知が届かなくなったら、wait_for_change は timeout ごとに
+    True を返し、ウォッチャーが中身を読んで比べる (ポーリングと同じ) ようにします。
+    """
+    notifies = True
+
+    def __init__(self):
+        self._changed = threading.Event()
+        self._closed = threading.Event()
+        self._failed = False
+        self._process = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self._listen()
+        except Exception as e:
+            if not self._closed.is_set():
+                logger.warning("%s: 変更通知を受け取れません (%s)。ポーリングに切り替えます", self.name, e)
+        else:
+            if not self._closed.is_set():
+                logger.warning("%s: 変更通知のコマンドが終了しました。ポーリングに切り替えます", self.name)
+        self._failed = True
+        self._changed.set()
+
+    def _listen(self):
+        """通知を受け取るたびに self._changed をセットします。戻ったら通知は届かなくなったものとみなします。"""
+        raise NotImplementedError
+
+    def wait_for_change(self, timeout):
+        if self._failed:
+            # 通知が来ないので、timeout ごとに中身を確認させる
+            return not self._closed.wait(timeout)
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def close(self):
+        self._closed.set()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+
+
+class WaylandWatchBackend(_SubprocessNotifyBackend):
+    """wl-paste --watch で変更通知を受け取る (Wayland)。"""
+    name = 'wayland-watch'
+
+    def _listen(self):
+        # 変更のたびに echo が改行を1つ出力する
+        self._process = subprocess.Popen(
+            ['wl-paste', '--watch', 'echo'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        for _ in self._process.stdout:
+            if self._closed.is_set():
+                break
+            self._changed.set()
+
+    def read(self):
+        result = subprocess.run(['wl-paste', '--no-newline'], capture_output=True)
+        return result.stdout.decode('utf-8', 'replace') if result.returncode == 0 else ''
+
+
+class X11ClipnotifyBackend(_SubprocessNotifyBackend):
+    """clipnotify (変更があるまでブロックして終了するコマンド) で変更通知を受け取る (X11)。"""
+    name = 'x11-clipnotify'
+
+    def __init__(self):
+        import pyperclip
+        self._paste = pyperclip.paste
+        super().__init__()
+
+    def _listen(self):
+        while not self._closed.is_set():
+            self._process = subprocess.Popen(['clipnotify'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            returncode = self._process.wait()
+            if self._closed.is_set():
+                return
+            if returncode != 0:
+                raise OSError(f"clipnotify が終了コード {returncode} で終了しました")
+            self._changed.set()
+
+    def read(self):
+        return self._paste()
+
+
+class FakeClipboard(ClipboardBackend):
+    """
+    テスト・ベンチマーク用のクリップボード。copy() で内容を設定します。
+    notifies=False にするとポーリング経路を試せます。reads で読み出し回数を確認できます。
+    """
+    name = 'fake'
+
+    def __init__(self, text='', notifies=True):
+        self.notifies = notifies
+        self._text = text
+        self._sequence = 0
+        self._read_sequence = None # 最後に read() したときのシーケンス番号
+        self._condition = threading.Condition()
+        self.reads = 0
+
+    def copy(self, text):
+        with self._condition:
+            self._text = text
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def read(self):
+        with self._condition:
+            self.reads += 1
+            self._read_sequence = self._sequence
+            return self._text
+
+    def change_token(self):
+        return self._sequence
+
+    def wait_for_change(self, timeout):
+        # 待ち始めた時点ではなく最後に読んだ時点と比べる (読んでから待つまでの間のコピーを見逃さないように)
+        with self._condition:
+            return self._condition.wait_for(lambda: self._sequence != self._read_sequence, timeout)
+
+
+def default_backend():
+    """現在のプラットフォームで使える最も効率の良いバックエンドを返します。"""
+    candidates = []
+    if os.name == 'nt':
+        candidates.append(WindowsSequenceBackend)
+    elif sys.platform == 'darwin':
+        candidates.append(MacChangeCountBackend)
+    else:
+        if os.environ.get('WAYLAND_DISPLAY') and shutil.which('wl-paste'):
+            candidates.append(WaylandWatchBackend)
+        if os.environ.get('DISPLAY') and shutil.which('clipnotify'):
+            candidates.append(X11ClipnotifyBackend)
+    for backend_class in candidates:
+        try:
+            return backend_class()
+        except (ImportError, AttributeError, OSError):
+            continue
+    return PyperclipBackend()
+
+
+class ClipboardWatcher:
+    """
+    クリップボードの変更を検知して、新しいテキストを順に返します。
+
+    ポーリングする場合の間隔は、変更を検知した直後は min_interval で、
+    何も起きないたびに backoff 倍されて max_interval まで伸びます。
+    """
+
+    def __init__(self, backend=None, min_interval=0.2, max_interval=2.0, backoff=1.5):
+        self.backend = backend or default_backend()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self._last_hash = None
+        self._last_token = None
+
+    def prime(self):
+        """現在のクリップボードの内容を既知として扱います (起動時の内容を無視したい場合)。"""
+        self._last_token = self.backend.change_token()
+        self._last_hash = content_hash(self.backend.read())
+
+    def poll(self):
+        """変更があれば新しいテキストを、なければ None を返します (ブロックしません)。"""
+        token = self.backend.change_token()
+        if token is not None:
+            if token == self._last_token:
+                return None
+            self._last_token = token
+        text = self.backend.read()
+        if not text:
+            return None
+        digest = content_hash(text)
+        if digest == self._last_hash:
+            return None
+        self._last_hash = digest
+        return text
+
+    def changes(self, stop_event=None):
+        """stop_event がセットされるまで、新しいクリップボードの内容を yield します。"""
+        stop_event = stop_event or threading.Event()
+        if self.backend.notifies:
+            # 通知は次の変更からしか届かないので、起動時の内容は一度だけ直接確認する
+            text = self.poll()
+            if text is not None:
+                yield text
+        while not stop_event.is_set():
+            if self.backend.notifies:
+                # 通知待ちも max_interval ごとに起きて stop_event を確認する
+                if not self.backend.wait_for_change(self.max_interval):
+                    continue
+                text = self.poll()
+                if text is not None:
+                    yield text
+                continue
+
+            text = self.poll()
+            if text is not None:
+                self.interval = self.min_interval
+                yield text
+            else:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+            stop_event.wait(self.interval)
+
+    def close(self):
+        self.backend.close()
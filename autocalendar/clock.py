@@ -0,0 +1,52 @@
+"""
+解析の基準時刻を決める時計。
+
+解析結果は (テキスト, 基準時刻, タイムゾーン) だけで決まるようにしてあり、
+基準時刻は引数で渡すか、ここの時計から一度だけ取得します。
+テストやベンチマークでは FixedClock を渡すと結果が再現可能になります。
+"""
+import datetime
+
+from .timezones import resolve_zone
+
+
+class SystemClock:
+    """実際の現在時刻を返す時計。"""
+
+    def now(self, tz):
+        return datetime.datetime.now(tz)
+
+
+class FixedClock:
+    """常に同じ時刻を返す時計。naive な時刻は指定されたタイムゾーンの時刻として扱います。"""
+
+    def __init__(self, fixed):
+        self.fixed = fixed
+
+    def now(self, tz):
+        if self.fixed.tzinfo is None:
+            return self.fixed.replace(tzinfo=tz)
+        return self.fixed.astimezone(tz)
+
+
+default_clock = SystemClock()
+
+
+def parse_reference_time(value):
+    """ISO 8601 形式の文字列 (2025-06-20T08:00, 2025-06-20T08:00+09:00 など) を datetime にします。"""
+    try:
+        return datetime.datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"基準時刻の形式が正しくありません: {value}") from None
+
+
+def reference_time(reference=None, tz=None, clock=None):
+    """
+    解析に使うタイムゾーン付きの基準時刻を返します。
+    reference を指定した場合はそれを (naive なら tz の時刻として) 使い、
+    指定しない場合は clock (省略時はシステム時計) から一度だけ取得します。
+    """
+    zone = resolve_zone(tz)
+    if reference is not None:
+        return FixedClock(reference).now(zone)
+    return (clock or default_clock).now(zone)
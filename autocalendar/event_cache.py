@@ -0,0 +1,195 @@
+"""
+解析結果と生成済み iCal バイト列のキャッシュ。
+
+同じ招待文が何度も貼り付けられるケースに備え、正規化したテキスト・基準時刻 (分単位)・タイムゾーンの
+ハッシュをキーにして (解析結果, cal.to_ical() のバイト列) を保存します。
+
+- メモリ上の LRU (件数上限付き) と TTL で古いエントリを捨てます。
+  「明日」「今日」や「過去の時刻は翌日にする」処理は現在時刻に依存するため、基準時刻は分単位にそろえてキーに含め、
+  現在時刻から解析する場合のエントリは TTL かその分の終わりのどちらか早い方で期限切れになります。
+- 期限の判定には呼び出し側の時計の時刻 (epoch 秒) を使えます (app.config['CLOCK'] など)。
+- AUTOCAL_CACHE_PATH を指定すると SQLite ファイルを共有バックエンドとして使い、
+  gunicorn の全ワーカーで同じキャッシュを参照できます。
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from .sqlite_local import ThreadLocalConnection
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('AUTOCAL_CACHE_SIZE', 1024))
+DEFAULT_TTL = float(os.environ.get('AUTOCAL_CACHE_TTL', 300))
+DEFAULT_PATH = os.environ.get('AUTOCAL_CACHE_PATH') or None
+
+
+def normalize_event_text(text_content):
+    """改行コードと前後の空白を揃えます。キャッシュキーと解析の両方にこの結果を使います。"""
+    return text_content.replace('\r\n', '\n').replace('\r', '\n').strip()
+
+
+def make_key(text_content, reference, tz_name='', user_key=''):
+    """
+    正規化済みテキスト・基準時刻・タイムゾーン・UID のユーザーキーからキャッシュキーを作ります。
+    reference は解析に渡すのと同じ基準時刻 (分単位にそろえたもの) です。
+    """
+    digest = hashlib.sha256()
+    digest.update(text_content.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(reference.isoformat().encode('ascii'))
+    digest.update(b'\0')
+    digest.update(tz_name.encode('utf-8'))
+    if user_key:
+        digest.update(b'\0')
+        digest.update(user_key.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def expiry_for(valid_until, ttl, now=None):
+    """
+    TTL と valid_until (この時刻以降は解析結果が変わりうる。タイムゾーン付きの datetime) のうち
+    早い方を期限 (epoch 秒) として返します。
+    valid_until が None (基準時刻が明示され、結果が現在時刻に依存しない) 場合は TTL のみ。
+    """
+    now = time.time() if now is None else now
+    if valid_until is None:
+        return now + ttl
+    return min(now + ttl, valid_until.timestamp())
+
+
+class MemoryBackend:
+    """プロセス内の LRU バックエンド。"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires, now):
+        """保存し、上限を超えて追い出した件数を返します。"""
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """複数プロセスで共有できる SQLite バックエンド。last_access で LRU を近似します。"""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = ThreadLocalConnection(path)
+        conn = self._connection.get()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS event_cache ('
+                ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+                ' expires REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS event_cache_access ON event_cache (last_access)')
+
+    def get(self, key, now):
+        conn = self._connection.get()
+        row = conn.execute('SELECT value, expires FROM event_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        with conn:
+            if expires <= now:
+                conn.execute('DELETE FROM event_cache WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE event_cache SET last_access = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def set(self, key, value, expires, now):
+        conn = self._connection.get()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO event_cache (key, value, expires, last_access) VALUES (?, ?, ?, ?)',
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires, now)
+            )
+            conn.execute('DELETE FROM event_cache WHERE expires <= ?', (now,))
+            cursor = conn.execute(
+                'DELETE FROM event_cache WHERE key IN ('
+                ' SELECT key FROM event_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            return max(cursor.rowcount, 0)
+
+    def clear(self):
+        conn = self._connection.get()
+        with conn:
+            conn.execute('DELETE FROM event_cache')
+
+    def __len__(self):
+        return self._connection.get().execute('SELECT COUNT(*) FROM event_cache').fetchone()[0]
+
+
+class EventCache:
+    """
+    (解析結果, iCal バイト列) のキャッシュ。ヒット・ミス・追い出し件数を数えます。
+    path を指定すると SQLite を共有バックエンドにします。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, path=DEFAULT_PATH):
+        self.ttl = ttl
+        if path:
+            self.backend = SQLiteBackend(path, max_entries)
+        else:
+            self.backend = MemoryBackend(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, now=None):
+        """now は期限の判定に使う現在時刻 (epoch 秒。省略時はシステム時計)。"""
+        value = self.backend.get(key, time.time() if now is None else now)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, valid_until=None, now=None):
+        now = time.time() if now is None else now
+        self.evictions += self.backend.set(key, value, expiry_for(valid_until, self.ttl, now), now)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.backend),
+            'backend': type(self.backend).__name__,
+        }
@@ -0,0 +1,214 @@
+"""
+イベントの安定した UID と、出力済みのイベントの索引。
+
+同じ予定を何度貼り付けても・取り込み直しても、カレンダーアプリで重複せず更新として扱われるようにします。
+
+- UID は正規化したタイトル (NFKC・空白・大文字小文字) と開始日時 (UTC) と任意のユーザーキーのハッシュです。
+  ユーザーキー (AUTOCAL_UID_KEY、フィード ID など) が違えば、同じ内容でも別の UID になります。
+- 索引は UID ごとに、最後に出力した内容 (終了・説明・場所・繰り返しなど) のフィンガープリントと
+  SEQUENCE・DTSTAMP を覚えます。内容が同じなら 'unchanged' (同じ SEQUENCE・DTSTAMP で、出力は前回と同じ bytes)、
+  変わっていれば 'updated' (SEQUENCE を1つ上げる)、初めてなら 'new' になります。
+- 索引はメモリ上の LRU (件数上限付き) で、AUTOCAL_INDEX_PATH を指定すると SQLite に保存して
+  プロセスの再起動後や gunicorn の全ワーカーで共有します。
+"""
+import datetime
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, namedtuple
+from itertools import islice
+
+from .sqlite_local import ThreadLocalConnection
+
+UID_DOMAIN = os.environ.get('AUTOCAL_UID_DOMAIN', 'autocalendar')
+DEFAULT_UID_KEY = os.environ.get('AUTOCAL_UID_KEY', '')
+DEFAULT_INDEX_PATH = os.environ.get('AUTOCAL_INDEX_PATH') or None
+DEFAULT_INDEX_SIZE = int(os.environ.get('AUTOCAL_INDEX_SIZE', 100_000))
+# SQLite の索引は、この件数ごとに1つのトランザクションで更新する
+OBSERVE_BATCH_SIZE = 256
+
+NEW, UPDATED, UNCHANGED = 'new', 'updated', 'unchanged'
+
+# fingerprint: 内容のハッシュ、sequence: SEQUENCE、dtstamp: その内容を最初に出力した日時 (UTC)
+IndexEntry = namedtuple('IndexEntry', 'fingerprint sequence dtstamp')
+
+
+def normalize_title(title):
+    return ' '.join(unicodedata.normalize('NFKC', title).casefold().split())
+
+
+def start_text(value):
+    """開始日時を比較用の文字列にします。タイムゾーン付きの日時は UTC にそろえます。"""
+    if not isinstance(value, datetime.datetime):
+        return value.strftime('%Y%m%d')
+    if value.tzinfo is None:
+        return value.strftime('%Y%m%dT%H%M%S')
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event_uid(parsed_event, user_key=None):
+    """タイトルと開始日時とユーザーキー (省略時は AUTOCAL_UID_KEY) から決まる UID を返します。"""
+    key = DEFAULT_UID_KEY if user_key is None else user_key
+    identity = '\0'.join((key, normalize_title(parsed_event.title), start_text(parsed_event.start_dt)))
+    return f"{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32]}@{UID_DOMAIN}"
+
+
+def event_fingerprint(parsed_event):
+    """UID 以外の出力内容のハッシュ。これが変わったイベントを更新として出力します。"""
+    from .ics_writer import format_rrule
+
+    recurrence = parsed_event.recurrence
+    parts = (
+        parsed_event.title,
+        start_text(parsed_event.end_dt),
+        ' '.join(parsed_event.description.split()),
+        parsed_event.location or '',
+        format_rrule(recurrence) if recurrence else '',
+        ','.join(start_text(value) for value in parsed_event.exdates),
+    )
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def current_dtstamp():
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+def with_identity(parsed_event, user_key=None, dtstamp=None):
+    """索引を使わずに UID・SEQUENCE (0)・DTSTAMP (省略時は現在時刻) を付けた ParsedEvent を返します。"""
+    return parsed_event._replace(
+        uid=parsed_event.uid or event_uid(parsed_event, user_key), sequence=0, dtstamp=dtstamp or current_dtstamp()
+    )
+
+
+class MemoryIndexBackend:
+    """プロセス内の LRU バックエンド。"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, items, now):
+        """(UID, フィンガープリント) の列を索引と照合して更新し、(状態, IndexEntry) のリストを返します。"""
+        results = []
+        with self._lock:
+            for uid, fingerprint in items:
+                status, entry = _next_entry(self._entries.get(uid), fingerprint, now)
+                self._entries[uid] = entry
+                self._entries.move_to_end(uid)
+                results.append((status, entry))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteIndexBackend:
+    """ファイルに保存し、複数プロセスで共有できる SQLite バックエンド。last_seen で LRU を近似します。"""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = ThreadLocalConnection(path, isolation_level=None)
+        conn = self._connection.get()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS seen_events ('
+                ' uid TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, sequence INTEGER NOT NULL,'
+                ' dtstamp REAL NOT NULL, last_seen REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS seen_events_last_seen ON seen_events (last_seen)')
+
+    def observe(self, items, now):
+        conn = self._connection.get()
+        results = []
+        # 照合と更新の間に他のワーカーが同じ UID を更新しないよう、書き込みロックを取ってから読む
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for uid, fingerprint in items:
+                row = conn.execute(
+                    'SELECT fingerprint, sequence, dtstamp FROM seen_events WHERE uid = ?', (uid,)
+                ).fetchone()
+                previous = IndexEntry(row[0], row[1], _from_epoch(row[2])) if row else None
+                status, entry = _next_entry(previous, fingerprint, now)
+                conn.execute(
+                    'INSERT OR REPLACE INTO seen_events (uid, fingerprint, sequence, dtstamp, last_seen)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    (uid, entry.fingerprint, entry.sequence, entry.dtstamp.timestamp(), time.time())
+                )
+                results.append((status, entry))
+            conn.execute(
+                'DELETE FROM seen_events WHERE uid IN ('
+                ' SELECT uid FROM seen_events ORDER BY last_seen DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return results
+
+    def clear(self):
+        self._connection.get().execute('DELETE FROM seen_events')
+
+    def __len__(self):
+        return self._connection.get().execute('SELECT COUNT(*) FROM seen_events').fetchone()[0]
+
+
+def _from_epoch(value):
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+
+
+def _next_entry(previous, fingerprint, now):
+    if previous is None:
+        return NEW, IndexEntry(fingerprint, 0, now)
+    if previous.fingerprint == fingerprint:
+        return UNCHANGED, previous
+    return UPDATED, IndexEntry(fingerprint, previous.sequence + 1, now)
+
+
+class SeenEventIndex:
+    """
+    出力済みのイベントの索引。状態 ('new' / 'updated' / 'unchanged') ごとの件数を数えます。
+    path を指定すると SQLite に保存します。
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, max_entries=DEFAULT_INDEX_SIZE):
+        if path:
+            self.backend = SQLiteIndexBackend(path, max_entries)
+        else:
+            self.backend = MemoryIndexBackend(max_entries)
+        self.counts = dict.fromkeys((NEW, UPDATED, UNCHANGED), 0)
+
+    def iter_observe(self, parsed_events, user_key=None, now=None):
+        """
+        イベントに UID・SEQUENCE・DTSTAMP を付け、(状態, ParsedEvent) を入力順に返すジェネレーター。
+        uid が付いていないイベントには event_uid(parsed_event, user_key) を使います。
+        索引は OBSERVE_BATCH_SIZE 件ずつまとめて照合・更新します。
+        """
+        now = now or current_dtstamp()
+        parsed_events = iter(parsed_events)
+        for batch in iter(lambda: list(islice(parsed_events, OBSERVE_BATCH_SIZE)), []):
+            batch = [parsed_event._replace(uid=parsed_event.uid or event_uid(parsed_event, user_key)) for parsed_event in batch]
+            entries = self.backend.observe([(parsed_event.uid, event_fingerprint(parsed_event)) for parsed_event in batch], now)
+            for parsed_event, (status, entry) in zip(batch, entries):
+                self.counts[status] += 1
+                yield status, parsed_event._replace(sequence=entry.sequence, dtstamp=entry.dtstamp)
+
+    def observe(self, parsed_events, user_key=None, now=None):
+        """iter_observe の結果をリストで返します。"""
+        return list(self.iter_observe(parsed_events, user_key, now))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {**self.counts, 'entries': len(self.backend), 'backend': type(self.backend).__name__}
@@ -0,0 +1,148 @@
+"""
+生成したイベントの保存と、購読用 (webcal) フィードの配信。
+
+AUTOCAL_STORE_PATH に SQLite ファイルを指定すると、/generate_ical で作ったイベントを
+フィードごとに保存し、/feeds/<feed>.ics でカレンダーアプリから購読できるようにします。
+
+- VEVENT は保存時に一度だけシリアライズし、bytes のまま保存します。
+- フィードごとに version と更新日時を持ち、ETag / Last-Modified はそこから作ります。
+  条件付き GET (If-None-Match / If-Modified-Since) は1行の SELECT だけで 304 を返せます。
+- 組み立てた .ics はプロセスごとに version をキーにしてキャッシュし、
+  変更があったフィードだけを (保存済みの VEVENT をつなぐだけで) 作り直します。
+"""
+import hashlib
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from .ics import PRODID, event_to_ical, iter_calendar_blocks
+from .sqlite_local import ThreadLocalConnection
+from .timezones import event_zone_keys
+
+DEFAULT_STORE_PATH = os.environ.get('AUTOCAL_STORE_PATH') or None
+DEFAULT_FEED_CACHE_SIZE = int(os.environ.get('AUTOCAL_FEED_CACHE_SIZE', 256))
+
+# フィード ID は推測されにくいランダムな文字列 (URL に使える文字だけ)
+FEED_ID_RE = re.compile(r'[A-Za-z0-9_-]{16,64}')
+
+# version: 変更のたびに増える番号、modified: 最終更新 (epoch 秒)
+FeedState = namedtuple('FeedState', 'version modified')
+# body: .ics 全体の bytes、etag: 引用符付きの ETag
+FeedSnapshot = namedtuple('FeedSnapshot', 'state body etag')
+
+
+def is_valid_feed_id(feed_id):
+    return bool(feed_id) and FEED_ID_RE.fullmatch(feed_id) is not None
+
+
+def feed_etag(feed_id, state):
+    """フィードの状態から ETag を作ります。本文を組み立てなくても求められます。"""
+    digest = hashlib.sha256(f'{feed_id}\0{state.version}\0{state.modified!r}'.encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+class EventStore:
+    """フィードごとのイベントを保存する SQLite ストア。スレッド・プロセス間で共有できます。"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH, prodid=PRODID, cache_size=DEFAULT_FEED_CACHE_SIZE):
+        self.path = path
+        self.prodid = prodid
+        self.cache_size = cache_size
+        self._connection = ThreadLocalConnection(path)
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        conn = self._connection.get()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS feeds ('
+                ' feed TEXT PRIMARY KEY, version INTEGER NOT NULL, modified REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT, feed TEXT NOT NULL, uid TEXT,'
+                ' zones TEXT NOT NULL, ical BLOB NOT NULL, created REAL NOT NULL)'
+            )
+            if 'uid' not in {row[1] for row in conn.execute('PRAGMA table_info(events)')}:
+                conn.execute('ALTER TABLE events ADD COLUMN uid TEXT') # UID を持たない頃に作ったファイル
+            conn.execute('CREATE INDEX IF NOT EXISTS events_feed ON events (feed, id)')
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS events_feed_uid ON events (feed, uid)')
+
+    def create_feed(self):
+        """新しい空のフィードを作り、その ID を返します。"""
+        feed_id = secrets.token_urlsafe(16)
+        conn = self._connection.get()
+        with conn:
+            conn.execute('INSERT INTO feeds (feed, version, modified) VALUES (?, 0, ?)', (feed_id, time.time()))
+        return feed_id
+
+    def add_events(self, feed_id, parsed_events):
+        """
+        イベントをフィードに追加し、新しい FeedState (フィードがまだなく、追加もなければ None) を返します。
+        VEVENT はここで一度だけシリアライズして保存します。
+        同じ UID のイベントは置き換え、内容 (bytes) が変わらないイベントしかなければ version を上げません。
+        """
+        now = time.time()
+        rows = [
+            (feed_id, parsed_event.uid, ','.join(event_zone_keys(parsed_event)), event_to_ical(parsed_event), now)
+            for parsed_event in parsed_events
+        ]
+        conn = self._connection.get()
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT INTO events (feed, uid, zones, ical, created) VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (feed, uid) DO UPDATE SET zones = excluded.zones, ical = excluded.ical'
+                ' WHERE events.ical != excluded.ical',
+                rows
+            )
+            if conn.total_changes != before:
+                conn.execute(
+                    'INSERT INTO feeds (feed, version, modified) VALUES (?, 1, ?)'
+                    ' ON CONFLICT (feed) DO UPDATE SET version = version + 1, modified = excluded.modified',
+                    (feed_id, now)
+                )
+            row = conn.execute('SELECT version, modified FROM feeds WHERE feed = ?', (feed_id,)).fetchone()
+        return FeedState(*row) if row else None
+
+    def feed_state(self, feed_id):
+        """フィードの FeedState。存在しなければ None。条件付き GET の判定にはこれだけを使います。"""
+        row = self._connection.get().execute('SELECT version, modified FROM feeds WHERE feed = ?', (feed_id,)).fetchone()
+        return FeedState(*row) if row else None
+
+    def snapshot(self, feed_id, state=None):
+        """
+        フィードの .ics を FeedSnapshot で返します。存在しなければ None。
+        同じ version の間はキャッシュ済みの bytes をそのまま返します。
+        """
+        state = state or self.feed_state(feed_id)
+        if state is None:
+            return None
+        with self._lock:
+            cached = self._snapshots.get(feed_id)
+            if cached is not None and cached.state == state:
+                self._snapshots.move_to_end(feed_id)
+                return cached
+
+        rows = self._connection.get().execute('SELECT zones, ical FROM events WHERE feed = ? ORDER BY id', (feed_id,))
+        blocks = ((zones.split(',') if zones else [], ical) for zones, ical in rows)
+        snapshot = FeedSnapshot(state, b''.join(iter_calendar_blocks(blocks, self.prodid)), feed_etag(feed_id, state))
+        with self._lock:
+            self.rebuilds += 1
+            self._snapshots[feed_id] = snapshot
+            self._snapshots.move_to_end(feed_id)
+            while len(self._snapshots) > self.cache_size:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def stats(self):
+        conn = self._connection.get()
+        return {
+            'feeds': conn.execute('SELECT COUNT(*) FROM feeds').fetchone()[0],
+            'events': conn.execute('SELECT COUNT(*) FROM events').fetchone()[0],
+            'cached_feeds': len(self._snapshots),
+            'rebuilds': self.rebuilds,
+        }
@@ -0,0 +1,568 @@
+"""
+ファイルからの予定のまとめての取り込み (チャットログの .txt、.csv、メールの .eml / .mbox、既存の .ics)。
+
+- ファイルは行ごとにストリームで読み、AUTOCAL_MMAP_THRESHOLD バイト以上のファイルはメモリマップで読みます。
+  レコード (予定を探すテキストの単位) を1件ずつ作って parser.iter_parse_records に流すので、
+  一度にメモリに持つのは解析中のバッチ分だけです。
+- .ics は既存のカレンダーとして扱い、VEVENT / VTIMEZONE をそのまま出力に含めます。
+  .ics は他の形式より先に読み、UID と SUMMARY+DTSTART を重複の判定に登録します。
+  テキストから作った予定も、UID か SUMMARY+DTSTART が登録済みのものは出力しません。
+- 結合したカレンダーは iter_import_calendar が bytes の断片として順に返すので、
+  ファイルやレスポンスにそのまま書き出せます。重複の判定には予定ごとに16バイトのダイジェストだけを持ちます。
+"""
+import codecs
+import csv
+import datetime
+import hashlib
+import html
+import mmap
+import os
+import re
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import chain, islice
+
+from .event_index import NEW, UNCHANGED, current_dtstamp, event_uid, start_text
+from .ics import PRODID, event_to_ical, iter_calendar_blocks
+from .metrics import count_import
+from .parser import FieldRecord, iter_parse_records
+from .timezones import event_zone_keys, resolve_zone, zone_key
+
+DEFAULT_MMAP_THRESHOLD = int(os.environ.get('AUTOCAL_MMAP_THRESHOLD', 8 * 1024 * 1024))
+# 空行区切りのレコードがこれより長くなったら、行の区切りで分けて解析する
+MAX_RECORD_CHARS = int(os.environ.get('AUTOCAL_MAX_RECORD_CHARS', 64 * 1024))
+
+IMPORT_FORMATS = ('txt', 'csv', 'eml', 'mbox', 'ics')
+TEXT_SPLIT_MODES = ('auto', 'line', 'blank')
+_EXTENSIONS = {
+    '.txt': 'txt', '.log': 'txt', '.md': 'txt', '.csv': 'csv',
+    '.eml': 'eml', '.mbox': 'mbox', '.ics': 'ics', '.ical': 'ics',
+}
+# split='auto' のとき、この行数の中に空行があれば空行区切りにする
+_AUTO_SPLIT_LINES = 256
+
+# CSV の見出し行の列名。タイトル・場所・説明の列はそのままイベントの値にし、
+# 開始・終了の列だけを日時として解析します。どれにも当たらない列 (text / 本文 など) は日時の列と一緒に解析します
+_CSV_TITLE_COLUMNS = frozenset(('title', 'summary', 'subject', 'event', '件名', 'タイトル', '予定'))
+_CSV_LOCATION_COLUMNS = frozenset(('location', 'place', 'where', '場所', '会場'))
+_CSV_DESCRIPTION_COLUMNS = frozenset(('description', 'note', '内容', 'メモ', '備考'))
+_CSV_START_COLUMNS = frozenset(('date', 'start', 'time', '日付', '日時', '開始', '時間', '時刻'))
+_CSV_END_COLUMNS = frozenset(('end', '終了'))
+_CSV_HEADER_WORDS = (
+    _CSV_TITLE_COLUMNS | _CSV_LOCATION_COLUMNS | _CSV_DESCRIPTION_COLUMNS | _CSV_START_COLUMNS | _CSV_END_COLUMNS
+    | frozenset(('text', '本文'))
+)
+
+# チャットのエクスポートで各行の先頭に付く送信時刻と発言者 ("[10:02] 名前: ..." / "10:02<TAB>名前<TAB>...")。
+# 予定の時刻と取り違えないように、レコードにする前に取り除く
+_CHAT_PREFIX_RE = re.compile(
+    r'^\s*(?:\[[^\]\n]*?\d{1,2}:\d{2}(?::\d{2})?[^\]\n]*\]|(?:午前|午後)?\d{1,2}:\d{2}(?::\d{2})?(?=\t))\s*'
+    r'(?:(?![\d０-９])[^\s:：\t]{1,32}\s*[:：\t]\s*)?'
+)
+_MBOX_ESCAPED_FROM_RE = re.compile(rb'^>(>*From )')
+_HTML_TAG_RE = re.compile(r'<(?:script|style)\b.*?</(?:script|style)\s*>|<[^>]*>', re.IGNORECASE | re.DOTALL)
+_ICS_TEXT_ESCAPE_RE = re.compile(r'\\([\\;,nN])')
+_CRLF = b'\r\n'
+
+# kind: 'VEVENT' / 'VTIMEZONE'
+# ical: BEGIN から END までの bytes (改行は CRLF にそろえ、折り返しはそのまま)
+# properties: 名前 -> (パラメーター, 値)。コンポーネント直下 (VALARM などの中ではない) の最初の値だけ
+IcsComponent = namedtuple('IcsComponent', 'kind ical properties')
+_ICS_KEY_PROPERTIES = frozenset(('UID', 'SUMMARY', 'DTSTART', 'DTEND', 'TZID'))
+
+
+def detect_format(file_name):
+    """ファイル名の拡張子から IMPORT_FORMATS の形式を決めます。分からなければ 'txt'。"""
+    return _EXTENSIONS.get(os.path.splitext(file_name or '')[1].lower(), 'txt')
+
+
+class ImportStats:
+    """取り込みの件数と所要時間。"""
+
+    def __init__(self):
+        self.records = 0 # 読んだレコード (テキストのレコードと .ics の VEVENT)
+        self.events = 0 # 出力した予定
+        self.duplicates = 0 # 重複として出力しなかった予定
+        self.unchanged = 0 # changes_only で、前回から変わっていないため出力しなかった予定
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def records_per_second(self):
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'records': self.records,
+            'events': self.events,
+            'duplicates': self.duplicates,
+            'unchanged': self.unchanged,
+            'elapsed': self.elapsed,
+            'records_per_second': self.records_per_second,
+        }
+
+
+# --- 読み込み ---
+
+@contextmanager
+def open_source(source, mmap_threshold=DEFAULT_MMAP_THRESHOLD):
+    """
+    パスまたはバイナリのファイルオブジェクトを、readline で行を読めるオブジェクトとして開きます。
+    mmap_threshold バイト以上のディスク上のファイルはメモリマップで読みます。
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            with _mapped(f, mmap_threshold) as readable:
+                yield readable
+    else:
+        with _mapped(source, mmap_threshold) as readable:
+            yield readable
+
+
+@contextmanager
+def _mapped(f, mmap_threshold):
+    try:
+        size = os.fstat(f.fileno()).st_size
+    except (AttributeError, OSError, ValueError): # BytesIO などディスク上にないファイル
+        size = 0
+    if size == 0 or size < mmap_threshold or f.tell() != 0:
+        yield f
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+def _iter_lines(readable):
+    """bytes の行を順に返します。先頭の BOM は取り除きます。"""
+    lines = iter(readable.readline, b'')
+    first = next(lines, b'')
+    if first.startswith(codecs.BOM_UTF8):
+        first = first[len(codecs.BOM_UTF8):]
+    if first:
+        yield first
+    yield from lines
+
+
+# --- 形式ごとのレコード ---
+
+def iter_text_records(readable, split='auto', encoding='utf-8'):
+    """
+    テキスト (チャットのログなど) をレコードに分けて返します。
+    split: 'line' (1行1レコード), 'blank' (空行区切り), 'auto' (先頭の数百行に空行があれば 'blank')
+    空行区切りのレコードは MAX_RECORD_CHARS を超えたところで行の区切りで分けます。
+    行頭のチャットの送信時刻と発言者は取り除きます。
+    """
+    if split not in TEXT_SPLIT_MODES:
+        raise ValueError(f"不明な分割方法です: {split}")
+    lines = (
+        _CHAT_PREFIX_RE.sub('', line.decode(encoding, 'replace').rstrip('\r\n'))
+        for line in _iter_lines(readable)
+    )
+    if split == 'auto':
+        head = list(islice(lines, _AUTO_SPLIT_LINES))
+        split = 'blank' if any(not line.strip() for line in head) else 'line'
+        lines = chain(head, lines)
+
+    if split == 'line':
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+        return
+
+    block = []
+    size = 0
+    for line in lines:
+        if line.strip():
+            block.append(line)
+            size += len(line) + 1
+            if size < MAX_RECORD_CHARS:
+                continue
+        if block:
+            yield '\n'.join(block).strip()
+            block = []
+            size = 0
+    if block:
+        yield '\n'.join(block).strip()
+
+
+def iter_csv_records(readable, encoding='utf-8'):
+    """
+    CSV の各行を1レコードにします。
+    見出し行があれば列名で FieldRecord に振り分け、タイトル・場所・説明の列は解析せずにそのまま使います。
+    開始と終了の列は「開始 ~ 終了」として解析します。見出し行がなければセルを空白でつないだテキストにします。
+    """
+    rows = csv.reader(line.decode(encoding, 'replace') for line in _iter_lines(readable))
+    header = next(rows, None)
+    if header is None:
+        return
+    names = [cell.strip().lower() for cell in header]
+    if not any(name in _CSV_HEADER_WORDS for name in names):
+        for row in chain([header], rows):
+            cells = [cell.strip() for cell in row if cell.strip()]
+            if cells:
+                yield ' '.join(cells)
+        return
+
+    def columns(words):
+        return [index for index, name in enumerate(names) if name in words]
+
+    def join(row, indexes, separator=' '):
+        return separator.join(row[index].strip() for index in indexes if index < len(row) and row[index].strip())
+
+    titles = columns(_CSV_TITLE_COLUMNS)
+    locations = columns(_CSV_LOCATION_COLUMNS)
+    descriptions = columns(_CSV_DESCRIPTION_COLUMNS)
+    ends = columns(_CSV_END_COLUMNS)
+    mapped = set(titles + locations + descriptions + ends)
+    starts = [index for index in range(len(names)) if index not in mapped]
+    for row in rows:
+        text = join(row, starts)
+        end = join(row, ends)
+        if end:
+            text = f'{text} ~ {end}' if text else end
+        title = join(row, titles)
+        if text or title:
+            # 説明の列がなければ、これまでどおり行全体を説明にする
+            description = join(row, descriptions, '\n') or join(row, range(len(row)))
+            yield FieldRecord(text, title, join(row, locations), description)
+
+
+def iter_email_records(readable, mailbox=False):
+    """
+    メールを「件名 + 本文」のレコードにします。
+    mailbox=True (.mbox) の場合は行頭の "From " でメールを区切り、1通ずつ解析して返すので、全体を読み込みません。
+    """
+    from email.parser import BytesFeedParser # メールを取り込むときだけ読み込む
+
+    parser = None
+    previous_blank = True
+    for line in _iter_lines(readable):
+        if mailbox and previous_blank and line.startswith(b'From '):
+            if parser is not None:
+                record = _email_record(parser.close())
+                if record:
+                    yield record
+            parser = BytesFeedParser()
+            previous_blank = False
+            continue
+        if parser is None:
+            parser = BytesFeedParser()
+        if mailbox:
+            line = _MBOX_ESCAPED_FROM_RE.sub(rb'\1', line)
+        parser.feed(line)
+        previous_blank = not line.strip()
+    if parser is not None:
+        record = _email_record(parser.close())
+        if record:
+            yield record
+
+
+def _email_record(message):
+    # email.policy.default はヘッダーの解析が重いので、従来の compat32 で読み、必要な部分だけをデコードする
+    from email.header import decode_header, make_header
+
+    try:
+        subject = str(make_header(decode_header(message.get('subject', ''))))
+    except (LookupError, ValueError): # 不明な文字コードなど
+        subject = str(message.get('subject', ''))
+    part = _text_part(message)
+    text = ''
+    if part is not None:
+        payload = part.get_payload(decode=True) or b''
+        try:
+            text = payload.decode(part.get_content_charset() or 'utf-8', 'replace')
+        except LookupError:
+            text = payload.decode('utf-8', 'replace')
+        if part.get_content_type() == 'text/html':
+            text = html.unescape(_HTML_TAG_RE.sub(' ', text))
+    return f'{subject}\n{text}'.strip()
+
+
+def _text_part(message):
+    """本文のパート。text/plain を優先し、なければ最初の text/html (添付ファイルは除く)。"""
+    html_part = None
+    for part in message.walk():
+        if part.is_multipart() or part.get_filename():
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain':
+            return part
+        if content_type == 'text/html' and html_part is None:
+            html_part = part
+    return html_part
+
+
+def iter_ics_components(readable):
+    """
+    .ics から VEVENT と VTIMEZONE を1つずつ IcsComponent で返します。
+    icalendar で全体を読み込まずに行ごとに処理するので、大きなカレンダーでもメモリ使用量は一定です。
+    """
+    kind = None
+    depth = 0
+    lines = []
+    properties = {}
+    current = None
+    for line in _iter_lines(readable):
+        line = line.rstrip(b'\r\n')
+        if kind is None:
+            upper = line.upper()
+            if upper in (b'BEGIN:VEVENT', b'BEGIN:VTIMEZONE'):
+                kind = upper[6:].decode('ascii')
+                depth = 1
+                lines = [line]
+                properties = {}
+                current = None
+            continue
+        if not line:
+            continue
+        lines.append(line)
+        if line[:1] in (b' ', b'\t'): # 折り返しの続き
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            _add_property(properties, current)
+            current = None
+        upper = line[:6].upper()
+        if upper.startswith(b'BEGIN:'):
+            depth += 1
+        elif upper.startswith(b'END:'):
+            depth -= 1
+            if depth == 0:
+                yield IcsComponent(kind, _CRLF.join(lines) + _CRLF, properties)
+                kind = None
+        elif depth == 1:
+            current = line
+
+
+def _add_property(properties, line):
+    name, params, value = _split_content_line(line.decode('utf-8', 'replace'))
+    if name in _ICS_KEY_PROPERTIES and name not in properties:
+        properties[name] = (params, value)
+
+
+def _split_content_line(text):
+    """「名前;パラメーター:値」を (名前, パラメーター, 値) に分けます。引用符の中の : では区切りません。"""
+    quoted = False
+    for index, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            name, _, params = text[:index].partition(';')
+            return name.upper(), params, text[index + 1:]
+    return text.upper(), '', ''
+
+
+def _tzid(params):
+    for param in params.split(';'):
+        name, _, value = param.partition('=')
+        if name.upper() == 'TZID':
+            return value.strip('"')
+    return None
+
+
+# --- 重複の判定 ---
+
+def _digest(*parts):
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8'), digest_size=16).digest()
+
+
+def _start_key(summary, start):
+    """SUMMARY+DTSTART の重複判定のキー。タイトルの空白の違いは無視します。start は start_text の文字列。"""
+    return _digest('start', ' '.join(summary.split()), start)
+
+
+def _ics_start_text(params, value):
+    value = value.strip()
+    if len(value) == 8: # VALUE=DATE
+        return value
+    utc = value.endswith(('Z', 'z'))
+    try:
+        start = datetime.datetime.strptime(value.rstrip('Zz'), '%Y%m%dT%H%M%S')
+    except ValueError:
+        return value
+    tzid = _tzid(params)
+    if utc:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    elif tzid:
+        try:
+            start = start.replace(tzinfo=resolve_zone(tzid))
+        except ValueError: # IANA 名ではない TZID はゾーン名ごと比較する
+            return f'{tzid}:{value}'
+    return start_text(start)
+
+
+def _unescape_text(value):
+    return _ICS_TEXT_ESCAPE_RE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _component_keys(properties):
+    keys = []
+    uid = properties.get('UID')
+    if uid and uid[1].strip():
+        keys.append(_digest('uid', uid[1].strip()))
+    start = properties.get('DTSTART')
+    if start:
+        summary = _unescape_text(properties.get('SUMMARY', ('', ''))[1])
+        keys.append(_start_key(summary, _ics_start_text(*start)))
+    return keys
+
+
+def _component_zone_keys(properties):
+    """VEVENT が参照する TZID のうち、VTIMEZONE を生成できる (IANA 名の) もの。"""
+    keys = []
+    for name in ('DTSTART', 'DTEND'):
+        tzid = _tzid(properties[name][0]) if name in properties else None
+        if not tzid or tzid in keys:
+            continue
+        try:
+            if zone_key(resolve_zone(tzid)) == tzid:
+                keys.append(tzid)
+        except ValueError:
+            pass
+    return keys
+
+
+# --- 結合 ---
+
+def iter_file_records(readable, file_format, split='auto', encoding='utf-8'):
+    """.ics 以外の形式のファイルからレコードを順に返します。"""
+    if file_format == 'csv':
+        return iter_csv_records(readable, encoding)
+    if file_format in ('eml', 'mbox'):
+        return iter_email_records(readable, mailbox=file_format == 'mbox')
+    return iter_text_records(readable, split, encoding)
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError("取り込みが制限時間を超えました")
+
+
+def _iter_ics_blocks(sources, seen, seen_zones, stats, mmap_threshold, deadline):
+    for source, _ in sources:
+        with open_source(source, mmap_threshold) as readable:
+            for component in iter_ics_components(readable):
+                _check_deadline(deadline)
+                if component.kind == 'VTIMEZONE':
+                    tzid = component.properties.get('TZID', ('', ''))[1].strip()
+                    if tzid and tzid not in seen_zones:
+                        seen_zones.add(tzid)
+                        yield (), component.ical
+                    continue
+                stats.records += 1
+                count_import('ics', 'record')
+                keys = _component_keys(component.properties)
+                if any(key in seen for key in keys):
+                    stats.duplicates += 1
+                    count_import('ics', 'duplicate')
+                    continue
+                seen.update(keys)
+                stats.events += 1
+                count_import('ics', 'event')
+                yield _component_zone_keys(component.properties), component.ical
+
+
+def _iter_text_records(sources, split, encoding, stats, mmap_threshold, deadline):
+    for source, file_format in sources:
+        with open_source(source, mmap_threshold) as readable:
+            for record in iter_file_records(readable, file_format, split, encoding):
+                _check_deadline(deadline)
+                stats.records += 1
+                count_import(file_format, 'record')
+                yield record
+
+
+def _iter_unique_events(parsed_events, seen, stats, user_key):
+    """UID か SUMMARY+DTSTART が登録済みのイベントを除き、UID を付けて返します。"""
+    for parsed_event in parsed_events:
+        parsed_event = parsed_event._replace(uid=event_uid(parsed_event, user_key))
+        keys = (_digest('uid', parsed_event.uid), _start_key(parsed_event.title, start_text(parsed_event.start_dt)))
+        if any(key in seen for key in keys):
+            stats.duplicates += 1
+            count_import('text', 'duplicate')
+            continue
+        seen.update(keys)
+        yield parsed_event
+
+
+def _iter_import_blocks(sources, split, encoding, parse_options, identity_options, seen_zones, stats, mmap_threshold,
+                        deadline):
+    seen = set()
+    ics_sources = [item for item in sources if item[1] == 'ics']
+    text_sources = [item for item in sources if item[1] != 'ics']
+    yield from _iter_ics_blocks(ics_sources, seen, seen_zones, stats, mmap_threshold, deadline)
+    if not text_sources:
+        return
+
+    index, user_key, changes_only = identity_options
+    records = _iter_text_records(text_sources, split, encoding, stats, mmap_threshold, deadline)
+    parsed_events = _iter_unique_events(iter_parse_records(records, **parse_options), seen, stats, user_key)
+    if index is not None:
+        observed = index.iter_observe(parsed_events, user_key)
+    else:
+        dtstamp = current_dtstamp()
+        observed = ((NEW, parsed_event._replace(dtstamp=dtstamp)) for parsed_event in parsed_events)
+    for status, parsed_event in observed:
+        if changes_only and status == UNCHANGED:
+            stats.unchanged += 1
+            count_import('text', 'unchanged')
+            continue
+        stats.events += 1
+        count_import('text', 'event')
+        yield event_zone_keys(parsed_event), event_to_ical(parsed_event)
+
+
+def iter_import_calendar(sources, split='auto', encoding='utf-8', tz=None, reference=None, clock=None,
+                         workers=None, chunk_size=None, prodid=PRODID, stats=None,
+                         mmap_threshold=DEFAULT_MMAP_THRESHOLD, index=None, user_key=None, changes_only=False,
+                         deadline=None):
+    """
+    ファイルから予定を取り込み、1つに結合した .ics を bytes の断片として順に返すジェネレーター。
+    sources は (ファイル, 形式) の組の列です。ファイルはパスかバイナリのファイルオブジェクト、
+    形式は IMPORT_FORMATS のどれか (detect_format で拡張子から決められます)。
+    .ics は先に読んで既存の予定として出力し、重複の判定に登録します。それ以外は解析して予定にします。
+    split / encoding は .txt (encoding は .csv も) の読み方、tz / reference / clock / workers / chunk_size は
+    iter_parse_records に渡します。stats に ImportStats を渡すと、件数と所要時間を記録します。
+    解析した予定には user_key から決まる UID を付けます。index (SeenEventIndex) を渡すと SEQUENCE と DTSTAMP を
+    索引から決め、changes_only=True なら前回から変わっていない予定は出力しません。
+    deadline (time.monotonic() の時刻) を過ぎると、次のレコードを読むときに TimeoutError にします。
+    """
+    sources = list(sources)
+    for _, file_format in sources:
+        if file_format not in IMPORT_FORMATS:
+            raise ValueError(f"取り込めない形式です: {file_format}")
+    if split not in TEXT_SPLIT_MODES:
+        raise ValueError(f"不明な分割方法です: {split}")
+    codecs.lookup(encoding) # 不明な文字コードは読み始める前に LookupError にする
+
+    stats = stats if stats is not None else ImportStats()
+    parse_options = {'tz': tz, 'reference': reference, 'clock': clock, 'workers': workers, 'chunk_size': chunk_size}
+    identity_options = (index, user_key, changes_only)
+    seen_zones = set()
+    blocks = _iter_import_blocks(sources, split, encoding, parse_options, identity_options, seen_zones, stats, mmap_threshold,
+                                 deadline)
+    try:
+        yield from iter_calendar_blocks(blocks, prodid, seen_zones=seen_zones)
+    finally:
+        stats.finish()
+
+
+def import_to_file(sources, output, **options):
+    """
+    iter_import_calendar の結果を output (パスまたはバイナリのファイルオブジェクト) に少しずつ書き出し、
+    ImportStats を返します。options は iter_import_calendar と同じです。
+    """
+    stats = options.pop('stats', None) or ImportStats()
+    chunks = iter_import_calendar(sources, stats=stats, **options)
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as f:
+            f.writelines(chunks)
+    else:
+        output.writelines(chunks)
+    return stats
@@ -0,0 +1,262 @@
+"""
+日付・時刻の文法 (表駆動)。
+
+年月日・時分・午前/午後・曜日・相対語 (今日/明日/明後日/来週/再来週)・範囲 (~/〜/から/まで)・
+全角数字、繰り返し (毎週月曜・毎月第2水曜・7/31まで・10回・7/15を除く) を、
+下の対応表から組み立てた一つの正規表現で扱います。
+パターンに入れ子の繰り返しや、隣り合って同じ文字を取り合う繰り返しはないので、入力の長さに対して線形時間で走査できます。
+(「7/15・7/22を除く」のような日付の列は、1日付ずつのトークンにしてから parser でまとめます)
+dateutil の曖昧 (fuzzy) 解析には頼りません。
+"""
+import datetime
+import functools
+import re
+
+# --- 対応表 ---
+RELATIVE_DAYS = {
+    '今日': 0, '本日': 0, 'きょう': 0, 'today': 0,
+    '明日': 1, 'あした': 1, 'あす': 1, 'tomorrow': 1,
+    '明後日': 2, 'あさって': 2,
+}
+WEEK_OFFSETS = {'今週': 0, '来週': 1, '再来週': 2}
+WEEKDAYS = {'月': 0, '火': 1, '水': 2, '木': 3, '金': 4, '土': 5, '日': 6}
+MERIDIEMS = {'午前': 'am', '午後': 'pm', 'am': 'am', 'pm': 'pm', 'a.m.': 'am', 'p.m.': 'pm'}
+NAMED_TIMES = {'正午': (12, 0)}
+# 繰り返し: (FREQ, INTERVAL, BYDAY)
+RECURRENCE_WORDS = {
+    '毎日': ('DAILY', 1, ()),
+    '平日': ('WEEKLY', 1, ('MO', 'TU', 'WE', 'TH', 'FR')),
+    '毎平日': ('WEEKLY', 1, ('MO', 'TU', 'WE', 'TH', 'FR')),
+    '毎週': ('WEEKLY', 1, ()),
+    '隔週': ('WEEKLY', 2, ()),
+    '毎月': ('MONTHLY', 1, ()),
+    '隔月': ('MONTHLY', 2, ()),
+    '毎年': ('YEARLY', 1, ()),
+}
+RRULE_WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# 「第n水曜」の n の上限 (ひと月に同じ曜日は最大5回)
+MAX_WEEKDAY_ORDINAL = 5
+EXCLUDE_WORDS = ('を除く', '除く', '以外', 'は休み', 'はお休み', 'は中止', 'はなし')
+
+# \d は全角数字にもマッチし、int() も全角数字を扱えるので、数字の変換は不要。記号だけ全角も許す。
+_DATE_SEP = r'[/／\-－]'
+_COLON = r'[:：]'
+_RANGE_SEP = r'\s*(?:[~～〜]|から|[\-－ー])\s*'
+
+
+def _alternation(words):
+    # 長い語を先に試す (明後日 を 明日 より先に、など)
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+_RELATIVE = _alternation(RELATIVE_DAYS)
+_WEEK = _alternation(WEEK_OFFSETS)
+_WEEKDAY = '[' + ''.join(WEEKDAYS) + ']'
+_MERIDIEM = _alternation(MERIDIEMS)
+
+ABS_DATE = (
+    r'(?<!\d)(?:\d{4}(?:' + _DATE_SEP + r'|年))?\d{1,2}(?:' + _DATE_SEP + r'|月)\d{1,2}日?'
+    r'(?:\s*[（(]' + _WEEKDAY + r'[)）])?'
+)
+REL_DATE = (
+    r'(?:' + _WEEK + r')の?' + _WEEKDAY + r'曜日?'
+    r'|' + _WEEKDAY + r'曜日?'
+    r'|' + _WEEK +
+    r'|' + _RELATIVE
+)
+DATE = r'(?:' + ABS_DATE + r'|' + REL_DATE + r')'
+TIME = (
+    r'(?:(?:(?:' + _MERIDIEM + r')\s*)?'
+    r'(?<!\d)\d{1,2}(?:' + _COLON + r'\d{2}|時(?:\d{1,2}分|半)?)'
+    r'(?:\s*(?:' + _MERIDIEM + r'))?'
+    r'|' + _alternation(NAMED_TIMES) + r')'
+)
+WHEN = (
+    DATE + r'(?:' + _RANGE_SEP + DATE + r')?'
+    r'(?:\s*(?:の\s*)?' + TIME + r'(?:' + _RANGE_SEP + r'(?:' + DATE + r'\s*)?' + TIME + r'|から)?)?'
+    r'(?:まで|から)?'
+    r'|' + TIME + r'(?:' + _RANGE_SEP + TIME + r'|から)?(?:まで)?'
+)
+LOCATION = r'場所|[@＠]|にて'
+
+_WEEKDAY_LIST = _WEEKDAY + r'曜?日?(?:\s*[・、,と]\s*' + _WEEKDAY + r'曜日?)*'
+RECUR = (
+    r'(?:毎週|隔週)の?' + _WEEKDAY_LIST +
+    r'|毎' + _WEEKDAY + r'曜日?'
+    r'|(?:毎月|隔月)の?(?:第\d|最終)' + _WEEKDAY + r'曜日?'
+    r'|(?:毎月|隔月)の?(?:\d{1,2}日|末日?)'
+    r'|' + _alternation(RECURRENCE_WORDS)
+)
+UNTIL = ABS_DATE + r'\s*(?:まで|迄)'
+COUNT = r'(?<!第)全?\d{1,3}回'
+# 除外語の直前の日付1つだけ。「7/15・7/22を除く」の 7/15 は 'when' になり、parser が EXCEPT_JOIN_RE でつなぐ
+# (日付の列を一つのパターンで読むと、除外語がない長い列で位置ごとに列を読み直して二乗時間になる)
+EXCEPT = ABS_DATE + r'\s*(?:' + _alternation(EXCLUDE_WORDS) + r')'
+EXCEPT_JOIN_RE = re.compile(r'\s*[・、,と]\s*')
+
+# 同じ位置では上のものから順に試す (「毎週月曜」を「月曜」より、「7/31まで」を「7/31」より先に)
+TOKEN_RE = re.compile(
+    r'(?P<recur>' + RECUR + r')'
+    r'|(?P<until>' + UNTIL + r')'
+    r'|(?P<exclude>' + EXCEPT + r')'
+    r'|(?P<when>' + WHEN + r')'
+    r'|(?P<count>' + COUNT + r')'
+    r'|(?P<location>' + LOCATION + r')[:：]?\s*',
+    re.IGNORECASE
+)
+
+# トークン内部の分解用 (マッチした短い部分文字列にだけ適用する)
+_PART_RE = re.compile(
+    r'(?P<abs>(?:(?P<year>\d{4})(?:' + _DATE_SEP + r'|年))?(?P<month>\d{1,2})(?:' + _DATE_SEP + r'|月)(?P<day>\d{1,2})日?'
+    r'(?:\s*[（(]' + _WEEKDAY + r'[)）])?)'
+    r'|(?:(?P<week>' + _WEEK + r')の?)?(?P<weekday>' + _WEEKDAY + r')曜日?'
+    r'|(?P<week_only>' + _WEEK + r')'
+    r'|(?P<relative>' + _RELATIVE + r')'
+    r'|(?:(?P<pre>' + _MERIDIEM + r')\s*)?(?P<hour>\d{1,2})(?:' + _COLON + r'(?P<minute>\d{2})|時(?:(?P<kanji_minute>\d{1,2})分|(?P<half>半))?)'
+    r'(?:\s*(?P<post>' + _MERIDIEM + r'))?'
+    r'|(?P<named>' + _alternation(NAMED_TIMES) + r')',
+    re.IGNORECASE
+)
+
+_RECUR_PART_RE = re.compile(
+    r'毎(?P<every_weekday>' + _WEEKDAY + r')曜日?'
+    r'|(?P<word>' + _alternation(RECURRENCE_WORDS) + r')'
+    r'|第(?P<ordinal>\d)(?P<ordinal_weekday>' + _WEEKDAY + r')曜?日?'
+    r'|(?P<last>最終)(?P<last_weekday>' + _WEEKDAY + r')曜?日?'
+    r'|(?P<monthday>\d{1,2})日'
+    r'|(?P<month_end>末)'
+    r'|(?P<weekday>' + _WEEKDAY + r')曜?日?'
+)
+_COUNT_RE = re.compile(r'\d+')
+
+# 日付の指定: ('abs', 年 or None, 月, 日) / ('rel', 日数) / ('weekday', 週オフセット or None, 曜日) / ('week', 週オフセット)
+# 時刻の指定: (時, 分, 午前/午後が明示されたか)
+
+
+def _decode_time(match):
+    named = match.group('named')
+    if named:
+        hour, minute = NAMED_TIMES[named]
+        return hour, minute, True
+    hour = int(match.group('hour'))
+    if match.group('half'):
+        minute = 30
+    else:
+        minute = int(match.group('minute') or match.group('kanji_minute') or 0)
+    meridiem = match.group('pre') or match.group('post')
+    if meridiem:
+        meridiem = MERIDIEMS[meridiem.lower()]
+        hour = hour % 12 + (12 if meridiem == 'pm' else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute, bool(meridiem)
+
+
+@functools.lru_cache(maxsize=1024)
+def decode_when(token_text):
+    """
+    'when' トークンを (開始日, 終了日, 開始時刻, 終了時刻) の指定に分解します。
+    「10:00」や「明日」のような同じトークンは何度も現れるので、結果はキャッシュします。
+    """
+    dates = []
+    times = []
+    for match in _PART_RE.finditer(token_text):
+        if match.group('abs'):
+            year = match.group('year')
+            dates.append(('abs', int(year) if year else None, int(match.group('month')), int(match.group('day'))))
+        elif match.group('weekday'):
+            week = match.group('week')
+            dates.append(('weekday', WEEK_OFFSETS[week] if week else None, WEEKDAYS[match.group('weekday')]))
+        elif match.group('week_only'):
+            dates.append(('week', WEEK_OFFSETS[match.group('week_only')]))
+        elif match.group('relative'):
+            dates.append(('rel', RELATIVE_DAYS[match.group('relative').lower()]))
+        else:
+            decoded = _decode_time(match)
+            if decoded:
+                times.append(decoded)
+
+    start_time = times[0] if times else None
+    end_time = times[1] if len(times) > 1 else None
+    # 「午後1時~3時」のように終了側の午前/午後が省略された場合は開始側に合わせる
+    if start_time and end_time and start_time[2] and not end_time[2] and start_time[0] >= 12 and end_time[0] < 12:
+        end_time = (end_time[0] + 12, end_time[1], False)
+    return (
+        dates[0] if dates else None,
+        dates[1] if len(dates) > 1 else None,
+        start_time,
+        end_time,
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def decode_recurrence(token_text):
+    """
+    繰り返しのトークンを (FREQ, INTERVAL, BYDAY, BYMONTHDAY) にします。
+    BYDAY は ('MO',) や ('2WE',) のような RRULE の表記です。
+    「第0水曜」「32日」のように範囲外の値を含む場合は None (繰り返しとして扱わない)。
+    """
+    freq, interval, byday = 'WEEKLY', 1, ()
+    bymonthday = ()
+    weekdays = []
+    for match in _RECUR_PART_RE.finditer(token_text):
+        if match.group('word'):
+            freq, interval, byday = RECURRENCE_WORDS[match.group('word')]
+        elif match.group('ordinal'):
+            ordinal = int(match.group('ordinal'))
+            if not 1 <= ordinal <= MAX_WEEKDAY_ORDINAL:
+                return None
+            weekdays.append(f"{ordinal}{RRULE_WEEKDAYS[WEEKDAYS[match.group('ordinal_weekday')]]}")
+        elif match.group('last'):
+            weekdays.append('-1' + RRULE_WEEKDAYS[WEEKDAYS[match.group('last_weekday')]])
+        elif match.group('monthday'):
+            monthday = int(match.group('monthday'))
+            if not 1 <= monthday <= 31:
+                return None
+            bymonthday = (monthday,)
+        elif match.group('month_end'):
+            bymonthday = (-1,)
+        else:
+            # 「毎月曜」は毎週月曜
+            weekday = match.group('every_weekday') or match.group('weekday')
+            weekdays.append(RRULE_WEEKDAYS[WEEKDAYS[weekday]])
+    return freq, interval, tuple(weekdays) or byday, bymonthday
+
+
+def decode_count(token_text):
+    """「10回」「全10回」を回数にします。0回は None (回数の指定として扱わない)。"""
+    return int(_COUNT_RE.search(token_text).group()) or None
+
+
+def decode_dates(token_text):
+    """「7/15・7/22を除く」のようなトークンに含まれる日付の指定をすべて返します。"""
+    return tuple(
+        ('abs', int(match.group('year')) if match.group('year') else None, int(match.group('month')), int(match.group('day')))
+        for match in _PART_RE.finditer(token_text) if match.group('abs')
+    )
+
+
+def resolve_date(spec, now, default_year=None):
+    """
+    日付の指定を基準時刻 now に対する具体的な日付 (datetime.date) にします。
+    存在しない日付 (2/30 など) の場合は None。
+    """
+    kind = spec[0]
+    today = now.date()
+    if kind == 'abs':
+        _, year, month, day = spec
+        try:
+            return datetime.date(year or default_year or now.year, month, day)
+        except ValueError:
+            return None
+    if kind == 'rel':
+        return today + datetime.timedelta(days=spec[1])
+    if kind == 'week':
+        return today + datetime.timedelta(weeks=spec[1])
+    _, weeks, weekday = spec
+    if weeks is None:
+        # 「水曜日」だけの場合は今日以降で最も近いその曜日
+        return today + datetime.timedelta(days=(weekday - today.weekday()) % 7)
+    # 「来週月曜日」は来週 (月曜始まり) のその曜日
+    monday = today - datetime.timedelta(days=today.weekday())
+    return monday + datetime.timedelta(weeks=weeks, days=weekday)
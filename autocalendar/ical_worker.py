@@ -0,0 +1,170 @@
+"""
+iCal ファイルの生成・書き込み・カレンダーアプリの起動をバックグラウンドで行うワーカー。
+
+クリップボード監視ループからこれらの処理を切り離し、遅いデスクトップハンドラーが
+次の変更の検知を妨げないようにします。短時間に続けてコピーされた場合は最後の1件だけを処理します。
+一時ファイルは管理用ディレクトリに書き込み、件数・合計サイズ・経過時間で古いものから削除します。
+"""
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_TEMP_DIR = os.environ.get('AUTOCAL_TEMP_DIR') or os.path.join(tempfile.gettempdir(), 'autocalendar')
+DEFAULT_MAX_FILES = 50
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_AGE = 24 * 3600 # 秒
+
+
+def cleanup_temp_dir(directory, max_files=DEFAULT_MAX_FILES, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, now=None,
+                     keep=None):
+    """
+    directory 内の .ics ファイルを、古すぎるもの・件数や合計サイズの上限を超えたものから削除します。
+    keep (書き込んだばかりでこれから開くファイル) と最も新しいファイルは、上限を超えていても削除しません。
+    削除したファイル数を返します。
+    """
+    now = time.time() if now is None else now
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith('.ics')]
+    except FileNotFoundError:
+        return 0
+
+    files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries), reverse=True)
+    removed = 0
+    kept_count = 0
+    kept_bytes = 0
+    keep = os.path.abspath(keep) if keep else None
+    for index, (mtime, size, path) in enumerate(files): # 新しい順
+        protected = index == 0 or os.path.abspath(path) == keep
+        if not protected and (now - mtime > max_age or kept_count >= max_files or kept_bytes + size > max_bytes):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            continue
+        kept_count += 1
+        kept_bytes += size
+    return removed
+
+
+def open_ical_file(directory=DEFAULT_TEMP_DIR):
+    """管理用ディレクトリに一意な名前の .ics を作り、(書き込み用のファイル, パス) を返します。"""
+    os.makedirs(directory, exist_ok=True)
+    prefix = f"temp_event_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}_"
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix='.ics', dir=directory)
+    return os.fdopen(fd, 'wb'), path
+
+
+def write_ical_file(ical_data, directory=DEFAULT_TEMP_DIR):
+    """iCal データを管理用ディレクトリに一意な名前で書き込み、そのパスを返します。"""
+    f, path = open_ical_file(directory)
+    with f:
+        f.write(ical_data)
+    return path
+
+
+def open_with_default_app(path):
+    """OSに応じた方法で、シェルを経由せずにファイルを既定のアプリで開きます。"""
+    if os.name == 'nt':  # Windows
+        os.startfile(path)
+    elif sys.platform == 'darwin':  # macOS
+        subprocess.Popen(['open', path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:  # Linux (xdg-openが一般的)
+        subprocess.Popen(['xdg-open', path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class IcalWorker:
+    """
+    render(payload) で iCal バイト列を生成し、ファイルに書き込んで opener(path) で開くワーカースレッド。
+    render が None を返した場合 (出力するものがない) は書き込まず、on_done(payload, None) だけを呼びます。
+
+    submit() はすぐに戻ります。coalesce_window 秒以内に次の submit() があった場合は
+    前の要求を破棄し、最後の要求だけを処理します。
+    """
+
+    def __init__(self, render, opener=open_with_default_app, directory=DEFAULT_TEMP_DIR,
+                 coalesce_window=0.5, max_files=DEFAULT_MAX_FILES, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age=DEFAULT_MAX_AGE, on_done=None, on_error=None):
+        self.render = render
+        self.opener = opener
+        self.directory = directory
+        self.coalesce_window = coalesce_window
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.on_done = on_done
+        self.on_error = on_error
+        self.coalesced = 0
+        self._pending = None
+        self._pending_at = 0.0
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='ical-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, payload):
+        """処理を予約します。まだ処理されていない前の要求は置き換えられます。"""
+        with self._condition:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = payload
+            self._pending_at = time.monotonic()
+            self._condition.notify_all()
+
+    def _take(self):
+        with self._condition:
+            while True:
+                if self._pending is None:
+                    if self._closed:
+                        return None
+                    self._condition.wait()
+                    continue
+                # 最後の submit から coalesce_window 経つまで待ち、続けてコピーされたものをまとめる
+                remaining = self._pending_at + self.coalesce_window - time.monotonic()
+                if remaining > 0 and not self._closed:
+                    self._condition.wait(remaining)
+                    continue
+                payload, self._pending = self._pending, None
+                self._busy = True
+                return payload
+
+    def _run(self):
+        while True:
+            payload = self._take()
+            if payload is None:
+                return
+            try:
+                ical_data = self.render(payload)
+                if ical_data is None:
+                    if self.on_done:
+                        self.on_done(payload, None)
+                    continue
+                path = write_ical_file(ical_data, self.directory)
+                cleanup_temp_dir(self.directory, self.max_files, self.max_bytes, self.max_age, keep=path)
+                self.opener(path)
+                if self.on_done:
+                    self.on_done(payload, path)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(payload, e)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """保留中・処理中の要求がなくなるまで待ちます。"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending is None and not self._busy, timeout)
+
+    def close(self, timeout=None):
+        """保留中の要求を処理してからワーカーを終了します。"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
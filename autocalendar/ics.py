@@ -0,0 +1,106 @@
+"""
+iCalendar (.ics) の組み立て。
+
+通常は ics_writer の軽量ライターで直接バイト列を書き出し、
+それで扱えないイベントだけ icalendar の Calendar / Event を使います。
+icalendar は読み込みが重いので、実際に必要になったときに初めて読み込みます。
+"""
+from . import ics_writer
+from .timezones import event_zone_keys, vtimezone_component, vtimezone_ical
+
+PRODID = '-// My Python Calender Helper Web//example.com//'
+
+
+def new_calendar(prodid=PRODID):
+    """prodid と version を設定した空のカレンダーを作成します。"""
+    from icalendar import Calendar
+
+    cal = Calendar()
+    cal.add('prodid', prodid)
+    cal.add('version', '2.0')
+    return cal
+
+
+def build_event(parsed_event):
+    """ParsedEvent から VEVENT を組み立てます。期間の指定がなければ1時間のイベントにします。"""
+    from icalendar import Event, vText
+
+    event = Event()
+    event.add('summary', vText(parsed_event.title))
+    event.add('dtstart', parsed_event.start_dt)
+    event.add('dtend', parsed_event.end_dt)
+    if parsed_event.uid:
+        # 再取り込みで重複させず更新として扱われるよう、安定した UID と SEQUENCE を付ける
+        event.add('dtstamp', parsed_event.dtstamp)
+        event.add('uid', parsed_event.uid)
+        event.add('sequence', parsed_event.sequence)
+    event.add('description', vText(parsed_event.description))
+    if parsed_event.location:
+        event.add('location', vText(parsed_event.location))
+    if parsed_event.recurrence:
+        # 繰り返しは各回を展開せず、RRULE (と EXDATE) 付きの1件の VEVENT にする
+        event.add('rrule', parsed_event.recurrence.rrule_params())
+        if parsed_event.exdates:
+            event.add('exdate', list(parsed_event.exdates))
+    event.add('priority', 5)
+    return event
+
+
+def build_calendar(parsed_events, prodid=PRODID):
+    """ParsedEvent のリストから Calendar を組み立てます。TZID を使うイベントの前に VTIMEZONE を追加します。"""
+    cal = new_calendar(prodid)
+    seen_zones = set()
+    for parsed_event in parsed_events:
+        for key in event_zone_keys(parsed_event):
+            if key not in seen_zones:
+                seen_zones.add(key)
+                cal.add_component(vtimezone_component(key))
+        cal.add_component(build_event(parsed_event))
+    return cal
+
+
+def event_to_ical(parsed_event, fast=True):
+    """1件の VEVENT を bytes で返します。fast=False なら常に icalendar を使います。"""
+    if fast and ics_writer.is_simple(parsed_event):
+        return ics_writer.event_to_ical(parsed_event)
+    return build_event(parsed_event).to_ical()
+
+
+def iter_calendar_ical(parsed_events, prodid=PRODID, fast=True):
+    """
+    VCALENDAR のヘッダー、各 VEVENT、フッターを順に bytes で返すジェネレーター。
+    カレンダー全体を一度に to_ical() せずにストリーミングで送信できます。
+    VTIMEZONE (ゾーンごとにキャッシュ済み) は、そのゾーンを最初に使うイベントの直前に出力します。
+    """
+    blocks = ((event_zone_keys(parsed_event), event_to_ical(parsed_event, fast)) for parsed_event in parsed_events)
+    return iter_calendar_blocks(blocks, prodid, fast)
+
+
+def iter_calendar_blocks(blocks, prodid=PRODID, fast=True, seen_zones=None):
+    """
+    シリアライズ済みの VEVENT から .ics を組み立てるジェネレーター。
+    blocks は (TZID のリスト, VEVENT の bytes) の組の列です。保存済みの VEVENT を再シリアライズせずに使えます。
+    seen_zones には出力済みの TZID を記録します。blocks 側で既存の VTIMEZONE をそのまま出す場合は、
+    同じ集合を共有して登録しておくと、そのゾーンの VTIMEZONE を重ねて出力しません。
+    """
+    if fast:
+        yield ics_writer.calendar_header(prodid)
+        footer = ics_writer.CALENDAR_FOOTER
+    else:
+        header, footer = new_calendar(prodid).to_ical().rsplit(b'END:VCALENDAR', 1)
+        footer = b'END:VCALENDAR' + footer
+        yield header
+    if seen_zones is None:
+        seen_zones = set()
+    for zone_keys, event_ical in blocks:
+        for key in zone_keys:
+            if key not in seen_zones:
+                seen_zones.add(key)
+                yield vtimezone_ical(key)
+        yield event_ical
+    yield footer
+
+
+def calendar_to_ical(parsed_events, prodid=PRODID, fast=True):
+    """ParsedEvent のリストから .ics 全体の bytes を作ります。"""
+    return b''.join(iter_calendar_ical(parsed_events, prodid, fast))
@@ -0,0 +1,160 @@
+"""
+ParsedEvent 専用の軽量な RFC 5545 ライター。
+
+icalendar の Calendar / Event / vText を作らずに、エスケープ・75オクテットでの折り返し・
+日時の書式 (フローティング / UTC / TZID 付き) を直接行います。
+出力は icalendar の to_ical() とバイト単位で一致させています (bench/bench_ics.py で確認)。
+扱えないイベント (is_simple() が False) は ics.py の icalendar 経路で処理します。
+"""
+import datetime
+
+CRLF = '\r\n'
+FOLD_LIMIT = 75
+
+# icalendar と同じ並び順: canonical_order の順、残りはアルファベット順
+_EVENT_ORDER = (
+    'SUMMARY', 'DTSTART', 'DTEND', 'DURATION', 'DTSTAMP', 'UID',
+    'RECURRENCE-ID', 'SEQUENCE', 'RRULE', 'RDATE', 'EXDATE',
+)
+_UTC_KEYS = ('UTC',)
+_PARAM_QUOTE_CHARS = frozenset(':;,')
+
+
+def escape_text(text):
+    """TEXT 値のエスケープ (RFC 5545 3.3.11)。順番が重要です。"""
+    return (
+        text.replace('\\N', '\n')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+        .replace('\r', '\\n')
+    )
+
+
+def fold_line(line):
+    """
+    75オクテット未満ごとに CRLF + 空白で折り返します。
+    マルチバイト文字やバックスラッシュのエスケープの途中では折り返しません。
+    """
+    if len(line) * 4 < FOLD_LIMIT or len(line.encode('utf-8')) < FOLD_LIMIT:
+        return line # ほとんどの行は折り返し不要
+    folded_lines = []
+    current_chars = []
+    byte_count = 0
+    for char in line:
+        char_byte_len = len(char.encode('utf-8'))
+        if current_chars and byte_count + char_byte_len >= FOLD_LIMIT:
+            if len(current_chars) > 1 and current_chars[-1] in '\\^':
+                escaped_prefix = current_chars.pop()
+                folded_lines.append(''.join(current_chars))
+                current_chars = [escaped_prefix]
+                byte_count = len(escaped_prefix.encode('utf-8'))
+            else:
+                folded_lines.append(''.join(current_chars))
+                current_chars = []
+                byte_count = 0
+        current_chars.append(char)
+        byte_count += char_byte_len
+    if current_chars:
+        folded_lines.append(''.join(current_chars))
+    return (CRLF + ' ').join(folded_lines)
+
+
+def _tz_key(tzinfo):
+    """zoneinfo のキー (Asia/Tokyo など)。UTC の場合は 'UTC'、扱えない場合は None。"""
+    if tzinfo is datetime.timezone.utc:
+        return 'UTC'
+    return getattr(tzinfo, 'key', None)
+
+
+def is_simple(parsed_event):
+    """このライターでそのまま書けるイベントかどうか。"""
+    for value in (parsed_event.start_dt, parsed_event.end_dt, *parsed_event.exdates):
+        if isinstance(value, datetime.datetime) and value.tzinfo is not None and _tz_key(value.tzinfo) is None:
+            return False
+    return True
+
+
+def _date_time_text(value):
+    if not isinstance(value, datetime.datetime):
+        return value.strftime('%Y%m%d')
+    text = value.strftime('%Y%m%dT%H%M%S')
+    if value.tzinfo is not None and _tz_key(value.tzinfo) in _UTC_KEYS:
+        return text + 'Z'
+    return text
+
+
+def format_date_time(name, value, *more_values):
+    """
+    DTSTART / DTEND などの日時プロパティ行を作ります。
+    EXDATE のように複数の値がある場合は、最初の値と同じ TZID でカンマ区切りにします。
+    """
+    text = ','.join(_date_time_text(item) for item in (value, *more_values))
+    if not isinstance(value, datetime.datetime):
+        return f"{name};VALUE=DATE:{text}"
+    if value.tzinfo is None:
+        return f"{name}:{text}"
+    key = _tz_key(value.tzinfo)
+    if key in _UTC_KEYS:
+        return f"{name}:{text}"
+    if _PARAM_QUOTE_CHARS.intersection(key):
+        key = f'"{key}"'
+    return f"{name};TZID={key}:{text}"
+
+
+def format_rrule(recurrence):
+    """RRULE の値 (FREQ=WEEKLY;BYDAY=MO など) を作ります。"""
+    parts = []
+    for name, value in recurrence.rrule_params().items():
+        if isinstance(value, list):
+            value = ','.join(str(item) for item in value)
+        elif name == 'UNTIL':
+            value = _date_time_text(value)
+        parts.append(f"{name}={value}")
+    return ';'.join(parts)
+
+
+def event_properties(parsed_event):
+    """VEVENT のプロパティ名と、折り返し前の行の組を返します。"""
+    properties = {
+        'SUMMARY': 'SUMMARY:' + escape_text(parsed_event.title),
+        'DTSTART': format_date_time('DTSTART', parsed_event.start_dt),
+        'DTEND': format_date_time('DTEND', parsed_event.end_dt),
+        'DESCRIPTION': 'DESCRIPTION:' + escape_text(parsed_event.description),
+        'PRIORITY': 'PRIORITY:5',
+    }
+    if parsed_event.uid:
+        properties['DTSTAMP'] = format_date_time('DTSTAMP', parsed_event.dtstamp)
+        properties['UID'] = 'UID:' + escape_text(parsed_event.uid)
+        properties['SEQUENCE'] = f'SEQUENCE:{parsed_event.sequence}'
+    if parsed_event.location:
+        properties['LOCATION'] = 'LOCATION:' + escape_text(parsed_event.location)
+    if parsed_event.recurrence:
+        properties['RRULE'] = 'RRULE:' + format_rrule(parsed_event.recurrence)
+        if parsed_event.exdates:
+            properties['EXDATE'] = format_date_time('EXDATE', *parsed_event.exdates)
+    return properties
+
+
+def _sorted_lines(properties, canonical_order):
+    ordered = [properties[name] for name in canonical_order if name in properties]
+    ordered.extend(properties[name] for name in sorted(properties) if name not in canonical_order)
+    return ordered
+
+
+def event_to_ical(parsed_event):
+    """1件の VEVENT ブロックを bytes で返します。"""
+    lines = ['BEGIN:VEVENT']
+    lines.extend(fold_line(line) for line in _sorted_lines(event_properties(parsed_event), _EVENT_ORDER))
+    lines.append('END:VEVENT')
+    lines.append('')
+    return CRLF.join(lines).encode('utf-8')
+
+
+def calendar_header(prodid):
+    return CRLF.join(['BEGIN:VCALENDAR', 'VERSION:2.0', fold_line('PRODID:' + escape_text(prodid)), '']).encode('utf-8')
+
+
+CALENDAR_FOOTER = ('END:VCALENDAR' + CRLF).encode('ascii')
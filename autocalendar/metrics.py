@@ -0,0 +1,196 @@
+"""
+解析パイプラインの計測 (Prometheus のテキスト形式) と、遅いリクエストのサンプリングプロファイル。
+
+- 解析の各ステージ (parser.py の番号付きの各段階) と /generate_ical の各ステップの所要時間、
+  入力の文字数、エラーの件数 (例外の型ごと) を記録し、render() でテキスト形式にします。
+  AUTOCAL_METRICS=0 で記録を止められます (記録関数が何もしない関数になります)。
+- AUTOCAL_PROFILE_RATE (0〜1) を指定すると、その割合のリクエストを cProfile で計測し、
+  AUTOCAL_PROFILE_SLOW_MS 以上かかったものだけを AUTOCAL_PROFILE_DIR に .prof で保存します。
+  指定しなければプロファイラは起動しません。
+
+値はプロセスごとに持ちます。gunicorn の複数ワーカーやプロセスプールで解析した分は、
+それぞれのプロセスの値になります。
+"""
+import bisect
+import os
+import random
+import tempfile
+import threading
+import time
+
+ENABLED = os.environ.get('AUTOCAL_METRICS', '1') != '0'
+PROFILE_RATE = float(os.environ.get('AUTOCAL_PROFILE_RATE', 0))
+PROFILE_SLOW_SECONDS = float(os.environ.get('AUTOCAL_PROFILE_SLOW_MS', 100)) / 1000
+PROFILE_DIR = os.environ.get('AUTOCAL_PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'autocalendar-profiles')
+
+# 秒単位のバケット (解析の1ステージは数マイクロ秒、リクエスト全体は数ミリ秒)
+LATENCY_BUCKETS = (
+    0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+SIZE_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536, 262144)
+
+
+def _format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """ラベルごとの累積バケット付きヒストグラム。"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, ([*counts], total, count)) for key, (counts, total, count) in self._series.items()]
+        items.sort(key=_label_sort_key)
+        for label_values, (counts, total, count) in items:
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _format_number(bound)
+                lines.append(f'{self.name}_bucket{{{_format_labels(labels + [("le", le)])}}} {cumulative}')
+            suffix = f'{{{_format_labels(labels)}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {_format_number(total)}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return lines
+
+
+class Counter:
+    """ラベルごとのカウンター。"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items(), key=_label_sort_key)
+        for label_values, value in items:
+            lines.append(f'{self.name}{{{_format_labels(zip(self.label_names, label_values))}}} {_format_number(value)}')
+        return lines
+
+
+PARSE_STAGE_SECONDS = Histogram(
+    'autocal_parse_stage_seconds', "解析の各ステージの所要時間", ('stage',), LATENCY_BUCKETS)
+REQUEST_STEP_SECONDS = Histogram(
+    'autocal_request_step_seconds', "エンドポイント内の各ステップの所要時間", ('endpoint', 'step'), LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    'autocal_request_seconds', "リクエスト全体の所要時間", ('endpoint', 'status'), LATENCY_BUCKETS)
+INPUT_CHARS = Histogram(
+    'autocal_input_chars', "event_text の文字数", ('endpoint',), SIZE_BUCKETS)
+ERRORS = Counter(
+    'autocal_errors_total', "エラーの件数 (例外の型ごと)", ('endpoint', 'type'))
+IMPORT_RECORDS = Counter(
+    'autocal_import_records_total',
+    "ファイル取り込みの件数 (record: 読んだレコード、event: 出力した予定、duplicate: 重複で除いた予定、unchanged: 変更がなく除いた予定)",
+    ('format', 'result'))
+PROFILES = Counter(
+    'autocal_profiles_total', "サンプリングしたプロファイル (saved は遅かったため保存したもの)", ('result',))
+
+_METRICS = (PARSE_STAGE_SECONDS, REQUEST_STEP_SECONDS, REQUEST_SECONDS, INPUT_CHARS, ERRORS, IMPORT_RECORDS, PROFILES)
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+if ENABLED:
+    observe_stage = PARSE_STAGE_SECONDS.observe
+    observe_step = REQUEST_STEP_SECONDS.observe
+    observe_request = REQUEST_SECONDS.observe
+    observe_input = INPUT_CHARS.observe
+    count_import = IMPORT_RECORDS.inc
+else: # 無効な場合は呼び出し側の分岐なしで何もしない
+    observe_stage = observe_step = observe_request = observe_input = count_import = _noop
+
+
+def count_error(endpoint, error):
+    ERRORS.inc(endpoint, type(error).__name__)
+
+
+def _label_sort_key(item):
+    # ラベルに None などが混ざっても出力が止まらないように、文字列にして並べる
+    return tuple(str(value) for value in item[0])
+
+
+def render(extra_gauges=()):
+    """
+    すべての値を Prometheus のテキスト形式で返します。
+    extra_gauges は (名前, 説明, 値) の組の列で、キャッシュのヒット率などスクレイプ時に求める値に使います。
+    """
+    lines = []
+    for name, help_text, value in extra_gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {_format_number(value)}']
+    for metric in _METRICS:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+# --- サンプリングプロファイル ---
+
+def start_profile():
+    """
+    PROFILE_RATE の確率で cProfile を開始し、プロファイラを返します (それ以外は None)。
+    無効な場合は乱数も使わずに None を返します。
+    """
+    if PROFILE_RATE <= 0 or random.random() >= PROFILE_RATE:
+        return None
+    import cProfile # プロファイルを取るときだけ読み込む
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError: # 別のプロファイラが動いている
+        return None
+    profiler.started = time.perf_counter()
+    return profiler
+
+
+def finish_profile(profiler, name):
+    """
+    start_profile で開始したプロファイルを止め、PROFILE_SLOW_SECONDS 以上かかっていれば保存します。
+    保存したファイルのパス (保存しなかった場合は None) を返します。
+    """
+    if profiler is None:
+        return None
+    profiler.disable()
+    elapsed = time.perf_counter() - profiler.started
+    if elapsed < PROFILE_SLOW_SECONDS:
+        PROFILES.inc('discarded')
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{elapsed * 1000:.0f}ms.prof")
+    profiler.dump_stats(path)
+    PROFILES.inc('saved')
+    return path
@@ -0,0 +1,82 @@
+"""
+解析結果のイベントモデル。
+"""
+import datetime
+import re
+from collections import namedtuple
+
+_DURATION_PART_RE = re.compile(r'(\d+)([dhms])')
+_DURATION_UNIT_SECONDS = {'d': 24 * 3600, 'h': 3600, 'm': 60, 's': 1}
+
+DEFAULT_DURATION = datetime.timedelta(hours=1)
+
+_ParsedEventBase = namedtuple(
+    'ParsedEvent', 'title start_dt duration description location recurrence exdates uid sequence dtstamp',
+    defaults=(None, (), None, 0, None)
+)
+
+# 繰り返しの規則 (RRULE)。byday は ('MO',) や ('2WE',)、bymonthday は (15,) や (-1,)。
+# until は UTC (または日付)、count は回数。どちらも指定がなければ None。
+_RecurrenceBase = namedtuple('Recurrence', 'freq interval byday bymonthday until count', defaults=(1, (), (), None, None))
+
+
+class Recurrence(_RecurrenceBase):
+    __slots__ = ()
+
+    def rrule_params(self):
+        """icalendar の vRecur に渡せる dict (RRULE の並び順) を返します。"""
+        params = {'FREQ': self.freq}
+        if self.until is not None:
+            params['UNTIL'] = self.until
+        if self.count is not None:
+            params['COUNT'] = self.count
+        if self.interval != 1:
+            params['INTERVAL'] = self.interval
+        if self.byday:
+            params['BYDAY'] = list(self.byday)
+        if self.bymonthday:
+            params['BYMONTHDAY'] = list(self.bymonthday)
+        return params
+
+
+class ParsedEvent(_ParsedEventBase):
+    """
+    parse_event_from_text の結果。
+    先頭の5項目は、これまでの (title, start_dt, duration, description, location) のタプルと同じ並びです。
+    duration は "1d2h30m" 形式の文字列、または期間の指定がなければ None です。
+    繰り返しの予定では recurrence (Recurrence) と exdates (除外する開始日時のタプル) が入ります。
+    start_dt は最初の回の開始日時です。
+    uid / sequence / dtstamp (UTC) は event_index で割り当て、uid があるときだけ VEVENT に書き出します。
+    """
+    __slots__ = ()
+
+    @property
+    def end_dt(self):
+        """終了日時。期間の指定がない (または0秒の) 場合は開始から1時間後。"""
+        total_seconds = parse_duration(self.duration) if self.duration else 0
+        if total_seconds > 0:
+            return self.start_dt + datetime.timedelta(seconds=total_seconds)
+        return self.start_dt + DEFAULT_DURATION
+
+
+def format_duration(total_seconds):
+    """秒数を "1d2h30m" 形式の文字列にします（最低1分）。"""
+    if total_seconds <= 0:
+        return "1m"
+    days = total_seconds // (24 * 3600)
+    hours = (total_seconds % (24 * 3600)) // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+
+    duration_parts = []
+    if days > 0: duration_parts.append(f"{days}d")
+    if hours > 0: duration_parts.append(f"{hours}h")
+    if minutes > 0: duration_parts.append(f"{minutes}m")
+    if seconds > 0: duration_parts.append(f"{seconds}s")
+    return "".join(duration_parts)
+
+
+def parse_duration(duration_str):
+    """"1d2h30m" 形式の文字列を秒数に戻します。"""
+    return sum(int(amount) * _DURATION_UNIT_SECONDS[unit]
+               for amount, unit in _DURATION_PART_RE.findall(duration_str))
@@ -0,0 +1,509 @@
+"""
+イベントテキストの解析。
+
+日付・時刻の文法 (grammar.py) から組み立てた正規表現で、入力は一回だけ走査します。
+正規表現と datetime 以外には依存しないので、Web サーバーでも CLI でも軽く読み込めます。
+"""
+import datetime
+import re
+from collections import namedtuple
+from functools import partial
+from time import perf_counter
+
+from .model import ParsedEvent, Recurrence, format_duration
+from .clock import reference_time
+from .grammar import EXCEPT_JOIN_RE, TOKEN_RE, decode_count, decode_dates, decode_recurrence, decode_when, resolve_date
+from .metrics import observe_stage
+
+# --- 抽出エンジン ---
+# 入力テキストは grammar.TOKEN_RE.finditer で一回だけ走査し、
+# 各ステージ（日付・期間・タイトル・場所）は同じ抽出結果（Extraction）を共有する。
+_TITLE_PUNCT_RE = re.compile(r'[~～〜、,]')
+
+# kind: 'when' / 'location' / 'recur' / 'until' / 'exclude' / 'count'
+# value: when, until -> (開始日, 終了日, 開始時刻, 終了時刻) の指定 (grammar.decode_when を参照)
+#        location -> 場所の文字列
+#        recur -> (FREQ, INTERVAL, BYDAY, BYMONTHDAY) (grammar.decode_recurrence を参照)
+#        exclude -> 除外する日付の指定のタプル、count -> 回数
+Token = namedtuple('Token', 'kind start end value')
+Extraction = namedtuple('Extraction', 'tokens date time range location recurrence until count exdates')
+
+# 列に分かれたレコード (CSV の行など)。text (日時の列) だけを解析し、
+# title / location / description は空でなければそのままイベントの値にします
+FieldRecord = namedtuple('FieldRecord', 'text title location description', defaults=('', '', ''))
+
+# タイトルから取り除くトークンの種類
+_DATETIME_KINDS = ('when', 'recur', 'until', 'exclude', 'count')
+_SUMMARY_FIELDS = {'recur': 'recurrence', 'until': 'until', 'count': 'count'}
+_DECODERS = {
+    'when': decode_when,
+    'until': decode_when,
+    'recur': decode_recurrence,
+    'exclude': decode_dates,
+    'count': decode_count,
+}
+
+# 複数イベントの区切りとみなす文字
+_SEGMENT_SEPARATORS = ('\n', '、', '。', ',', '，', ';', '；')
+# 分けたイベントの範囲の前後から空白と一緒に取り除く文字 (区切り文字と箇条書きの「・」)
+_SEGMENT_TRIM = ''.join(_SEGMENT_SEPARATORS) + '・'
+
+
+def extract_tokens(text_content):
+    """
+    テキストを一度だけ走査し、日付・時刻・期間・場所のトークンを抽出します。
+    各ステージが共有する Extraction を返します。
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(text_content):
+        kind = match.lastgroup
+        if kind != 'location':
+            value = _DECODERS[kind](match.group())
+            if value is None:
+                continue # 「毎月第0水曜」「全0回」など範囲外の繰り返し・回数は使わない (テキストとして残る)
+            tokens.append(Token(kind, match.start(), match.end(), value))
+        else:
+            # 場所はマーカーから行末までだが、行内の日時も拾えるようにトークン自体はマーカーのみとする
+            line_end = text_content.find('\n', match.end())
+            if line_end < 0:
+                line_end = len(text_content)
+            tokens.append(Token('location', match.start(), match.end(), text_content[match.end():line_end].strip()))
+    return _summarize(_join_exclusions(text_content, tokens))
+
+
+def _is_bare_date(token):
+    start_date, end_date, start_time, end_time = token.value if token.kind == 'when' else (None,) * 4
+    return bool(start_date) and start_date[0] == 'abs' and not (end_date or start_time or end_time)
+
+
+def _join_exclusions(text_content, tokens):
+    """
+    「7/15・7/22を除く」の 7/15 のように、除外トークンの前に区切り (・、,と) だけを挟んで並んだ日付を
+    その除外トークンにまとめます。各トークンを一度ずつ見るだけなので、日付の列が長くても線形時間です。
+    """
+    if not any(token.kind == 'exclude' for token in tokens):
+        return tokens
+    joined = []
+    for token in tokens:
+        if token.kind == 'exclude':
+            # 後ろから集めて最後に一度だけ逆順にする (先頭への挿入を繰り返すと二乗時間になる)
+            dates = list(reversed(token.value))
+            start = token.start
+            while joined and _is_bare_date(joined[-1]) and EXCEPT_JOIN_RE.fullmatch(text_content, joined[-1].end, start):
+                previous = joined.pop()
+                dates.append(previous.value[0])
+                start = previous.start
+            dates.reverse()
+            token = Token('exclude', start, token.end, tuple(dates))
+        joined.append(token)
+    return joined
+
+
+def _summarize(tokens):
+    """トークンの列から、各ステージが使う最初の日付・時刻・期間・場所・繰り返しを選んで Extraction にします。"""
+    has_recur = any(token.kind == 'recur' for token in tokens)
+    if not has_recur:
+        # 繰り返しがなければ「7/31まで」「7/15を除く」は普通の日付、「10回」はただの文字列として扱う
+        tokens = [
+            token._replace(kind='when', value=(token.value[0], None, None, None)) if token.kind == 'exclude'
+            else token._replace(kind='when') if token.kind == 'until'
+            else token
+            for token in tokens if token.kind != 'count'
+        ]
+    first = {'date': None, 'time': None, 'range': None, 'location': None, 'recurrence': None, 'until': None, 'count': None}
+    exdates = []
+    weak_date = None
+    for token in tokens:
+        if token.kind == 'when':
+            start_date, end_date, start_time, end_time = token.value
+            if has_recur and end_date and not (start_time or end_time):
+                # 「毎週月曜 10:00 12/1から1/31まで」の日付の範囲は、繰り返しの開始日と終了日 (UNTIL)
+                if first['until'] is None:
+                    first['until'] = token._replace(kind='until', value=(end_date, None, None, None))
+                token = token._replace(value=(start_date, None, None, None))
+                end_date = None
+            if start_date and first['date'] is None:
+                # 「来週の件ですが、7/4 ...」のように単独の「来週」は他に日付がない場合だけ使う
+                if start_date[0] == 'week' and not start_time:
+                    weak_date = weak_date or token
+                else:
+                    first['date'] = token
+            if start_time and first['time'] is None:
+                first['time'] = token
+            if (end_date or end_time) and first['range'] is None:
+                first['range'] = token
+        elif token.kind == 'location':
+            if first['location'] is None and token.value:
+                first['location'] = token
+        elif token.kind == 'exclude':
+            exdates.extend(token.value)
+        elif first[_SUMMARY_FIELDS[token.kind]] is None:
+            first[_SUMMARY_FIELDS[token.kind]] = token
+    if first['date'] is None:
+        first['date'] = weak_date
+    return Extraction(tokens, exdates=tuple(exdates), **first)
+
+
+def _anchor_parts(token):
+    """日時トークンが日付・時刻・繰り返しを持つかどうか。イベントの区切りの目印にならないトークンは (False, False, False)。"""
+    if token.kind == 'recur':
+        return False, False, True
+    if token.kind != 'when':
+        return False, False, False
+    start_date, _, start_time, _ = token.value
+    # 単独の「来週」などは区切りの目印にしない
+    return bool(start_date and start_date[0] != 'week'), bool(start_time), False
+
+
+def _trim_span(text_content, start, end):
+    """イベントの範囲の前後の区切り文字と空白を除いた (start, end) を返します。タイトルや説明に「、」などを残さないため。"""
+    while start < end and (text_content[start] in _SEGMENT_TRIM or text_content[start].isspace()):
+        start += 1
+    while end > start and (text_content[end - 1] in _SEGMENT_TRIM or text_content[end - 1].isspace()):
+        end -= 1
+    return start, end
+
+
+def _last_separator(text_content, start, end):
+    return max(text_content.rfind(separator, start, end) for separator in _SEGMENT_SEPARATORS)
+
+
+def segment_events(text_content, extraction=None):
+    """
+    テキストを日時トークン (アンカー) ごとのイベントの範囲 (start, end) に分割します。
+    アンカーの間のテキストは最後の区切り文字 (改行・読点など) までを前のイベント、
+    それより後ろを次のイベントに付けます。区切り文字がなければ前のイベントに付けます。
+    「7/1 会議 10時から」のように日付だけと時刻だけのアンカーが区切りなしで続く場合は一つのイベントにします。
+    繰り返し (毎週月曜など) も区切りなしで続く日付・時刻と一つのイベントにし、
+    「毎年 7/7 七夕」「7/1から毎週月曜 10:00」の日付はその繰り返しの開始日になります。
+    """
+    if extraction is None:
+        extraction = extract_tokens(text_content)
+    bounds = []
+    has_date = has_time = has_recur = False
+    previous = None
+    for token in extraction.tokens:
+        anchor_date, anchor_time, anchor_recur = _anchor_parts(token)
+        if not (anchor_date or anchor_time or anchor_recur):
+            continue
+        if previous is not None:
+            cut = _last_separator(text_content, previous.end, token.start)
+            if cut >= 0:
+                boundary = cut + 1
+            elif (
+                (has_date and anchor_date) or (has_time and anchor_time)
+                # 日付と時刻のそろった予定の後ろの繰り返しは別の予定
+                or (anchor_recur and (has_recur or (has_date and has_time)))
+            ):
+                boundary = token.start
+            else:
+                boundary = None
+            if boundary is not None:
+                bounds.append(boundary)
+                has_date = has_time = has_recur = False
+        has_date = has_date or anchor_date
+        has_time = has_time or anchor_time
+        has_recur = has_recur or anchor_recur
+        previous = token
+    return list(zip([0] + bounds, bounds + [len(text_content)]))
+
+
+def _strip_tokens(text_content, tokens, kinds=_DATETIME_KINDS):
+    """指定した種類のトークンの範囲をテキストから取り除きます。"""
+    pieces = []
+    position = 0
+    for token in tokens:
+        if token.kind in kinds:
+            pieces.append(text_content[position:token.start])
+            position = token.end
+    pieces.append(text_content[position:])
+    return ''.join(pieces)
+
+
+def parse_event_from_text(text_content, batch=False, split='auto', tz=None, reference=None, clock=None):
+    """
+    テキストからイベント情報を解析し ParsedEvent (title, start_dt, duration, description, location) を返します。
+    日時は tz (ゾーン名。省略時は DEFAULT_TIMEZONE) のタイムゾーン付きで返します。
+    「明日」や時刻だけの指定は reference (基準時刻。省略時は clock の現在時刻) を基準に解釈します。
+    batch=True の場合は split に従ってテキストを分割し、イベントごとの ParsedEvent のリストを返します。
+    """
+    if batch:
+        from .bulk_parse import split_event_chunks
+        return parse_events(split_event_chunks(text_content, split), tz=tz, reference=reference, clock=clock)
+    return _parse_single_event(text_content, reference_time(reference, tz, clock))
+
+
+def parse_events(texts, workers=None, chunk_size=None, tz=None, reference=None, clock=None):
+    """
+    分割済みのイベントテキストを同じ基準時刻で解析し、入力順の ParsedEvent のリストを返します。
+    件数が多い場合は bulk_parse がプロセスプールに分散します。
+    """
+    return list(iter_parse_events(list(texts), workers, chunk_size, tz, reference, clock))
+
+
+def iter_parse_events(texts, workers=None, chunk_size=None, tz=None, reference=None, clock=None):
+    """parse_events のジェネレーター版。解析できたものから入力順に返します。"""
+    from .bulk_parse import iter_bulk_parse
+    now = reference_time(reference, tz, clock)
+    return iter_bulk_parse(texts, partial(_parse_single_event, now=now), workers=workers, chunk_size=chunk_size)
+
+
+def iter_parse_records(records, workers=None, chunk_size=None, tz=None, reference=None, clock=None):
+    """
+    ファイルから読んだレコード (チャットの発言・CSV の行・メール1通など) を解析し、
+    含まれる予定を入力順に1件ずつ返すジェネレーター。
+    レコードは文字列か FieldRecord で、FieldRecord はタイトルや場所の列を解析せずにそのまま使います。
+    1つのレコードに複数の予定があれば parse_events_from_text と同じように分け、
+    日時を含まないレコード (雑談の行など) からはイベントを作りません。
+    """
+    from .bulk_parse import iter_bulk_parse
+    now = reference_time(reference, tz, clock)
+    results = iter_bulk_parse(records, partial(_parse_record, now=now), workers=workers, chunk_size=chunk_size)
+    for parsed_events in results:
+        yield from parsed_events
+
+
+def parse_events_from_text(text_content, tz=None, reference=None, clock=None):
+    """
+    一つのテキスト (メールやチャットの文面など) に含まれる複数の予定を ParsedEvent のリストで返します。
+    「7/1 10:00 会議、7/3 14:00 打ち合わせ@本社」なら2件。日時が一つ以下なら1件です。
+    テキストの走査は一回だけで、分割した範囲ごとに解析をやり直すことはしません。
+    """
+    return _parse_segments(text_content, reference_time(reference, tz, clock))
+
+
+def _lap(stage, started):
+    """前の区切りからの経過時間をステージの所要時間として記録し、現在の時刻を返します。"""
+    now = perf_counter()
+    observe_stage(now - started, stage)
+    return now
+
+
+def _parse_segments(text_content, now, extraction=None):
+    started = perf_counter()
+    if extraction is None:
+        extraction = extract_tokens(text_content)
+        started = _lap('extract', started)
+    spans = segment_events(text_content, extraction)
+    _lap('segment', started)
+    if len(spans) == 1:
+        return [_build_event(text_content, extraction, now)]
+
+    parsed_events = []
+    tokens = extraction.tokens
+    index = 0
+    base_date = None
+    for start, end in spans:
+        start, end = _trim_span(text_content, start, end)
+        span_tokens = []
+        while index < len(tokens) and tokens[index].start < end:
+            token = tokens[index]
+            value = token.value
+            if token.kind == 'location':
+                # 場所は行末かこのイベントの範囲の終わりまで
+                line_end = text_content.find('\n', token.end, end)
+                value = text_content[token.end:line_end if line_end >= 0 else end].strip().rstrip(''.join(_SEGMENT_SEPARATORS))
+            span_tokens.append(Token(token.kind, token.start - start, token.end - start, value))
+            index += 1
+        parsed = _build_event(text_content[start:end], _summarize(span_tokens), now, base_date)
+        parsed_events.append(parsed)
+        base_date = parsed.start_dt.date()
+    return parsed_events
+
+
+def _parse_record(record, now):
+    fields = record if isinstance(record, FieldRecord) else FieldRecord(record)
+    started = perf_counter()
+    extraction = extract_tokens(fields.text)
+    _lap('extract', started)
+    if extraction.date is None and extraction.time is None and extraction.recurrence is None:
+        return []
+    parsed_events = _parse_segments(fields.text, now, extraction)
+    overrides = {name: value for name, value in zip(FieldRecord._fields[1:], fields[1:]) if value}
+    if overrides:
+        parsed_events = [parsed._replace(**overrides) for parsed in parsed_events]
+    return parsed_events
+
+
+def _parse_single_event(text_content, now):
+    started = perf_counter()
+    extraction = extract_tokens(text_content)
+    _lap('extract', started)
+    return _build_event(text_content, extraction, now)
+
+
+def _build_event(text_content, extraction, now, base_date=None):
+    """
+    抽出結果から ParsedEvent を組み立てます。
+    base_date は同じテキスト内の直前のイベントの日付で、日付の指定がない場合に引き継ぎます。
+    """
+    title = "新しいカレンダーイベント"
+    location = ""
+    duration = None # 新しくdurationを追加
+
+    # デフォルトの開始日時を、現在の日付の午前9時に設定
+    # もし現在時刻が午前9時を過ぎていたら、翌日の午前9時にする
+    default_start_dt = now.replace(hour=9, minute=0, second=0, microsecond=0)
+    if now.hour >= 9:
+        default_start_dt += datetime.timedelta(days=1)
+    
+    start_dt = default_start_dt # 初期値を設定
+    started = perf_counter() # 各ステージの所要時間を metrics に記録する
+
+    # --- 1. 日付の解析 ---
+    # 最初に見つかった日付 (YYYY/MM/DD, MM/DD, YYYY年MM月DD日, 明日, 来週月曜日 など) を採用
+    start_date = None
+    if extraction.date:
+        start_date = resolve_date(extraction.date.value[0], now)
+    elif base_date:
+        # 「7/1 10:00 会議、14:00 打ち合わせ」の2件目は1件目の日付を引き継ぐ
+        start_date = base_date
+    if start_date:
+        start_dt = start_dt.replace(year=start_date.year, month=start_date.month, day=start_date.day)
+    started = _lap('date', started)
+
+    # --- 2. 時刻の解析 ---
+    if extraction.time:
+        hour, minute, _ = extraction.time.value[2]
+        # 時刻が見つかった場合は、解析された時刻でstart_dtの時刻部分を更新
+        start_dt = start_dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+        # 日付の指定がなく、解析された日時が現在時刻より過去で、かつ日付が今日の場合、翌日にする
+        # (例: テキストに「9時」とだけあり、現在が10時の場合、翌日の9時にする)
+        if not start_date and start_dt < now and start_dt.date() == now.date():
+            start_dt += datetime.timedelta(days=1)
+        # 「金曜 7:00」で今日が金曜の8時なら、来週の金曜にする
+        elif extraction.date and extraction.date.value[0][:2] == ('weekday', None) and start_dt < now:
+            start_dt += datetime.timedelta(weeks=1)
+    started = _lap('time', started)
+
+    # --- 3. 期間の解析 (duration) ---
+    # 例: "7/1~7/2 10:00~12:00", "10時から12時まで" (同日内), "7/1〜7/2" (終日イベント)
+    if extraction.range:
+        _, end_date_spec, _, end_time = extraction.range.value
+        end_dt = start_dt
+        end_date = resolve_date(end_date_spec, now, default_year=start_dt.year) if end_date_spec else None
+        if end_date:
+            end_dt = end_dt.replace(year=end_date.year, month=end_date.month, day=end_date.day)
+        if end_time:
+            end_dt = end_dt.replace(hour=end_time[0], minute=end_time[1], second=0, microsecond=0)
+        else:
+            end_dt = end_dt.replace(hour=23, minute=59, second=59) # 終日の場合、終了日の終わりに設定
+        if end_dt < start_dt:
+            if end_date and end_date_spec[0] == 'abs' and end_date_spec[1] is None:
+                end_dt = end_dt.replace(year=start_dt.year + 1) # 12/30~1/2 のような年またぎ
+            elif not end_date: # 例: 22:00~01:00 の場合
+                end_dt += datetime.timedelta(days=1)
+        if end_date or end_time:
+            duration = format_duration(int((end_dt - start_dt).total_seconds()))
+    started = _lap('range', started)
+
+    # 4. タイトルの解析 (最も重要な情報)
+    # 抽出済みの日時トークンの範囲を取り除いてからタイトルを抽出
+    cleaned_text_for_title = _strip_tokens(text_content, extraction.tokens).strip()
+
+    # 句読点や不要な記号を削除（オプション、よりタイトルをきれいにしたい場合）
+    cleaned_text_for_title = _TITLE_PUNCT_RE.sub('', cleaned_text_for_title).strip()
+
+
+    title_keywords = ["会議", "打ち合わせ", "ミーティング", "予約", "イベント", "リマインダー", "予定", "休み"] # 「休み」も追加
+    found_title_from_keyword = False
+    for keyword in title_keywords:
+        if keyword in cleaned_text_for_title:
+            # キーワードより前の部分をタイトルにする（ただし、既にクリーンアップされているはずなので、キーワードを含む部分を直接利用）
+            title_candidate = cleaned_text_for_title
+            
+            # キーワードが複数回含まれる場合もあるが、最初のキーワードに注目
+            parts = title_candidate.split(keyword, 1)
+            if parts[0].strip():
+                # キーワードより前のテキストがあれば、それをタイトルにし、キーワードは含まない
+                title = parts[0].strip()
+            else:
+                # キーワードが先頭にあるか、キーワードのみの場合
+                title = keyword # キーワード自体をタイトルにする
+            
+            # もしキーワードが「夏休み」のように複合語の一部なら、その複合語全体を拾うロジックも必要
+            # 一旦、シンプルにキーワードが見つかったら、残りのテキストからキーワードを削除したものをタイトルとする
+            final_title = cleaned_text_for_title.replace(keyword, '').strip()
+            if final_title:
+                title = final_title
+            else:
+                title = keyword # 日時情報以外に何も残らなかったらキーワード自体をタイトルに
+
+            # ただし、「夏休み」のような場合は「夏休み」自体がタイトル
+            # ここはもっとスマートにする必要がある
+            # シンプルに「夏休み」のようなキーワードが見つかったらそれをタイトルにする
+            if keyword in ["夏休み", "冬休み", "春休み", "連休"]: # 例外的にキーワード自体がタイトルになるケース
+                title = keyword
+            elif final_title:
+                title = final_title
+            else:
+                title = text_content.replace('\n', ' ').strip()[:100] # 最悪元のテキストから
+
+            found_title_from_keyword = True
+            break
+    
+    if not found_title_from_keyword:
+        # 日時情報などを取り除いた残りのテキストをタイトルにする
+        # cleaned_text_for_title は既に日時情報をかなり取り除いているはず
+        cleaned_text = cleaned_text_for_title.replace('\n', ' ').strip()
+        if cleaned_text:
+            title = cleaned_text[:100] + '...' if len(cleaned_text) > 100 else cleaned_text
+        else:
+            title = "クリップボードからのイベント" # 何も残らなかった場合
+    started = _lap('title', started)
+
+    # 5. 説明 (残りのテキスト全て、または特定の情報)
+    description = text_content # 全体を説明とする
+
+    # 6. 場所の解析 (例: "場所：〇〇", "@〇〇" など)
+    if extraction.location:
+        location = extraction.location.value
+    started = _lap('location', started)
+
+    # --- 7. 繰り返しの解析 (毎週月曜, 毎月第2水曜, 7/31まで, 10回, 7/15を除く など) ---
+    recurrence = None
+    exdates = ()
+    if extraction.recurrence:
+        recurrence, start_dt, exdates = _resolve_recurrence(extraction, start_dt, start_date, now)
+    _lap('recurrence', started)
+
+    return ParsedEvent(title, start_dt, duration, description, location, recurrence, exdates)
+
+
+def _resolve_recurrence(extraction, start_dt, start_date, now):
+    """繰り返しの指定から Recurrence・最初の回の開始日時・除外する開始日時を求めます。"""
+    from .recurrence import first_occurrence
+
+    freq, interval, byday, bymonthday = extraction.recurrence.value
+    recurrence = Recurrence(freq, interval, byday, bymonthday)
+    if start_date is None:
+        # 日付の指定がなければ、今日から数えて最初の回を開始日にする
+        start_dt = start_dt.replace(year=now.year, month=now.month, day=now.day)
+        start_dt = first_occurrence(recurrence, start_dt, now)
+    else:
+        start_dt = first_occurrence(recurrence, start_dt, start_dt)
+
+    def on_or_after_start(spec):
+        day = resolve_date(spec, now, default_year=start_dt.year)
+        if day and day < start_dt.date() and spec[1] is None:
+            day = resolve_date(spec, now, default_year=start_dt.year + 1) # 12月開始で「1/10まで」など
+        return day
+
+    if extraction.until:
+        until_date = on_or_after_start(extraction.until.value[0])
+        if until_date:
+            # RFC 5545: DTSTART がタイムゾーン付きなら UNTIL は UTC で書く
+            until = datetime.datetime.combine(until_date, datetime.time(23, 59, 59), tzinfo=start_dt.tzinfo)
+            if until.tzinfo is not None:
+                until = until.astimezone(datetime.timezone.utc)
+            recurrence = recurrence._replace(until=until)
+    if extraction.count:
+        recurrence = recurrence._replace(count=extraction.count.value)
+
+    exdates = []
+    for spec in extraction.exdates:
+        day = on_or_after_start(spec)
+        if day:
+            exdates.append(start_dt.replace(year=day.year, month=day.month, day=day.day))
+    return recurrence, start_dt, tuple(exdates)
@@ -0,0 +1,76 @@
+"""
+繰り返しの予定 (RRULE) の展開。
+
+.ics には RRULE / EXDATE 付きの VEVENT を1件だけ書き出しますが、
+画面表示や集計のために各回を知りたい場合は iter_occurrences で必要な期間だけ順に取り出せます。
+展開には dateutil.rrule を使います。
+"""
+import datetime
+
+from dateutil import rrule
+
+_FREQUENCIES = {
+    'DAILY': rrule.DAILY,
+    'WEEKLY': rrule.WEEKLY,
+    'MONTHLY': rrule.MONTHLY,
+    'YEARLY': rrule.YEARLY,
+}
+_WEEKDAYS = {'MO': rrule.MO, 'TU': rrule.TU, 'WE': rrule.WE, 'TH': rrule.TH, 'FR': rrule.FR, 'SA': rrule.SA, 'SU': rrule.SU}
+
+
+def _byweekday(byday):
+    # '2WE' -> WE(+2), 'MO' -> MO
+    return [_WEEKDAYS[code[-2:]](int(code[:-2])) if code[:-2] else _WEEKDAYS[code] for code in byday] or None
+
+
+def to_rrule(recurrence, start_dt):
+    """Recurrence を start_dt から始まる dateutil の rrule にします。"""
+    until = recurrence.until
+    if until is not None and not isinstance(until, datetime.datetime):
+        until = datetime.datetime.combine(until, datetime.time(23, 59, 59))
+    if until is not None:
+        # dateutil は UNTIL と DTSTART のタイムゾーンの有無がそろっている必要がある
+        if isinstance(start_dt, datetime.datetime) and start_dt.tzinfo is not None:
+            until = until.replace(tzinfo=until.tzinfo or start_dt.tzinfo)
+        else:
+            until = until.replace(tzinfo=None)
+    return rrule.rrule(
+        _FREQUENCIES[recurrence.freq],
+        dtstart=start_dt,
+        interval=recurrence.interval,
+        byweekday=_byweekday(recurrence.byday),
+        bymonthday=list(recurrence.bymonthday) or None,
+        until=until,
+        count=recurrence.count,
+    )
+
+
+def first_occurrence(recurrence, start_dt, after):
+    """
+    start_dt の時刻で、after 以降の最初の回の開始日時を返します。
+    (「毎月第2水曜」の DTSTART を実際の第2水曜にそろえるため) 該当する回がなければ start_dt のまま。
+    """
+    occurrence = to_rrule(recurrence._replace(until=None, count=None), start_dt).after(after, inc=True)
+    return occurrence or start_dt
+
+
+def iter_occurrences(parsed_event, window_start=None, window_end=None):
+    """
+    繰り返しの予定の各回を、開始日時をずらした ParsedEvent (recurrence なし) として順に返すジェネレーター。
+    window_start / window_end で期間を絞れます。終わりのない規則でも必要な分だけ生成します。
+    繰り返しでない予定はそれ自体を (期間内なら) 1件だけ返します。
+    """
+    if not parsed_event.recurrence:
+        occurrences = iter([parsed_event.start_dt])
+    else:
+        rules = rrule.rruleset()
+        rules.rrule(to_rrule(parsed_event.recurrence, parsed_event.start_dt))
+        for exdate in parsed_event.exdates:
+            rules.exdate(exdate)
+        occurrences = rules.xafter(window_start, inc=True) if window_start is not None else iter(rules)
+    for start_dt in occurrences:
+        if window_start is not None and start_dt < window_start:
+            continue
+        if window_end is not None and start_dt > window_end:
+            break
+        yield parsed_event._replace(start_dt=start_dt, recurrence=None, exdates=())
@@ -0,0 +1,35 @@
+"""
+解析キャッシュ・フィードのストア・出力済みイベントの索引が共有する SQLite 接続。
+
+sqlite3 の接続はスレッド間で共有できないため、スレッドごとに接続を作ります。
+gunicorn の preload などで fork された場合は、親プロセスの接続を使わずに作り直します。
+sqlite3 は SQLite のバックエンドを使うときだけ読み込みます。
+"""
+import os
+import threading
+
+
+class ThreadLocalConnection:
+    """
+    スレッドごと (fork 後はプロセスごとにも) の SQLite 接続。get() で現在のスレッドの接続を返します。
+    options は sqlite3.connect にそのまま渡します (isolation_level=None など)。接続は WAL モードにします。
+    """
+
+    def __init__(self, path, timeout=5, **options):
+        self.path = path
+        self.options = dict(options, timeout=timeout)
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def get(self):
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, **self.options)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
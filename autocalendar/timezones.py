@@ -0,0 +1,74 @@
+"""
+タイムゾーンの解決と VTIMEZONE ブロックのキャッシュ。
+
+zoneinfo のゾーンデータ (requirements の tzdata) を使います。
+同じゾーンは何度も使われるので、ゾーンの解決と VTIMEZONE の生成はゾーンごとに一度だけ行います。
+"""
+import datetime
+import functools
+import os
+import zoneinfo
+
+# ユーザーの大半は日本にいるので、指定がなければ日本時間で解釈する
+DEFAULT_TIMEZONE = os.environ.get('AUTOCAL_TIMEZONE', 'Asia/Tokyo')
+
+# よく使われる略称
+_ALIASES = {
+    'JST': 'Asia/Tokyo',
+    'UTC': 'UTC',
+    'GMT': 'UTC',
+    'Z': 'UTC',
+}
+
+
+def resolve_zone(name=None):
+    """
+    タイムゾーン名 (Asia/Tokyo, JST など) を tzinfo にします。None なら DEFAULT_TIMEZONE。
+    不明な名前の場合は ValueError を送出します。
+    """
+    # リクエストから来た名前の空白や略称の大文字小文字の違いでキャッシュが増えないように、正規化してから引く
+    name = (name or DEFAULT_TIMEZONE).strip()
+    return _resolve_zone(_ALIASES.get(name.upper(), name))
+
+
+# 正規化した名前ごとのキャッシュ。有効なゾーンは数百なので、それを十分に収める大きさで上限を設ける
+@functools.lru_cache(maxsize=1024)
+def _resolve_zone(name):
+    if name == 'UTC':
+        return datetime.timezone.utc
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"不明なタイムゾーンです: {name}") from None
+
+
+def zone_key(tzinfo):
+    """VTIMEZONE / TZID に使うゾーン名。UTC やゾーン名を持たない tzinfo の場合は None。"""
+    if tzinfo is None or tzinfo is datetime.timezone.utc:
+        return None
+    key = getattr(tzinfo, 'key', None)
+    return None if key == 'UTC' else key
+
+
+@functools.lru_cache(maxsize=None)
+def vtimezone_component(key):
+    """ゾーン名に対応する icalendar の VTIMEZONE コンポーネント (ゾーンごとに一度だけ生成)。"""
+    from icalendar import Timezone
+
+    return Timezone.from_tzid(key)
+
+
+@functools.lru_cache(maxsize=None)
+def vtimezone_ical(key):
+    """ゾーン名に対応する VTIMEZONE ブロックの bytes (ゾーンごとに一度だけ生成)。"""
+    return vtimezone_component(key).to_ical()
+
+
+def event_zone_keys(parsed_event):
+    """イベントが参照する TZID を出現順に返します。"""
+    keys = []
+    for value in (parsed_event.start_dt, parsed_event.end_dt):
+        key = zone_key(getattr(value, 'tzinfo', None))
+        if key and key not in keys:
+            keys.append(key)
+    return keys
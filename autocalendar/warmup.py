@@ -0,0 +1,34 @@
+"""
+サーバー起動時のウォームアップ。
+
+gunicorn の preload_app では、ワーカーを fork する前にマスタープロセスでこれを呼びます。
+遅延読み込みしているモジュール (icalendar・dateutil.rrule)、ゾーンデータと VTIMEZONE、
+文法のデコード結果のキャッシュをここで作っておくと、各ワーカーは fork 後に
+それらを作り直さずに済み、メモリもコピーオンライトで共有されます。
+"""
+from .ics import build_event, calendar_to_ical
+from .parser import parse_events_from_text
+from .timezones import resolve_zone
+
+# よく使われる書き方 (日付・時刻・範囲・場所・繰り返し) を一通り含む文面
+_SAMPLES = (
+    '7/1 10:00~12:00 定例会議@本社',
+    '2025年9月1日 10:00 キックオフ会議 @オンライン',
+    '明日10時 歯医者の予約',
+    '来週月曜日10:30からオンラインミーティング',
+    '午後3時 電話会議、午前10時半 美容院の予約',
+    '８／１０~８／１５ 夏休み',
+    '毎週月曜10:00 定例会議 7/31まで 7/14を除く',
+    '毎月第2水曜 19時 読書会 全10回',
+)
+
+
+def warm_up(tz=None):
+    """文法・タイムゾーン・iCal の生成を一通り実行します。解析したイベントの件数を返します。"""
+    resolve_zone(tz)
+    parsed_events = []
+    for text in _SAMPLES:
+        parsed_events.extend(parse_events_from_text(text, tz=tz))
+    calendar_to_ical(parsed_events) # VTIMEZONE の生成 (icalendar の読み込み) もここで行われる
+    build_event(parsed_events[0])
+    return len(parsed_events)
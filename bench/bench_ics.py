@@ -0,0 +1,122 @@
+"""
+軽量 iCal ライター (autocalendar.ics_writer) の適合性チェックと速度比較。
+
+    python bench/bench_ics.py              # 適合性チェック + 速度比較
+    python bench/bench_ics.py --check      # 適合性チェックのみ (不一致があれば終了コード1)
+
+コーパスの各イベントに加えて、タイムゾーン付き・長文 (折り返し)・特殊文字・UID 付きのケースについて、
+icalendar の to_ical() とバイト単位で一致するかを確認します。
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import zoneinfo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_parser import load_corpus # noqa: E402
+
+
+def conformance_events():
+    """コーパスを解析したイベントと、境界ケースのイベントを返します。"""
+    from autocalendar import ParsedEvent, parse_event_from_text
+    from autocalendar.event_index import with_identity
+    from autocalendar.model import Recurrence
+
+    now, events = load_corpus()
+    parsed_events = [parse_event_from_text(event['text'], reference=now) for event in events]
+    parsed_events += [
+        parse_event_from_text(text, reference=now)
+        for text in ('毎週月・水曜 18:00~19:00 ジム 7/31まで 7/2・7/9を除く', '毎月第2水曜 19時 読書会', '平日 9:30 朝会 全10回')
+    ]
+
+    start = datetime.datetime(2025, 7, 1, 10, 0)
+    variants = [
+        ParsedEvent('UTC', start.replace(tzinfo=datetime.timezone.utc), '1h', 'utc', ''),
+        ParsedEvent('UTC zone', start.replace(tzinfo=zoneinfo.ZoneInfo('UTC')), None, 'utc', ''),
+        ParsedEvent('東京', start.replace(tzinfo=zoneinfo.ZoneInfo('Asia/Tokyo')), '2h30m', '東京', '本社'),
+        ParsedEvent('NY', start.replace(tzinfo=zoneinfo.ZoneInfo('America/New_York')), '1d', 'ny', ''),
+        ParsedEvent('長い説明', start, None, 'あいうえお、かきくけこ;さしすせそ\\たちつてと' * 8, ''),
+        ParsedEvent('a,b;c\\d', start, '45m', 'line1\r\nline2\rline3\nline4 \\N', 'x' * 200),
+        ParsedEvent('終日', datetime.date(2025, 7, 1), None, 'date only', ''),
+        ParsedEvent('\\' * 80, start, None, '^' * 80, '\\,' * 50),
+        ParsedEvent('毎月末', start, None, 'rrule', '', Recurrence('MONTHLY', 2, (), (-1,), start + datetime.timedelta(days=90), None)),
+        ParsedEvent('毎年', datetime.date(2025, 7, 1), None, 'rrule', '', Recurrence('YEARLY', count=3),
+                    (datetime.date(2026, 7, 1), datetime.date(2027, 7, 1))),
+        ParsedEvent('NY 毎週', start.replace(tzinfo=zoneinfo.ZoneInfo('America/New_York')), None, 'rrule', '',
+                    Recurrence('WEEKLY', byday=('-1FR', 'SU')), (start.replace(day=4, tzinfo=zoneinfo.ZoneInfo('America/New_York')),)),
+    ]
+    # UID・SEQUENCE・DTSTAMP 付き (索引を通したイベント)
+    dtstamp = datetime.datetime(2025, 6, 30, 0, 0, tzinfo=datetime.timezone.utc)
+    variants += [
+        with_identity(variants[0], dtstamp=dtstamp),
+        with_identity(variants[2], user_key='feed', dtstamp=dtstamp)._replace(sequence=3),
+        variants[5]._replace(uid='a,b;c@example.com', sequence=12, dtstamp=dtstamp),
+        with_identity(variants[9], dtstamp=dtstamp)._replace(sequence=1),
+    ]
+    return parsed_events + variants
+
+
+def check_conformance(parsed_events):
+    """一致しなかったイベントのリスト (イベント, 軽量ライター出力, icalendar 出力) を返します。"""
+    from autocalendar import ics, ics_writer
+
+    mismatches = []
+    for parsed_event in parsed_events:
+        if not ics_writer.is_simple(parsed_event):
+            continue
+        fast = ics_writer.event_to_ical(parsed_event)
+        reference = ics.build_event(parsed_event).to_ical()
+        if fast != reference:
+            mismatches.append((parsed_event, fast, reference))
+    fast_calendar = ics.calendar_to_ical(parsed_events)
+    reference_calendar = ics.build_calendar(parsed_events).to_ical()
+    if fast_calendar != reference_calendar:
+        mismatches.append(('<calendar>', fast_calendar, reference_calendar))
+    return mismatches
+
+
+def bench_serializers(parsed_events, iterations):
+    from autocalendar import ics
+
+    results = {}
+    for name, serialize in (
+        ('ics_writer', lambda: ics.calendar_to_ical(parsed_events)),
+        ('icalendar', lambda: ics.build_calendar(parsed_events).to_ical()),
+    ):
+        serialize()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            serialize()
+        elapsed = time.perf_counter() - started
+        results[name] = iterations * len(parsed_events) / elapsed
+    return results
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--check', action='store_true', help="適合性チェックのみ行う")
+    arg_parser.add_argument('-n', '--iterations', type=int, default=200)
+    args = arg_parser.parse_args(argv)
+
+    parsed_events = conformance_events()
+    mismatches = check_conformance(parsed_events)
+    print(f"conformance: {len(parsed_events) - len(mismatches)}/{len(parsed_events)} match icalendar byte-for-byte")
+    for parsed_event, fast, reference in mismatches:
+        print(f"  x {getattr(parsed_event, 'title', parsed_event)!r}")
+        print(f"    ics_writer: {fast!r}")
+        print(f"    icalendar:  {reference!r}")
+    if args.check:
+        return 1 if mismatches else 0
+
+    for name, per_second in bench_serializers(parsed_events, args.iterations).items():
+        print(f"[{name}] {per_second:.0f} events/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+ファイル取り込み (autocalendar.file_import) のスループットとメモリ使用量を計測するベンチマーク。
+
+    python bench/bench_import.py --megabytes 20
+    python bench/bench_import.py --megabytes 50 --workers 4 --json
+
+corpus.json の文面と雑談の行を混ぜたチャットログ (.txt)、CSV、メールボックス (.mbox)、既存の .ics を
+一時ディレクトリに作り、1つのカレンダーに結合したときのレコード/秒と最大 RSS の増え方を出力します。
+入力を大きくしても最大 RSS がほとんど増えなければ、メモリ使用量は入力の大きさに依存していません。
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+
+from bench_parser import load_corpus
+
+from autocalendar.file_import import DEFAULT_MMAP_THRESHOLD, detect_format, import_to_file
+from autocalendar.ics import calendar_to_ical
+
+_CHATTER = ('おはようございます', '了解です', 'ありがとうございます！', '資料を共有しました', '確認します')
+
+
+def _write_until(path, target_bytes, lines, header=''):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(header)
+        written = len(header.encode('utf-8'))
+        index = 0
+        while written < target_bytes:
+            line = lines[index % len(lines)]
+            f.write(line)
+            written += len(line.encode('utf-8'))
+            index += 1
+
+
+def make_inputs(directory, megabytes, now, events):
+    """形式ごとに megabytes / 3 MB ずつの入力と、小さな既存の .ics を作り、パスのリストを返します。"""
+    target = int(megabytes * 1024 * 1024 / 3)
+    texts = [' '.join(event['text'].split()) for event in events]
+
+    chat = []
+    for index, text in enumerate(texts):
+        chat.append(f"[{9 + index % 9:02d}:{index % 60:02d}] 佐藤: {_CHATTER[index % len(_CHATTER)]}\n")
+        chat.append(f"[{9 + index % 9:02d}:{index % 60:02d}] 田中: {text}\n")
+    paths = [os.path.join(directory, 'chat.txt')]
+    _write_until(paths[-1], target, chat)
+
+    rows = [f'"{text.replace(chr(34), chr(34) * 2)}"\n' for text in texts]
+    paths.append(os.path.join(directory, 'events.csv'))
+    _write_until(paths[-1], target, rows, header='text\n')
+
+    mails = [
+        f"From bench@example.com Mon Jun 30 10:00:00 2025\nSubject: ご案内 {index}\n"
+        f"Content-Type: text/plain; charset=utf-8\n\n{text}\nよろしくお願いします。\n\n"
+        for index, text in enumerate(texts)
+    ]
+    paths.append(os.path.join(directory, 'mail.mbox'))
+    _write_until(paths[-1], target, mails)
+
+    from autocalendar import parse_events
+    paths.append(os.path.join(directory, 'existing.ics'))
+    with open(paths[-1], 'wb') as f:
+        f.write(calendar_to_ical(parse_events(texts, reference=now)))
+    return paths
+
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--megabytes', type=float, default=20, help="入力ファイルの合計サイズ (MB)")
+    arg_parser.add_argument('--workers', type=int, help="解析のワーカープロセス数 (AUTOCAL_PARSE_WORKERS)")
+    arg_parser.add_argument('--mmap-threshold', type=int, default=DEFAULT_MMAP_THRESHOLD,
+                            help="これ以上のファイルはメモリマップで読む (バイト)")
+    arg_parser.add_argument('--json', action='store_true', help="結果を JSON で出力する")
+    args = arg_parser.parse_args(argv)
+
+    now, events = load_corpus()
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_inputs(directory, args.megabytes, now, events)
+        input_bytes = sum(os.path.getsize(path) for path in paths)
+        rss_before = _max_rss_mb()
+        output = os.path.join(directory, 'merged.ics')
+        stats = import_to_file([(path, detect_format(path)) for path in paths], output, reference=now,
+                               workers=args.workers, mmap_threshold=args.mmap_threshold)
+        result = {
+            **stats.as_dict(),
+            'input_mb': input_bytes / 1024 / 1024,
+            'output_mb': os.path.getsize(output) / 1024 / 1024,
+            'input_mb_per_second': input_bytes / 1024 / 1024 / stats.elapsed if stats.elapsed else 0.0,
+            'max_rss_mb': _max_rss_mb(),
+            'max_rss_growth_mb': _max_rss_mb() - rss_before,
+        }
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print(f"入力 {result['input_mb']:.1f} MB -> 出力 {result['output_mb']:.1f} MB ({result['elapsed']:.1f} 秒)")
+    print(f"  {result['records']} レコード -> {result['events']} イベント (重複 {result['duplicates']} 件)")
+    print(f"  {result['records_per_second']:.0f} レコード/秒   {result['input_mb_per_second']:.2f} MB/秒")
+    print(f"  最大 RSS {result['max_rss_mb']:.0f} MB (取り込み中の増加 {result['max_rss_growth_mb']:.1f} MB)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+parse_event_from_text の速度・精度と /generate_ical の HTTP 経路を計測するベンチマーク。
+
+    python bench/bench_parser.py -n 200
+    python bench/bench_parser.py --http --requests 2000
+    python bench/bench_parser.py --json > bench_output.txt
+    python bench/bench_parser.py --worst-case 200000   # 病的な入力の時間の伸びだけを確認
+
+corpus.json の "now" を基準時刻として渡すので、結果は実行日時に依存しません。
+精度は corpus.json のラベル (title / start / end / location) との一致率です。
+start / end のラベルが日付のみ ("2025-08-10") の場合は日付だけを比較します。
+病的な入力 (長い日付の列・空白の連続など) では、長さを4倍にしたときの解析時間の伸びを確認し、
+二乗時間のような伸び方をしたら終了コード1で終わります。
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.json')
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        corpus = json.load(f)
+    return datetime.datetime.fromisoformat(corpus['now']), corpus['events']
+
+
+def _autocalendar_parser(now):
+    from autocalendar import parse_event_from_text
+
+    def parse(text):
+        parsed = parse_event_from_text(text, reference=now)
+        end_dt = parsed.end_dt if parsed.duration else None
+        return parsed.title, parsed.start_dt, end_dt, parsed.location
+
+    return parse
+
+
+PARSERS = {'autocalendar': _autocalendar_parser}
+
+
+def _same_time(label, value):
+    if label is None:
+        return value is None
+    if value is None:
+        return False
+    if len(label) == 10:
+        return value.date().isoformat() == label
+    return value.strftime('%Y-%m-%dT%H:%M') == label
+
+
+def score(parse, events):
+    """フィールドごとの正解数と、誤りのあった入力を返します。"""
+    correct = {'title': 0, 'start': 0, 'end': 0, 'location': 0}
+    totals = dict.fromkeys(correct, 0)
+    misses = []
+    for event in events:
+        title, start_dt, end_dt, location = parse(event['text'])
+        results = {
+            'title': title == event['title'],
+            'start': _same_time(event['start'], start_dt),
+            'location': location == event['location'],
+        }
+        results['end'] = _same_time(event['end'], end_dt)
+        for field, ok in results.items():
+            totals[field] += 1
+            correct[field] += ok
+        if not all(results.values()):
+            misses.append({'text': event['text'], 'wrong': [field for field, ok in results.items() if not ok]})
+    accuracy = {field: correct[field] / totals[field] for field in correct if totals[field]}
+    return accuracy, misses
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def time_calls(func, inputs, iterations):
+    """inputs を iterations 回ずつ処理し、1件ごとのレイテンシ (ns) を返します。"""
+    latencies = []
+    for _ in range(iterations):
+        for item in inputs:
+            started = time.perf_counter_ns()
+            func(item)
+            latencies.append(time.perf_counter_ns() - started)
+    return sorted(latencies)
+
+
+def latency_summary(latencies):
+    total_seconds = sum(latencies) / 1e9
+    return {
+        'count': len(latencies),
+        'per_second': len(latencies) / total_seconds if total_seconds else 0.0,
+        'p50_us': _percentile(latencies, 0.50) / 1000,
+        'p99_us': _percentile(latencies, 0.99) / 1000,
+        'mean_us': statistics.fmean(latencies) / 1000,
+    }
+
+
+def measure_allocations(func, inputs):
+    """1パス分のピークメモリと、1件あたりの確保ブロック数を計測します。"""
+    func(inputs[0]) # 遅延初期化の分を除く
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for item in inputs:
+        func(item)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return {'peak_kib': peak / 1024, 'retained_blocks_per_parse': blocks / len(inputs)}
+
+
+def bench_parser(name, now, events, iterations):
+    parse = PARSERS[name](now)
+    texts = [event['text'] for event in events]
+    accuracy, misses = score(parse, events)
+    latencies = time_calls(parse, texts, iterations)
+    allocations = measure_allocations(parse, texts)
+    return {'parser': name, **latency_summary(latencies), **allocations, 'accuracy': accuracy, 'misses': misses}
+
+
+def bench_http(now, events, requests, use_cache, endpoint):
+    """
+    Flask のテストクライアントで /generate_ical (または /generate_ical_batch) を叩きます。
+    endpoint='feed' では一時ファイルのストアに保存したフィードを、ETag 付きの条件付き GET でポーリングします。
+    """
+    import app
+    from autocalendar.clock import FixedClock
+    from autocalendar.event_cache import EventCache
+
+    if not use_cache:
+        app.event_cache = EventCache(max_entries=0)
+    client = app.app.test_client()
+    texts = [event['text'] for event in events]
+
+    if endpoint == 'batch':
+        payload = '\n\n'.join(texts)
+
+        def call(_):
+            response = client.post('/generate_ical_batch', data={'event_text': payload, 'split': 'blank'})
+            response.get_data()
+            return response
+        inputs = [None]
+        iterations = max(1, requests // len(texts))
+    elif endpoint == 'feed':
+        import tempfile
+        from autocalendar.event_store import EventStore
+
+        app.event_store = EventStore(os.path.join(tempfile.mkdtemp(), 'store.db'))
+        feed_id = app.event_store.create_feed()
+        for text in texts:
+            client.post('/generate_ical', data={'event_text': text, 'feed': feed_id, 'now': now.isoformat()})
+        etag = client.get(f'/feeds/{feed_id}.ics').headers['ETag']
+
+        def call(_):
+            return client.get(f'/feeds/{feed_id}.ics', headers={'If-None-Match': etag})
+        inputs = [None]
+        iterations = requests
+    else:
+        def call(text):
+            return client.post('/generate_ical', data={'event_text': text})
+        inputs = texts
+        iterations = max(1, requests // len(texts))
+
+    # キャッシュ有効時は TTL が実時刻基準なので時計を固定しない
+    if not use_cache:
+        app.app.config['CLOCK'] = FixedClock(now)
+    statuses = {call(item).status_code for item in inputs}
+    latencies = time_calls(call, inputs, iterations)
+    summary = latency_summary(latencies)
+    if endpoint == 'batch':
+        summary['events_per_second'] = summary['per_second'] * len(texts)
+    return {'endpoint': endpoint, 'cache': use_cache, 'statuses': sorted(statuses), **summary}
+
+
+# 正規表現のバックトラックが起きやすい入力。長さ n の文字列を返す
+WORST_CASES = {
+    'date list': lambda n: '7/1' + '、7/2' * (n // 4) + 'x',
+    'exclude list': lambda n: '毎週月曜 ' + '7/1・' * (n // 4) + '7/2を除く',
+    'spaces after date': lambda n: '7/1' + ' ' * n + 'x',
+    'spaces before time': lambda n: '7/1 ' + '\u3000' * n + '10',
+    'weekday list': lambda n: '毎週月' + '・火' * (n // 2) + 'x',
+    'range separators': lambda n: '10:00' + ' ~ ' * (n // 3),
+    'no tokens': lambda n: 'あ' * n,
+}
+# 長さを4倍にしたときの時間の比がこれを超えたら線形でないとみなす (二乗時間なら16倍)。
+# 一部だけ二乗時間 (長い列の先頭への挿入など) でも8倍前後になるので、それを見逃さない値にする
+MAX_GROWTH = 6.0
+WORST_CASE_LENGTH = 200_000
+WORST_CASE_REPEAT = 3 # 各長さで何回測って最短を取るか (一時的な揺れで誤判定しないように)
+
+
+def bench_worst_case(length):
+    """WORST_CASES の各入力を length // 4 と length の長さで解析し、時間の比を返します。"""
+    from autocalendar import parse_events_from_text
+
+    results = []
+    for name, make_text in WORST_CASES.items():
+        timings = []
+        for size in (length // 4, length):
+            text = make_text(size)
+            best = None
+            for _ in range(WORST_CASE_REPEAT):
+                started = time.perf_counter()
+                parse_events_from_text(text)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+        growth = timings[1] / max(timings[0], 1e-6)
+        results.append({'case': name, 'length': length, 'seconds': timings[1], 'growth': growth, 'ok': growth <= MAX_GROWTH})
+    return results
+
+
+def _print_worst_case(results):
+    print(f"[worst case] 長さを4倍にしたときの時間の比 (上限 x{MAX_GROWTH:.0f})")
+    for result in results:
+        mark = ' ' if result['ok'] else 'x'
+        print(f"  {mark} {result['case']:<20} {result['length']} 文字 {result['seconds'] * 1000:8.1f}ms   x{result['growth']:.1f}")
+
+
+def _print_report(result):
+    label = result.get('parser') or f"http:{result['endpoint']}"
+    print(f"[{label}]")
+    print(f"  {result['per_second']:.0f} /s   p50 {result['p50_us']:.1f}us   p99 {result['p99_us']:.1f}us   (n={result['count']})")
+    if 'events_per_second' in result:
+        print(f"  {result['events_per_second']:.0f} events/s")
+    if 'peak_kib' in result:
+        print(f"  peak {result['peak_kib']:.1f} KiB/pass   retained blocks {result['retained_blocks_per_parse']:.1f}/parse")
+    if 'accuracy' in result:
+        print("  accuracy: " + '  '.join(f"{field} {value:.0%}" for field, value in result['accuracy'].items()))
+        for miss in result['misses']:
+            print(f"    x {miss['text'][:40]!r}: {', '.join(miss['wrong'])}")
+    if 'statuses' in result:
+        print(f"  status codes: {result['statuses']}  cache: {result['cache']}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--parser', choices=[*PARSERS, 'all'], default='all')
+    arg_parser.add_argument('-n', '--iterations', type=int, default=50, help="コーパスを繰り返す回数")
+    arg_parser.add_argument('--corpus', default=CORPUS_PATH)
+    arg_parser.add_argument('--http', action='store_true', help="/generate_ical の負荷をかける")
+    arg_parser.add_argument('--endpoint', choices=['single', 'batch', 'feed'], default='single')
+    arg_parser.add_argument('--requests', type=int, default=1000)
+    arg_parser.add_argument('--cache', action='store_true', help="--http で解析キャッシュを有効にする")
+    arg_parser.add_argument('--worst-case', type=int, metavar='LENGTH', nargs='?', const=200_000,
+                            help="病的な入力の時間の伸びだけを確認する (LENGTH 文字まで。省略時は 200000)")
+    arg_parser.add_argument('--json', action='store_true', help="結果を JSON で出力する")
+    args = arg_parser.parse_args(argv)
+
+    if args.worst_case:
+        worst_case = bench_worst_case(args.worst_case)
+        if args.json:
+            print(json.dumps(worst_case, ensure_ascii=False, indent=2))
+        else:
+            _print_worst_case(worst_case)
+        return 0 if all(result['ok'] for result in worst_case) else 1
+
+    now, events = load_corpus(args.corpus)
+    if args.http:
+        results = [bench_http(now, events, args.requests, args.cache, args.endpoint)]
+    else:
+        names = list(PARSERS) if args.parser == 'all' else [args.parser]
+        results = [bench_parser(name, now, events, args.iterations) for name in names]
+
+    worst_case = [] if args.http else bench_worst_case(WORST_CASE_LENGTH)
+    if args.json:
+        print(json.dumps(results + worst_case, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            _print_report(result)
+        if worst_case:
+            _print_worst_case(worst_case)
+    return 0 if all(result['ok'] for result in worst_case) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
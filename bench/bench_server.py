@@ -0,0 +1,150 @@
+"""
+gunicorn (gunicorn.conf.py) を実際に起動して /generate_ical に負荷をかけ、ワーカー数ごとのスループットを計測する負荷テスト。
+
+    python bench/bench_server.py --workers 1 2 4 --clients 8 --duration 5
+    python bench/bench_server.py --workers 2 --threads 1 --no-preload
+
+クライアントは別プロセスで動かし、HTTP/1.1 の keep-alive で corpus.json の文面を順に送ります。
+既定では解析キャッシュを無効にするので (AUTOCAL_CACHE_SIZE=0)、解析と iCal の生成の速さが測れます。
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from bench_parser import ROOT, latency_summary, load_corpus
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn が終了しました (終了コード {process.returncode})")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn の起動を待ちきれませんでした")
+
+
+def start_server(workers, threads, preload, cache):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        AUTOCAL_BIND=f'127.0.0.1:{port}',
+        AUTOCAL_WORKERS=str(workers),
+        AUTOCAL_THREADS=str(threads),
+        AUTOCAL_PRELOAD='1' if preload else '0',
+    )
+    if not cache:
+        env['AUTOCAL_CACHE_SIZE'] = '0'
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=env,
+    )
+    try:
+        _wait_until_ready(port, process)
+    except Exception:
+        process.kill()
+        raise
+    return process, port
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM) # graceful_timeout まで処理中のリクエストを待って終了する
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _client(args):
+    """1つのクライアントプロセス。期限までリクエストを送り続け、レイテンシ (ns) とステータスを返します。"""
+    port, bodies, duration = args
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + duration
+    index = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter_ns()
+        conn.request('POST', '/generate_ical', body=bodies[index % len(bodies)], headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter_ns() - started)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        index += 1
+    conn.close()
+    return latencies, statuses
+
+
+def load_test(port, bodies, clients, duration):
+    with multiprocessing.Pool(clients) as pool:
+        started = time.perf_counter()
+        results = pool.map(_client, [(port, bodies[i:] + bodies[:i], duration) for i in range(clients)])
+        elapsed = time.perf_counter() - started
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    statuses = {}
+    for _, client_statuses in results:
+        for status, count in client_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    summary = latency_summary(latencies)
+    summary['per_second'] = len(latencies) / elapsed # クライアント全体のスループット
+    return {**summary, 'statuses': {str(status): count for status, count in sorted(statuses.items())}}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    arg_parser.add_argument('--threads', type=int, default=1, help="ワーカーあたりのスレッド数 (AUTOCAL_THREADS)")
+    arg_parser.add_argument('--clients', type=int, default=8, help="同時に接続するクライアントプロセス数")
+    arg_parser.add_argument('--duration', type=float, default=5.0, help="ワーカー数ごとの計測秒数")
+    arg_parser.add_argument('--no-preload', action='store_true', help="preload_app を無効にする")
+    arg_parser.add_argument('--cache', action='store_true', help="解析キャッシュを有効にする")
+    arg_parser.add_argument('--json', action='store_true', help="結果を JSON で出力する")
+    args = arg_parser.parse_args(argv)
+
+    now, events = load_corpus()
+    bodies = [urlencode({'event_text': event['text'], 'now': now.isoformat()}) for event in events]
+
+    results = []
+    for workers in args.workers:
+        process, port = start_server(workers, args.threads, not args.no_preload, args.cache)
+        try:
+            result = load_test(port, bodies, args.clients, args.duration)
+        finally:
+            stop_server(process)
+        result.update(workers=workers, threads=args.threads, clients=args.clients)
+        result['speedup'] = result['per_second'] / results[0]['per_second'] if results else 1.0
+        results.append(result)
+        if not args.json:
+            print(f"[workers={workers} threads={args.threads} clients={args.clients}]")
+            print(f"  {result['per_second']:.0f} req/s   p50 {result['p50_us'] / 1000:.2f}ms   "
+                  f"p99 {result['p99_us'] / 1000:.2f}ms   x{result['speedup']:.2f}   status {result['statuses']}")
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"(CPU 数: {os.cpu_count()}。ワーカー数を CPU 数より増やしてもスループットは伸びません)")
+
+
+if __name__ == '__main__':
+    main()
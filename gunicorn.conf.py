@@ -0,0 +1,61 @@
+"""
+本番用の gunicorn 設定。
+
+    gunicorn -c gunicorn.conf.py app:app
+
+ワーカー数などは環境変数で調整できます。
+
+- AUTOCAL_BIND (既定 0.0.0.0:5001)
+- AUTOCAL_WORKERS (既定 CPU 数)。解析は CPU を使うので CPU 数より多くしても速くなりません
+- AUTOCAL_THREADS (既定 4)。2以上なら gthread ワーカーで、フィードのポーリングなど軽いリクエストを並行して処理します
+- AUTOCAL_PRELOAD (既定 1)。マスターで app を読み込み、ウォームアップしてから fork します
+- AUTOCAL_REQUEST_TIMEOUT (既定 30秒)、AUTOCAL_GRACEFUL_TIMEOUT (既定 30秒)、AUTOCAL_KEEPALIVE (既定 5秒)
+- AUTOCAL_REQUEST_DEADLINE (既定 AUTOCAL_REQUEST_TIMEOUT - 5秒)。app がバッチと /import の解析を打ち切る時間
+- AUTOCAL_MAX_REQUESTS (既定 0 = 無制限)。メモリの増加が気になる場合にワーカーを定期的に入れ替えます
+- AUTOCAL_PARSE_WORKERS (既定 1)。バッチ解析のプロセスプールを使わない。gunicorn のワーカーが CPU 数だけあるので、
+  各ワーカーがさらに CPU 数のプロセスを起動すると CPU 数の二乗のプロセスになります
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('AUTOCAL_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('AUTOCAL_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('AUTOCAL_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = os.environ.get('AUTOCAL_PRELOAD', '1') != '0'
+# app を読み込む前に設定する (autocalendar.bulk_parse は読み込み時に参照する)
+os.environ.setdefault('AUTOCAL_PARSE_WORKERS', '1')
+
+# timeout はワーカーが応答しなくなったときにマスターが再起動するまでの時間。
+# sync ワーカー (AUTOCAL_THREADS=1) ではリクエストの処理時間の上限にもなるが、gthread ワーカーは
+# 処理中のスレッドと関係なくハートビートを送るので、長いリクエストは止まらない。
+# そのため処理時間の上限は app 側 (AUTOCAL_REQUEST_DEADLINE) で守る。再起動や終了時は処理中のリクエストを待つ
+timeout = int(os.environ.get('AUTOCAL_REQUEST_TIMEOUT', 30))
+os.environ.setdefault('AUTOCAL_REQUEST_DEADLINE', str(max(timeout - 5, 1)))
+graceful_timeout = int(os.environ.get('AUTOCAL_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('AUTOCAL_KEEPALIVE', 5))
+max_requests = int(os.environ.get('AUTOCAL_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def _warm_up(log):
+    from autocalendar.warmup import warm_up
+
+    count = warm_up()
+    log.info("ウォームアップ完了 (%d 件のサンプルを解析)", count)
+
+
+def when_ready(server):
+    # preload_app ではワーカーを fork する前にここが呼ばれる。
+    # ウォームアップで作ったオブジェクトを gc.freeze() で GC の対象から外し、
+    # fork 後に GC が参照カウント以外のヘッダーを書き換えてページがコピーされるのを防ぐ
+    if preload_app:
+        _warm_up(server.log)
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # preload しない場合は各ワーカーでウォームアップする
+    if not preload_app:
+        _warm_up(worker.log)
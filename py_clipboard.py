@@ -1,168 +1,213 @@
-import pyperclip
-from icalendar import Calendar, Event, vText
 import datetime
-import re
-import time
 import os
-from dateutil import parser # 日付解析を強化するために追加
 
-def parse_event_from_text(text_content):
+from autocalendar import parse_events, parse_events_from_text
+from autocalendar.bulk_parse import SPLIT_MODES, split_event_chunks
+from autocalendar.clipboard_watch import ClipboardWatcher
+from autocalendar.clock import FixedClock, parse_reference_time
+from autocalendar.event_index import DEFAULT_INDEX_PATH, UNCHANGED, SeenEventIndex
+from autocalendar.ical_worker import DEFAULT_TEMP_DIR, IcalWorker, cleanup_temp_dir, open_ical_file, open_with_default_app, write_ical_file
+from autocalendar.ics_writer import format_rrule
+from autocalendar.timezones import resolve_zone
+
+PRODID = '-//My Python Calendar Helper//example.com//'
+
+# 出力済みのイベントの索引 (AUTOCAL_INDEX_PATH を指定すると再起動後も引き継ぐ)。
+# 同じ予定をもう一度コピーしても同じ UID で出力し、内容が変わっていれば SEQUENCE を上げる
+event_index = SeenEventIndex(DEFAULT_INDEX_PATH)
+
+def create_and_open_ical(parsed_event):
     """
-    テキストコンテンツからイベント情報を解析します。
-    この部分は、ユーザーがコピーするテキストの形式に合わせて調整が必要です。
+    イベント情報からiCalファイルを生成し、デフォルトのカレンダーアプリで開きます。
     """
-    title = "新しいカレンダーイベント"
-    start_dt = datetime.datetime.now()
-    description = text_content
-    location = ""
+    write_and_open_events([parsed_event], label=parsed_event.title)
 
-    # 1. 日付の解析 (dateutil.parser を使用すると柔軟性が高い)
-    try:
-        # 例: "2025年7月1日", "来週月曜日", "明日", "7/1" など
-        # 'fuzzy=True' で、日付以外の文字列も含むテキストから日付を抽出試行
-        parsed_date = parser.parse(text_content, fuzzy=True, dayfirst=False, yearfirst=True)
-        start_dt = start_dt.replace(year=parsed_date.year, month=parsed_date.month, day=parsed_date.day)
-    except parser.ParserError:
-        pass # 日付が見つからない場合は現在の日のまま
-
-    # 2. 時刻の解析 (日付が見つかった場合、その日の時刻として解析)
-    time_match = re.search(r'(\d{1,2}:\d{2}(?:[APap][Mm])?|\d{1,2}時\d{2}分?|\d{1,2}時)', text_content)
-    if time_match:
-        try:
-            time_str = time_match.group(1).replace('時', ':').replace('分', '')
-            # AM/PMを含む場合の処理
-            if 'am' in time_str.lower() or 'pm' in time_str.lower():
-                parsed_time = datetime.datetime.strptime(time_str, '%I:%M%p').time()
-            elif ':' in time_str:
-                parsed_time = datetime.datetime.strptime(time_str, '%H:%M').time()
-            else: # 例: "10時" の場合
-                parsed_time = datetime.datetime.strptime(time_str + ':00', '%H:%M').time()
-
-            start_dt = start_dt.replace(hour=parsed_time.hour, minute=parsed_time.minute, second=0, microsecond=0)
-
-            # もし解析された時刻が現在時刻より過去で、かつ日付が今日の場合、翌日にする（午前/午後が不明な場合など）
-            if start_dt < datetime.datetime.now() and start_dt.date() == datetime.datetime.now().date():
-                start_dt += datetime.timedelta(days=1)
-
-        except ValueError:
-            pass # 解析失敗時はデフォルト値を使用
-
-    # 3. タイトルの解析 (最も重要な情報)
-    # 例: "〇〇と打ち合わせ", "〇〇会議", "〇〇の予約" など
-    # ここは非常にカスタマイズが必要です。
-    # 簡単な例として、日付や時刻の前後にあるキーワードをタイトルとする
-    # あるいは、特定のキーワード（例: "会議", "打ち合わせ", "予約"）を見つけて、その前後のテキストをタイトルとする
-    title_keywords = ["会議", "打ち合わせ", "ミーティング", "予約", "イベント", "リマインダー"]
-    found_title = False
-    for keyword in title_keywords:
-        if keyword in text_content:
-            # キーワードの前の部分をタイトルにする（簡易的）
-            parts = text_content.split(keyword, 1)
-            if parts[0].strip():
-                title = parts[0].strip() + keyword
-            else: # キーワードが先頭に近い場合など
-                title = text_content.replace('\n', ' ')[:100] # 長すぎないように
-            found_title = True
-            break
-    
-    if not found_title:
-        # 日付や時刻の文字列を除去して残りをタイトルにする（より高度な方法）
-        cleaned_text = re.sub(r'(\d{4}[年/]\d{1,2}[月/]\d{1,2}日?|\d{1,2}:\d{2}(?:[APap][Mm])?|\d{1,2}時\d{2}分?|\d{1,2}時)', '', text_content)
-        cleaned_text = cleaned_text.replace('\n', ' ').strip()
-        if cleaned_text:
-            title = cleaned_text[:100] + '...' if len(cleaned_text) > 100 else cleaned_text
-        else:
-            title = "クリップボードからのイベント"
-
-    # 4. 説明 (残りのテキスト全て、または特定の情報)
-    description = text_content
-
-    # 5. 場所の解析 (例: "場所：〇〇", "@〇〇" など)
-    location_match = re.search(r'(場所|@|にて)[:：]?\s*(.+?)(?=\n|$)', text_content)
-    if location_match:
-        location = location_match.group(2).strip()
-
-    return title, start_dt, description, location
-
-def create_and_open_ical(title, start_dt, description, location=""):
+def render_events(payload):
     """
-    イベント情報からiCalファイルを生成し、デフォルトのカレンダーアプリで開きます。
+    IcalWorker 用: (解析済みイベントのリスト, ラベル) を iCal バイト列にします。
+    各イベントには索引から UID・SEQUENCE・DTSTAMP を付けるので、カレンダーアプリでは重複せず更新になります。
+    前回出力したときから変わっていないイベントは含めず、1件も残らなければ None を返します。
     """
-    cal = Calendar()
-    cal.add('prodid', '-//My Python Calendar Helper//example.com//')
-    cal.add('version', '2.0')
+    from autocalendar.ics import calendar_to_ical
+
+    parsed_events, _ = payload
+    changed_events = [
+        parsed_event for status, parsed_event in event_index.iter_observe(parsed_events) if status != UNCHANGED
+    ]
+    if not changed_events:
+        return None
+    return calendar_to_ical(changed_events, PRODID)
 
-    event = Event()
-    event.add('summary', vText(title))
-    event.add('dtstart', start_dt)
-    event.add('dtend', start_dt + datetime.timedelta(hours=1)) # デフォルトで1時間後
-    event.add('description', vText(description))
-    if location:
-        event.add('location', vText(location))
-    event.add('priority', 5)
+def write_and_open_events(parsed_events, label):
+    """
+    解析済みイベントのリストから1つのiCalファイルを生成し、デフォルトのカレンダーアプリで開きます。
+    """
+    ical_data = render_events((parsed_events, label))
+    if ical_data is None:
+        _report_unchanged(label)
+        return
+    # iCalファイルを管理用の一時ディレクトリに保存し、古いファイルは削除する
+    file_name = write_ical_file(ical_data)
+    cleanup_temp_dir(DEFAULT_TEMP_DIR, keep=file_name)
+
+    print(f"'{label}' のイベント情報を生成しました。カレンダーアプリで開きます...")
+    try:
+        open_with_default_app(file_name)
+        print("カレンダーアプリケーションが起動しました。")
+    except Exception as e:
+        _report_open_error((parsed_events, label), e, file_name)
 
-    cal.add_component(event)
+def _report_open_error(payload, error, file_name=None):
+    print(f"カレンダーアプリケーションの起動に失敗しました: {error}")
+    if file_name:
+        print(f"手動で '{file_name}' を開いてカレンダーにインポートしてください。")
 
-    # iCalファイルを一時的に保存
-    file_name = f"temp_event_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.ics"
-    with open(file_name, 'wb') as f:
-        f.write(cal.to_ical())
+def _report_unchanged(label):
+    print(f"'{label}' は前回と同じ内容なので、カレンダーアプリは開きません。")
 
-    print(f"'{title}' のイベント情報を生成しました。カレンダーアプリで開きます...")
+def _report_opened(payload, file_name):
+    _, label = payload
+    if file_name is None:
+        _report_unchanged(label)
+        return
+    print(f"'{label}' のイベント情報を生成し、カレンダーアプリで開きました: {file_name}")
 
-    # OSに応じた方法でファイルを開く
+def import_events_from_file(path, split='auto', workers=None, chunk_size=None, tz=None, reference=None):
+    """
+    ファイル内の複数イベントをまとめて解析し、1つのiCalファイルとして開きます。
+    件数が多い場合はプロセスプールで並列に解析します。
+    """
+    with open(path, encoding='utf-8') as f:
+        chunks = split_event_chunks(f.read(), split)
+    if not chunks:
+        print(f"'{path}' にイベントが見つかりませんでした。")
+        return
+    parsed_events = parse_events(chunks, workers=workers, chunk_size=chunk_size, tz=tz, reference=reference)
+    print(f"{len(parsed_events)} 件のイベントを解析しました。")
+    write_and_open_events(parsed_events, label=os.path.basename(path))
+
+def import_files(paths, output=None, split='auto', encoding='utf-8', workers=None, chunk_size=None, tz=None, reference=None,
+                 user_key=None, changes_only=False):
+    """
+    .txt / .csv / .eml / .mbox / .ics ファイルから予定を取り込み、1つのiCalファイルに結合します。
+    ファイルはストリームで読み、結果も少しずつ書き出すので、大きなファイルでもメモリ使用量は一定です。
+    .ics は既存のカレンダーとして含め、同じ UID や同じタイトル・開始日時の予定は重ねて出力しません。
+    予定の UID・SEQUENCE は索引から決まるので、取り込み直してもカレンダーアプリでは更新として扱われます。
+    changes_only=True なら前回の取り込みから変わっていない予定は出力しません。
+    output を指定するとそこに保存し、指定しなければ一時ファイルに保存してカレンダーアプリで開きます。
+    """
+    from autocalendar.file_import import ImportStats, detect_format, iter_import_calendar
+
+    for path in paths:
+        if not os.path.isfile(path):
+            raise ValueError(f"ファイルが見つかりません: {path}")
+    sources = [(path, detect_format(path)) for path in paths]
+    stats = ImportStats()
+    chunks = iter_import_calendar(sources, split, encoding, tz=tz, reference=reference, workers=workers,
+                                  chunk_size=chunk_size, prodid=PRODID, stats=stats, index=event_index,
+                                  user_key=user_key, changes_only=changes_only)
+    header = next(chunks) # 分割方法や文字コードの誤りはここで ValueError / LookupError になる
+    if output:
+        f, file_name = open(output, 'wb'), output
+    else:
+        f, file_name = open_ical_file()
+    with f:
+        f.write(header)
+        f.writelines(chunks)
+    print(f"{stats.records} 件のレコードから {stats.events} 件のイベントを書き出しました"
+          f" (重複 {stats.duplicates} 件、変更なし {stats.unchanged} 件、{stats.elapsed:.1f} 秒、{stats.records_per_second:.0f} レコード/秒)。")
+    if output:
+        print(f"'{file_name}' に保存しました。")
+        return
+    cleanup_temp_dir(DEFAULT_TEMP_DIR, keep=file_name)
     try:
-        if os.name == 'nt':  # Windows
-            os.startfile(file_name)
-        elif os.uname().sysname == 'Darwin':  # macOS
-            os.system(f'open "{file_name}"')
-        else:  # Linux (xdg-openが一般的)
-            os.system(f'xdg-open "{file_name}"')
+        open_with_default_app(file_name)
         print("カレンダーアプリケーションが起動しました。")
     except Exception as e:
-        print(f"カレンダーアプリケーションの起動に失敗しました: {e}")
-        print(f"手動で '{file_name}' を開いてカレンダーにインポートしてください。")
-    
-    # 必要であれば、ファイルを開いた後に削除することも可能ですが、
-    # ユーザーがインポートを確認する時間を与えるため、ここでは残しておきます。
-    # os.remove(file_name)
+        _report_open_error(None, e, file_name)
 
-def monitor_clipboard_and_create_event(interval=1):
+def monitor_clipboard_and_create_event(interval=1, backend=None, stop_event=None, tz=None, clock=None):
     """
     クリップボードの内容を監視し、変更があればイベントとして処理します。
+    変更通知が使える環境では通知を待ち、それ以外では最大 interval 秒間隔でポーリングします。
     Ctrl+Cで終了できます。
     """
-    last_clipboard_content = None
-    print("クリップボードの監視を開始しました。テキストをコピーしてください。Ctrl+Cで終了します。")
     try:
-        while True:
-            current_clipboard_content = pyperclip.paste()
-            if current_clipboard_content and current_clipboard_content != last_clipboard_content:
-                print(f"\n--- クリップボードの内容が変更されました ({datetime.datetime.now().strftime('%H:%M:%S')}) ---")
-                print(f"内容:\n{current_clipboard_content[:200]}...") # 長い場合は一部表示
-
-                # イベント情報を解析
-                title, start_dt, description, location = parse_event_from_text(current_clipboard_content)
-                
-                # 確認のため、解析結果を表示
+        from pyperclip import PyperclipException
+    except ImportError: # FakeClipboard などでは pyperclip は不要
+        PyperclipException = ()
+
+    watcher = ClipboardWatcher(backend, max_interval=interval)
+    # ファイルの書き込みとアプリの起動は監視ループを止めないようバックグラウンドで行う
+    worker = IcalWorker(render_events, on_done=_report_opened, on_error=_report_open_error)
+    print(f"クリップボードの監視を開始しました ({watcher.backend.name})。テキストをコピーしてください。Ctrl+Cで終了します。")
+    try:
+        for current_clipboard_content in watcher.changes(stop_event):
+            print(f"\n--- クリップボードの内容が変更されました ({datetime.datetime.now().strftime('%H:%M:%S')}) ---")
+            print(f"内容:\n{current_clipboard_content[:200]}...") # 長い場合は一部表示
+
+            # イベント情報を解析
+            # (メールなどに複数の予定が含まれていれば、それぞれをイベントにする)
+            parsed_events = parse_events_from_text(current_clipboard_content, tz=tz, clock=clock)
+            
+            # 確認のため、解析結果を表示
+            for parsed_event in parsed_events:
                 print(f"\n[解析結果]")
-                print(f"  タイトル: {title}")
-                print(f"  開始日時: {start_dt.strftime('%Y-%m-%d %H:%M')}")
-                print(f"  説明: {description[:100]}...")
-                print(f"  場所: {location if location else 'なし'}")
-
-                # iCalファイルを生成して開く
-                create_and_open_ical(title, start_dt, description, location)
-                
-                last_clipboard_content = current_clipboard_content
-            time.sleep(interval)
+                print(f"  タイトル: {parsed_event.title}")
+                print(f"  開始日時: {parsed_event.start_dt.strftime('%Y-%m-%d %H:%M')}")
+                print(f"  終了日時: {parsed_event.end_dt.strftime('%Y-%m-%d %H:%M')}")
+                print(f"  説明: {parsed_event.description[:100]}...")
+                print(f"  場所: {parsed_event.location if parsed_event.location else 'なし'}")
+                if parsed_event.recurrence:
+                    print(f"  繰り返し: {format_rrule(parsed_event.recurrence)}")
+
+            # iCalファイルの生成と起動を予約する (続けてコピーされた場合は最後の1件だけ開く)
+            worker.submit((parsed_events, parsed_events[0].title))
     except KeyboardInterrupt:
         print("\nクリップボードの監視を終了します。")
-    except pyperclip.PyperclipException as e:
+    except PyperclipException as e:
         print(f"クリップボードの操作中にエラーが発生しました: {e}")
     except Exception as e:
         print(f"予期せぬエラーが発生しました: {e}")
+    finally:
+        watcher.close()
+        worker.close()
 
 if __name__ == "__main__":
-    monitor_clipboard_and_create_event(interval=2) # 2秒ごとにチェック
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="クリップボードやファイルのテキストからカレンダーイベントを生成します。")
+    arg_parser.add_argument('--interval', type=float, default=2, help="ポーリング時にクリップボードを確認する最大間隔（秒）")
+    arg_parser.add_argument('--bulk', metavar='FILE', help="ファイル内の複数イベントをまとめて読み込む")
+    arg_parser.add_argument('--import', dest='import_files', metavar='FILE', nargs='+',
+                            help="ファイル (.txt / .csv / .eml / .mbox / .ics) から予定を取り込んで1つのiCalファイルに結合する")
+    arg_parser.add_argument('--output', help="--import の結果を保存するパス (省略時は一時ファイルに保存して開く)")
+    arg_parser.add_argument('--encoding', default='utf-8', help="--import で読む .txt / .csv の文字コード")
+    arg_parser.add_argument('--user-key', help="--import で UID に含めるキー (省略時は AUTOCAL_UID_KEY)")
+    arg_parser.add_argument('--changes-only', action='store_true',
+                            help="--import で前回から変わっていない予定を出力しない (AUTOCAL_INDEX_PATH で索引を保存)")
+    arg_parser.add_argument('--split', default='auto', choices=SPLIT_MODES, help="--bulk / --import (.txt) の分割方法")
+    arg_parser.add_argument('--workers', type=int, help="--bulk / --import で使うワーカープロセス数")
+    arg_parser.add_argument('--chunk-size', type=int, help="--bulk / --import でワーカーにまとめて渡すイベント数")
+    arg_parser.add_argument('--tz', help="日時を解釈するタイムゾーン (例: Asia/Tokyo。省略時は AUTOCAL_TIMEZONE)")
+    arg_parser.add_argument('--now', help="「明日」などを解釈する基準時刻 (ISO 8601 形式。省略時は現在時刻)")
+    args = arg_parser.parse_args()
+
+    try:
+        resolve_zone(args.tz)
+        reference = parse_reference_time(args.now) if args.now else None
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    if args.import_files:
+        try:
+            import_files(args.import_files, args.output, args.split, args.encoding, args.workers, args.chunk_size,
+                         args.tz, reference, args.user_key, args.changes_only)
+        except (ValueError, LookupError) as e:
+            arg_parser.error(str(e))
+    elif args.bulk:
+        import_events_from_file(args.bulk, args.split, args.workers, args.chunk_size, args.tz, reference)
+    else:
+        clock = FixedClock(reference) if reference else None
+        monitor_clipboard_and_create_event(interval=args.interval, tz=args.tz, clock=clock) # ポーリング時は最大2秒間隔
     
\ No newline at end of file
@@ -0,0 +1,6 @@
+# リポジトリ直下 (autocalendar・app.py・py_clipboard.py) を import できるようにする。
+# python -m pytest では不要だが、pytest コマンドから直接実行した場合のため
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+"""クリップボード監視 (clipboard_watch と py_clipboard の監視ループ) のテスト。実際のクリップボードは使いません。"""
+import functools
+import threading
+import time
+
+import pytest
+
+import py_clipboard
+from autocalendar.clipboard_watch import ClipboardWatcher, FakeClipboard
+from autocalendar.ical_worker import IcalWorker
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("時間内に条件を満たしませんでした")
+        time.sleep(0.01)
+
+
+def test_wait_sees_copy_made_after_last_read():
+    clipboard = FakeClipboard('a')
+    clipboard.read()
+    clipboard.copy('b') # 読んだ後、待ち始める前のコピー
+    assert clipboard.wait_for_change(0)
+    clipboard.read()
+    assert not clipboard.wait_for_change(0)
+
+
+@pytest.mark.parametrize('notifies', [True, False])
+def test_watcher_skips_identical_copies(notifies):
+    clipboard = FakeClipboard('7/1 10:00 会議', notifies=notifies)
+    watcher = ClipboardWatcher(clipboard, min_interval=0.01, max_interval=0.05)
+    assert watcher.poll() == '7/1 10:00 会議'
+    clipboard.copy('7/1 10:00 会議')
+    assert watcher.poll() is None
+    clipboard.copy('7/2 11:00 面談')
+    assert watcher.poll() == '7/2 11:00 面談'
+
+
+def test_monitor_dedupes_and_coalesces(monkeypatch, tmp_path):
+    parsed_texts = []
+    opened = []
+    parse = py_clipboard.parse_events_from_text
+
+    def recording_parse(text, **options):
+        parsed_texts.append(text)
+        return parse(text, **options)
+
+    # ファイルは一時ディレクトリに書き、カレンダーアプリは開かずに記録する
+    monkeypatch.setattr(py_clipboard, 'parse_events_from_text', recording_parse)
+    monkeypatch.setattr(py_clipboard, 'IcalWorker', functools.partial(
+        IcalWorker, opener=opened.append, directory=str(tmp_path), coalesce_window=0.5,
+    ))
+    monkeypatch.setattr(py_clipboard, 'event_index', py_clipboard.SeenEventIndex(None))
+
+    clipboard = FakeClipboard()
+    stop_event = threading.Event()
+    monitor = threading.Thread(
+        target=py_clipboard.monitor_clipboard_and_create_event,
+        kwargs={'interval': 0.05, 'backend': clipboard, 'stop_event': stop_event, 'tz': 'Asia/Tokyo'},
+    )
+    monitor.start()
+    try:
+        clipboard.copy('7/1 10:00 会議')
+        wait_until(lambda: len(parsed_texts) == 1)
+        # 同じ内容のコピーは解析しない
+        reads = clipboard.reads
+        clipboard.copy('7/1 10:00 会議')
+        wait_until(lambda: clipboard.reads > reads)
+        clipboard.copy('7/2 11:00 面談')
+        wait_until(lambda: len(parsed_texts) == 2)
+    finally:
+        stop_event.set()
+        monitor.join(5)
+    assert not monitor.is_alive()
+
+    assert parsed_texts == ['7/1 10:00 会議', '7/2 11:00 面談']
+    # 続けてコピーされた2件は最後の1件だけ書き出して開く
+    assert len(opened) == 1
+    with open(opened[0], encoding='utf-8') as f:
+        ical = f.read()
+    assert '面談' in ical and '会議' not in ical
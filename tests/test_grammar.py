@@ -0,0 +1,89 @@
+"""日付・時刻の文法 (grammar.py) と、それを使った1件の予定の解析のテスト。"""
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from autocalendar import parse_event_from_text
+
+TOKYO = ZoneInfo('Asia/Tokyo')
+REFERENCE = datetime.datetime(2026, 6, 20, 12, 0, tzinfo=TOKYO) # 土曜日の正午
+
+
+def parse(text):
+    return parse_event_from_text(text, reference=REFERENCE)
+
+
+def at(month, day, hour, minute=0):
+    return datetime.datetime(2026, month, day, hour, minute, tzinfo=TOKYO)
+
+
+@pytest.mark.parametrize('text, start_dt', [
+    ('来週月曜日10:30 オンラインミーティング', at(6, 22, 10, 30)),
+    ('来週月曜日の10時半', at(6, 22, 10, 30)),
+    ('再来週水曜 9:00', at(7, 1, 9)),
+    ('金曜日 19:00 飲み会', at(6, 26, 19)),
+    ('今日 15:30 MTG', at(6, 20, 15, 30)),
+    ('明日10時 歯医者', at(6, 21, 10)),
+    ('明後日 午後3時', at(6, 22, 15)),
+    ('2026年7月1日 10時30分 会議', at(7, 1, 10, 30)),
+    ('2026/07/03 14:00 打ち合わせ', at(7, 3, 14)),
+    ('7/1(水) 10:00', at(7, 1, 10)),
+])
+def test_dates(text, start_dt):
+    assert parse(text).start_dt == start_dt
+
+
+@pytest.mark.parametrize('text, start_dt', [
+    ('午前10時半 美容院', at(6, 21, 10, 30)),
+    ('午後11時 夜勤', at(6, 21, 23)),
+    ('7/1 午後2時 面談', at(7, 1, 14)),
+    ('7/1 2時午後 面談', at(7, 1, 14)),
+    ('正午 昼会', at(6, 21, 12)),
+])
+def test_meridiem(text, start_dt):
+    # 時刻だけで今日の正午を過ぎていれば翌日
+    assert parse(text).start_dt == start_dt
+
+
+@pytest.mark.parametrize('text, start_dt, duration', [
+    ('7/1 10:00~12:00 定例', at(7, 1, 10), '2h'),
+    ('7/1 10:00～12:30 定例', at(7, 1, 10), '2h30m'),
+    ('午後2時〜午後4時 研修', at(6, 21, 14), '2h'),
+    ('午後1時から3時まで 面談', at(6, 21, 13), '2h'),
+    ('7/1 10:00から 会議', at(7, 1, 10), None),
+    ('10:00まで 提出', at(6, 21, 10), None),
+])
+def test_ranges(text, start_dt, duration):
+    parsed = parse(text)
+    assert (parsed.start_dt, parsed.duration) == (start_dt, duration)
+
+
+def test_date_range_ends_on_last_day():
+    parsed = parse('8月10日~8月15日 夏休み')
+    assert parsed.start_dt.date() == datetime.date(2026, 8, 10)
+    assert parsed.end_dt.date() == datetime.date(2026, 8, 15)
+
+
+@pytest.mark.parametrize('text, start_dt, duration', [
+    ('７／１５ １０：００ 会議', at(7, 15, 10), None),
+    ('２０２６年７月１日 １０時３０分', at(7, 1, 10, 30), None),
+    ('１０時から１２時 打ち合わせ', at(6, 21, 10), '2h'),
+])
+def test_full_width_digits(text, start_dt, duration):
+    parsed = parse(text)
+    assert (parsed.start_dt, parsed.duration) == (start_dt, duration)
+
+
+def test_location_marker():
+    assert parse('2026/07/03 14:00 打ち合わせ\n場所：会議室A').location == '会議室A'
+    assert parse('7/1 10:00 定例会議@本社').location == '本社'
+
+
+def test_no_date_defaults_to_next_nine_oclock():
+    assert parse('あとで連絡します').start_dt == at(6, 21, 9)
+
+
+def test_invalid_date_is_ignored():
+    # 2/30 のような存在しない日付は例外にせず、日付の指定なしとして扱う
+    assert parse('2/30 10:00 会議').start_dt.time() == datetime.time(10, 0)
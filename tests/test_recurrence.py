@@ -0,0 +1,96 @@
+"""繰り返し (RRULE) の解析と展開のテスト。"""
+import datetime
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from autocalendar import ParsedEvent, Recurrence, parse_event_from_text
+from autocalendar.recurrence import iter_occurrences
+
+TOKYO = ZoneInfo('Asia/Tokyo')
+REFERENCE = datetime.datetime(2026, 6, 20, 12, 0, tzinfo=TOKYO)
+
+
+def parse(text):
+    return parse_event_from_text(text, reference=REFERENCE)
+
+
+@pytest.mark.parametrize('text', ['毎月第0水曜', '毎月第9水曜 10時', '毎月0日', '毎月32日 会議'])
+def test_out_of_range_recurrence_is_dropped(text):
+    # 範囲外の値は例外にせず、繰り返しなしの予定にする
+    assert parse(text).recurrence is None
+
+
+def test_zero_count_is_ignored():
+    parsed = parse('毎週月曜 10:00 全0回')
+    assert parsed.recurrence.byday == ('MO',)
+    assert parsed.recurrence.count is None
+
+
+@pytest.mark.parametrize('text, byday, bymonthday', [
+    ('毎月第1水曜', ('1WE',), ()),
+    ('毎月第5水曜', ('5WE',), ()),
+    ('毎月第５水曜', ('5WE',), ()),
+    ('毎月1日', (), (1,)),
+    ('毎月31日', (), (31,)),
+])
+def test_recurrence_bounds(text, byday, bymonthday):
+    recurrence = parse(text).recurrence
+    assert (recurrence.freq, recurrence.byday, recurrence.bymonthday) == ('MONTHLY', byday, bymonthday)
+
+
+def test_count():
+    assert parse('毎週月曜 全3回').recurrence.count == 3
+
+
+
+def at(month, day, hour=10):
+    return datetime.datetime(2026, month, day, hour, 0, tzinfo=TOKYO)
+
+
+def weekly(start_dt, exdates=(), **options):
+    return ParsedEvent('定例', start_dt, None, '', '', Recurrence('WEEKLY', byday=('MO',), **options), exdates)
+
+
+def occurrence_starts(parsed_event, window_start=None, window_end=None, limit=None):
+    return [occurrence.start_dt for occurrence in islice(iter_occurrences(parsed_event, window_start, window_end), limit)]
+
+
+def test_occurrences_skip_exdates():
+    parsed = weekly(at(7, 6), exdates=(at(7, 13), at(7, 27)))
+    assert occurrence_starts(parsed, limit=4) == [at(7, 6), at(7, 20), at(8, 3), at(8, 10)]
+
+
+def test_occurrences_stop_at_until():
+    until = datetime.datetime(2026, 7, 27, 14, 59, 59, tzinfo=datetime.timezone.utc) # 7/27 23:59:59 JST
+    assert occurrence_starts(weekly(at(7, 6), until=until)) == [at(7, 6), at(7, 13), at(7, 20), at(7, 27)]
+    # 日付だけの UNTIL はその日の終わりまで
+    assert occurrence_starts(weekly(at(7, 6), until=datetime.date(2026, 7, 20))) == [at(7, 6), at(7, 13), at(7, 20)]
+
+
+def test_occurrences_stop_at_count():
+    assert occurrence_starts(weekly(at(7, 6), count=3)) == [at(7, 6), at(7, 13), at(7, 20)]
+    # 除外した回も回数に数える (RFC 5545)
+    assert occurrence_starts(weekly(at(7, 6), exdates=(at(7, 13),), count=3)) == [at(7, 6), at(7, 20)]
+
+
+def test_occurrences_clipped_to_window():
+    # 終わりのない規則でも期間内の分だけ返す
+    parsed = parse('毎月第2水曜 10時')
+    assert occurrence_starts(parsed, at(8, 1, 0), at(10, 31, 0)) == [at(8, 12), at(9, 9), at(10, 14)]
+    # 期間の端ちょうどの回も含める
+    assert occurrence_starts(parsed, at(9, 9), at(9, 9)) == [at(9, 9)]
+
+
+def test_occurrences_of_single_event():
+    parsed = parse('7/1 10:00 会議')
+    assert occurrence_starts(parsed) == [at(7, 1)]
+    assert occurrence_starts(parsed, at(7, 2)) == []
+    assert occurrence_starts(parsed, None, at(6, 30)) == []
+
+
+def test_occurrences_are_single_events():
+    occurrence = next(iter_occurrences(weekly(at(7, 6), exdates=(at(7, 13),))))
+    assert occurrence.title == '定例'
+    assert occurrence.recurrence is None and occurrence.exdates == ()
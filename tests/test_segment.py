@@ -0,0 +1,72 @@
+"""1つのテキストを複数の予定に分ける処理 (parser.segment_events / parse_events_from_text) のテスト。"""
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from autocalendar import parse_events_from_text, segment_events
+
+TOKYO = ZoneInfo('Asia/Tokyo')
+REFERENCE = datetime.datetime(2026, 6, 20, 12, 0, tzinfo=TOKYO) # 土曜日の正午
+
+
+def parse(text):
+    return parse_events_from_text(text, reference=REFERENCE)
+
+
+def at(month, day, hour, minute=0):
+    return datetime.datetime(2026, month, day, hour, minute, tzinfo=TOKYO)
+
+
+def test_request_example():
+    first, second = parse('7/1 10:00 会議、7/3 14:00 打ち合わせ@本社')
+    assert (first.start_dt, first.location, first.description) == (at(7, 1, 10), '', '7/1 10:00 会議')
+    assert (second.start_dt, second.location, second.description) == (at(7, 3, 14), '本社', '7/3 14:00 打ち合わせ@本社')
+
+
+@pytest.mark.parametrize('text', [
+    '7/1 10:00 会議、7/3 14:00 打ち合わせ',
+    '7/1 10:00 会議,7/3 14:00 打ち合わせ',
+    '7/1 10:00 会議。7/3 14:00 打ち合わせ',
+    '・7/1 10:00 会議\n・7/3 14:00 打ち合わせ\n',
+])
+def test_separators_are_not_part_of_events(text):
+    first, second = parse(text)
+    assert first.description == '7/1 10:00 会議'
+    assert second.description == '7/3 14:00 打ち合わせ'
+    assert not first.title.endswith(('、', ',', '。', '・'))
+
+
+def test_spans_cover_text():
+    text = '7/1 10:00 会議、7/3 14:00 打ち合わせ@本社'
+    # 範囲はすき間なく続き、区切り文字は前の範囲に入る (取り除くのは parse_events_from_text)
+    assert segment_events(text) == [(0, 13), (13, len(text))]
+
+
+def test_lines_with_locations():
+    events = parse('7/1 10:00 会議\n7/1 14:00 レビュー@会議室B\n7/2 9:00 朝会 @渋谷')
+    assert [(event.start_dt, event.location) for event in events] == [
+        (at(7, 1, 10), ''), (at(7, 1, 14), '会議室B'), (at(7, 2, 9), '渋谷'),
+    ]
+
+
+def test_date_and_time_without_separator_stay_together():
+    # 日付だけと時刻だけのアンカーが区切りなしで続く場合は1件
+    (event,) = parse('7/1 会議 10時から')
+    assert event.start_dt == at(7, 1, 10)
+
+
+def test_time_only_event_inherits_previous_date():
+    first, second = parse('明日 10:00 朝会、14:00 レビュー')
+    assert (first.start_dt, second.start_dt) == (at(6, 21, 10), at(6, 21, 14))
+
+
+def test_recurrence_is_its_own_event():
+    weekly, single = parse('毎週月曜 10:00 定例、7/3 14:00 面談')
+    assert weekly.recurrence.byday == ('MO',) and weekly.start_dt == at(6, 22, 10)
+    assert single.recurrence is None and single.start_dt == at(7, 3, 14)
+
+
+def test_single_event_is_not_split():
+    (event,) = parse('2026/07/03 14:00 打ち合わせ\n場所：会議室A')
+    assert (event.start_dt, event.location) == (at(7, 3, 14), '会議室A')